@@ -1,18 +1,11 @@
+import uuid
 import streamlit as st
 from streamlit_chat import message
-import google.generativeai as genai
-import datetime
+from llm_client import MODEL_NAME, async_client, client_status, get_model, warm_up
+from log_sink import log_prompt
 
-with open("keys/.gemini_key", "r") as f:
-    genai.configure(api_key=f.read().strip())
-
-model = genai.GenerativeModel("gemini-1.5-flash")
-visual_model = genai.GenerativeModel("gemini-1.5-flash")
-
-def run_model(prompt: str) :
-    print("#########################################################################")
-    print(f"{datetime.datetime.now()} ----- Agent is running the prompt {prompt}")
-    return model.generate_content(prompt)
+# 🔑 Configure Gemini in the background; the page renders even without a key
+warm_up()
 
 cvf = f""" 
 The Client Value Framework is how we sell, shape and talk about our deals. 
@@ -46,6 +39,18 @@ The first 5 steps for Client Value Framework focusses on -
 • Not just a corporate commitment, a personal commitment on the part of the DLT to the project's success.
 Please align your storyline with our Client Value Framework. Please tabutate the response for each slides."""
 
+# 📌 The framework is static: it travels once as the system instruction (cached content when large
+# enough), so each call only sends the RFP or the feedback and the current storyline
+STRATEGIST_INSTRUCTION = f"""Act as a strategist preparing an RFP response. Keep in mind the {cvf}"""
+
+def run_model(prompt: str, use_cache: bool = True) -> str:
+    log_prompt("proposal.run_model", prompt)
+    # Through the shared async client, so storyline calls share the app's concurrency limits
+    session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+    return async_client.run(async_client.generate_text(get_model(MODEL_NAME, STRATEGIST_INSTRUCTION), prompt,
+                                                       session_id=session_id, use_cache=use_cache,
+                                                       agent="Proposal", phase="storyline"))
+
 # Session state setup
 if "storyline" not in st.session_state:
     st.session_state.storyline = ""
@@ -57,6 +62,8 @@ if "editing" not in st.session_state:
 
 st.set_page_config(page_title="🤖 Agentic SDLC Assistant", layout="wide")
 st.title("📽️ RFP Storyline Chatbot")
+if client_status()["state"] == "error":
+    st.error(f"🔑 Gemini client unavailable: {client_status()['error']}")
 
 itr = 0
 # Step 1: Initial RFP prompt
@@ -64,12 +71,10 @@ if st.session_state.storyline == "":
     rfp_input = st.text_area("Paste the RFP prompt from the customer:")
     if st.button("Generate Initial Storyline") and rfp_input:
         prompt = f"""
-        Act as a strategist preparing an RFP response. Keep in mind the {cvf}
         Create a slide-by-slide storyline based on: "{rfp_input}"
         Return clear slide titles with slide content in details in a tabular format. """
         with st.spinner(f"Agent is preparing initial story line"):
-            response = run_model(prompt=prompt)
-            st.session_state.storyline = response.text
+            st.session_state.storyline = run_model(prompt=prompt)
             # Save chat
             st.session_state.chat_history.append({"user": rfp_input, "ai": st.session_state.storyline})
             st.session_state.editing = True
@@ -85,8 +90,7 @@ if st.session_state.storyline and st.session_state.editing:
         Modify or expand based on this user feedback: "{user_feedback}"
         Return the updated storyline in full. Please tabutate the response for each slides."""
         with st.spinner(f"Agent is updating story line"):
-            response = model.generate_content(chat_prompt)
-            updated_storyline = response.text
+            updated_storyline = run_model(prompt=chat_prompt)
             st.session_state.editing = True
             # Save chat
             st.session_state.chat_history.append({"user": user_feedback, "ai": updated_storyline})
@@ -1,6 +1,15 @@
+import os
+import uuid
 import streamlit as st
 from orchestrator import *
 from export_utils import *
+from pipeline import (AGENT_DEPENDENCIES, AGENTS, cancel_prewarm, collect_artifacts, generate_outputs,
+                      prewarm_opening_questions, start_artifact, take_prewarmed, upstream_context)
+from metrics import start_metrics_server
+from llm_client import client_status, warm_up
+from report_bundle import BUNDLE_NAME, build_report_bundle, bundle_path
+from export_store import default_exports
+from workflow_store import QUERY_PARAM, append_history, hydrate, persist
 
 st.set_page_config(page_title="🤖 Agentic SDLC Assistant", layout="wide")
 st.markdown("<h1 style='margin-top: 10px;'>🤖 Agentic SDLC Assistant </h1>", unsafe_allow_html=True)
@@ -53,10 +62,29 @@ with st.expander("### 🧠 Overview", expanded=False):
         """
     )
 
-AGENTS = ["Analyst", "Designer", "Estimator", "Coder", "Reviewer", "Tester", "Deployer"]
 AGENT_EMOJIS = {"Analyst": "📋", "Designer": "🧱", "Estimator": "🧮",
     "Coder": "💻", "Reviewer": "👓", "Tester": "🧪", "Deployer": "🚀"}
 
+# 📈 Prometheus endpoint for per-call metrics and /ready (idempotent across reruns)
+start_metrics_server()
+
+# 🔑 Import/configure Gemini in the background; without a key the page still renders
+warm_up()
+if client_status()["state"] == "error":
+    st.error(f"🔑 Gemini client unavailable: {client_status()['error']}")
+
+if "session_id" not in st.session_state:
+    st.session_state["session_id"] = uuid.uuid4().hex
+
+# 💾 Bind the session to a durable workflow (?wf=<id>); any replica can resume it from the URL
+workflow_id = hydrate(st.session_state, st.query_params.get(QUERY_PARAM))
+if st.query_params.get(QUERY_PARAM) != workflow_id:
+    st.query_params[QUERY_PARAM] = workflow_id
+
+# 🔮 Opt-in: precompute the next clarification question for "yes" and "no" answers
+st.sidebar.toggle("🔮 Speculative next question", key="speculative_mode",
+                  help="Prepares the follow-up to a yes/no answer while you read. Uses extra model calls.")
+
 if "workflow_index" not in st.session_state:
     st.session_state["workflow_index"] = 0
 current_index = st.session_state["workflow_index"]
@@ -98,6 +126,38 @@ for i, agent in enumerate(AGENTS):
 #st.sidebar.markdown(f"---")
 #st.sidebar.markdown(f"Agent in action: {AGENT_EMOJIS[active_agent]} {active_agent}")
 
+# 📝 Clarification mode per agent, fixed once that agent's Q&A has started
+with st.sidebar.expander("📝 Clarification mode", expanded=False):
+    for agent in AGENTS:
+        choice_key = f"{agent}_qa_mode_choice"
+        if choice_key not in st.session_state:
+            st.session_state[choice_key] = qa_mode(agent, st.session_state)
+        # A mode change drops (or starts) that agent's background opening question right away
+        st.selectbox(f"{AGENT_EMOJIS[agent]} {agent.title()}", list(QA_MODES), format_func=QA_MODES.get,
+                     key=choice_key, disabled=bool(st.session_state.get(f"{agent}_spec")),
+                     on_change=prewarm_opening_questions, args=(st.session_state,))
+
+
+def start_clarification(agent_name: str, context_inputs: dict):
+    """Open the agent's Q&A in its clarification mode: the first question, or the whole questionnaire."""
+    mode = qa_mode(agent_name, st.session_state)
+    persist(st.session_state, f"{agent_name}_qa_mode", mode)
+    count_qa_call(agent_name, st.session_state)
+    if mode == "questionnaire":
+        cancel_prewarm(agent_name, st.session_state)
+        questions = get_agent_questions(agent_name, st.session_state[f"{agent_name}_spec"],
+                                        session_id=st.session_state["session_id"], **context_inputs)
+        persist(st.session_state, f"{agent_name}_questions", questions)
+        persist(st.session_state, f"{agent_name}_qa_round", 1)
+        if not questions:
+            append_history(st.session_state, agent_name, "ai", SATISFIED)
+        return
+    # ♨️ Usually already computed in the background when the upstream output landed
+    next_msg = take_prewarmed(agent_name, st.session_state, context_inputs)
+    if next_msg is None:
+        next_msg = run_sync(reason_with_agent_async(agent_name, snapshot_state(agent_name, st.session_state), **context_inputs))
+    append_history(st.session_state, agent_name, "ai", next_msg)
+
 
 def run_agent(agent_name: str, context_inputs=None):
     """
@@ -113,7 +173,8 @@ def run_agent(agent_name: str, context_inputs=None):
     Workflow Stages:
     ----------------
     1. Accepts user spec input if not yet provided.
-    2. Asks agent-specific clarification questions one at a time.
+    2. Asks agent-specific clarification questions one at a time, or (questionnaire
+       mode) all at once in a form followed by at most one round of followups.
     3. Collects user responses and stores them in session state.
     4. Displays prompt suggestion multiselect once all questions are answered.
     5. Synthesizes final output via `generate_agent_output()` using:
@@ -127,12 +188,20 @@ def run_agent(agent_name: str, context_inputs=None):
     Session State Keys Used:
     ------------------------
     - f"{agent}_spec" → Initial spec provided by user
-    - f"{agent}_questions" → List of clarification questions
+    - f"{agent}_qa_mode" → "conversational" or "questionnaire", fixed when the Q&A starts
+    - f"{agent}_questions" → Questions of the current questionnaire form
+    - f"{agent}_qa_round" → 1 for the questionnaire, 2 for its followups
     - f"{agent}_responses" → Dict of Q&A responses
     - f"{agent}_user_feedback" → Prompt suggestions
     - f"{agent}_output" → Final generated agent output
+    - f"{agent}_artifact" → Compact JSON summary of the output, read by downstream agents
+    - f"{agent}_artifact_job" → Background extraction of that summary, until a rerun stores it
+    - f"{agent}_template" → Fingerprint of the prompt templates the output was generated with
     - f"{agent}_history" → All chat messages (agent + user)
     - f"{agent}_question_index" → Tracks which question is being asked
+    - f"{agent}_qa_state" → [N]/[C] question budget, counted locally from the history
+    - f"{agent}_speculation" → Precomputed next questions for "yes"/"no" (speculative mode)
+    - f"{agent}_prewarm" → Opening question computed in the background once upstream outputs landed
     """
     key = agent_name
     history_key = f"{key}_history"
@@ -171,22 +240,18 @@ def run_agent(agent_name: str, context_inputs=None):
                 st.markdown('<span id="pkr"></span>', unsafe_allow_html=True)
                 if st.button("➡️ Continue", key="{key}_continue"):
                     with st.spinner(f"{AGENT_EMOJIS[key]} {key} Agent is thinking of clarification questions ..."):
-                        st.session_state[f"{key}_spec"] = spec
-                        st.session_state[history_key].append({"role": "user", "content": spec})
-                        
-                        next_msg = reason_with_agent(agent_name, st.session_state, **context_inputs)
-                        st.session_state[history_key].append({"role": "ai", "content": next_msg})
+                        persist(st.session_state, f"{key}_spec", spec)
+                        append_history(st.session_state, key, "user", spec)
+                        start_clarification(agent_name, context_inputs)
                         st.rerun()
             return
         else: 
-            spec = f"Generate {key} agent output based on the following questionnaire"
+            spec = opening_spec(key)
             if spec.strip():
                 with st.spinner(f"{AGENT_EMOJIS[key]} {key} Agent is thinking of clarification questions ..."):
-                    st.session_state[f"{key}_spec"] = spec
+                    persist(st.session_state, f"{key}_spec", spec)
                     #st.session_state[history_key].append({"role": "user", "content": spec})
-
-                    next_msg = reason_with_agent(agent_name, st.session_state, **context_inputs)
-                    st.session_state[history_key].append({"role": "ai", "content": next_msg})
+                    start_clarification(agent_name, context_inputs)
                     st.rerun()
             return
 
@@ -215,17 +280,54 @@ def run_agent(agent_name: str, context_inputs=None):
     
     # Agent decides next step
     last_agent_msg = next((msg for msg in reversed(st.session_state[history_key]) if msg["role"] == "ai"), None)
-    if (last_agent_msg["content"] if last_agent_msg else "").strip().startswith("I AM SATISFIED"):
-        st.session_state[qa_done] = True
+    if is_satisfied(last_agent_msg["content"] if last_agent_msg else ""):
+        persist(st.session_state, qa_done, True)
+        finish_qa(key, st.session_state, qa_mode(key, st.session_state))
+
+    # 📝 Questionnaire mode: the whole question set in one form, then at most one round of followups
+    if qa_mode(key, st.session_state) == "questionnaire" and not st.session_state[qa_done]:
+        questions = st.session_state[f"{key}_questions"] or []
+        qa_round = st.session_state.get(f"{key}_qa_round", 1)
+        with st.form(f"{key}_questionnaire_{qa_round}"):
+            st.markdown("#### 📝 Clarification questions" if qa_round == 1 else "#### 🔍 Followup questions")
+            answers = [st.text_input(question, key=f"{key}_answer_{qa_round}_{i}") for i, question in enumerate(questions)]
+            submitted = st.form_submit_button("➡️ Submit answers")
+        if submitted:
+            responses = dict(st.session_state[f"{key}_responses"] or {})
+            for question, answer in zip(questions, answers):
+                append_history(st.session_state, key, "ai", question)
+                append_history(st.session_state, key, "user", answer.strip() or "(no answer)")
+                responses[question] = answer.strip()
+            persist(st.session_state, f"{key}_responses", responses)
+            followups = []
+            if qa_round == 1:
+                with st.spinner(f"{AGENT_EMOJIS[key]} {key} Agent is reviewing your answers ..."):
+                    count_qa_call(key, st.session_state)
+                    followups = evaluate_questionnaire(agent_name, st.session_state, questions, answers, **context_inputs)
+            if followups:
+                persist(st.session_state, f"{key}_questions", followups)
+                persist(st.session_state, f"{key}_qa_round", 2)
+            else:
+                append_history(st.session_state, key, "ai", SATISFIED)
+            st.rerun()
+        return
 
     if not st.session_state[qa_done]:
     # Show input for user reply
         ans = st.chat_input("Your response")
         if ans:
-            st.session_state[history_key].append({"role": "user", "content": ans})
-            next_msg = reason_with_agent(agent_name, st.session_state, **context_inputs)
-            st.session_state[history_key].append({"role": "ai", "content": next_msg})
+            append_history(st.session_state, key, "user", ans)
+            count_qa_call(key, st.session_state)
+            # 🔮 A "yes"/"no" answer may already have its next question precomputed
+            next_msg = take_speculation(agent_name, st.session_state, ans)
+            if next_msg is None:
+                next_msg = run_sync(reason_with_agent_async(agent_name, snapshot_state(agent_name, st.session_state), **context_inputs))
+            append_history(st.session_state, key, "ai", next_msg)
             st.rerun()
+        elif st.session_state.get("speculative_mode") and last_agent_msg \
+                and st.session_state.get(f"{key}_speculation", {}).get("after") != len(st.session_state[history_key]):
+            # While the user reads the question, compute the next one for both likely answers
+            speculate_replies(agent_name, st.session_state, **context_inputs)
 
     if st.session_state[qa_done]:
         # 🌺 Prompt suggestions after Q&A
@@ -245,8 +347,8 @@ def run_agent(agent_name: str, context_inputs=None):
             if feedback.strip():
                 st.markdown('<span id="pkr"></span>', unsafe_allow_html=True)
                 if st.button("➡️ Continue", key="{key}_feedback_continue"):
-                    st.session_state[f"{key}_user_feedback"] = feedback
-                    st.session_state[history_key].append({"role": "user", "content": f"User feedback:\n{feedback}"})
+                    persist(st.session_state, f"{key}_user_feedback", feedback)
+                    append_history(st.session_state, key, "user", f"User feedback:\n{feedback}")
                     st.rerun()
                 return
             
@@ -254,18 +356,27 @@ def run_agent(agent_name: str, context_inputs=None):
         # 🌻 Generate final output
         st.markdown('<span id="mkr"></span>', unsafe_allow_html=True)
         if not st.session_state[f"{key}_output"] and st.button(f"🚀 Generate {agent_name.title()} Output"):
-            with st.spinner(f"{AGENT_EMOJIS[key]} {key} Agent is running ..."):
-                output = generate_agent_output(agent_name, st.session_state, **context_inputs)["text"]
-                st.session_state[f"{key}_output"] = output
-                export_agent_output(f"{key}", output)
-                st.session_state[history_key].append({"role": "ai", "content": output})
+            # Render chunks as they arrive; export only once the stream has completed
+            with st.chat_message("ai"):
+                st.caption(f"{AGENT_EMOJIS[key]} {key} Agent is running ...")
+                streamed = st.write_stream(stream_agent_output(agent_name, st.session_state, **context_inputs))
+            output = (streamed if isinstance(streamed, str) else "".join(map(str, streamed))).strip()
+            persist(st.session_state, f"{key}_template", output_template(agent_name))
+            persist(st.session_state, f"{key}_output", output)
+            default_exports.put(workflow_id, key, output, template=st.session_state[f"{key}_template"])
+            append_history(st.session_state, key, "ai", output)
+            agent_report_block(key, st.session_state[history_key], output)  # 🧾 this agent's report section, built once
+            # 🧾 Compact structured artifact that downstream agents read instead of the Markdown, in the background
+            start_artifact(key, output, st.session_state)
+            # ♨️ Downstream agents' inputs are final now; start their opening questions
+            prewarm_opening_questions(st.session_state)
 
         # 🌟 Display output + export
         if st.session_state[f"{key}_output"]:
             with st.expander("View agent Output", expanded=False):
                 #st.markdown(render_message(st.session_state[f"{key}_output"], "agent"), unsafe_allow_html=True)
-                with open(f"exports/{key}_agent_out.html", "r", encoding="utf-8") as f:
-                    html_content = f.read()
+                # Served from the in-process LRU; re-exported if this host has no copy yet
+                html_content = default_exports.html(workflow_id, key, st.session_state[f"{key}_output"])
                 # Prefer st.html if available, else fallback
                 st.html(html_content)
                 st.download_button(label="📥 Download", data=html_content, 
@@ -280,25 +391,17 @@ def run_agent(agent_name: str, context_inputs=None):
             #        st.error("Could not create diagram")
 
 # Context passing logic
+def store_artifacts(agents=AGENTS, wait=False) -> dict:
+    # Background artifacts are persisted here, on the script thread
+    collected = collect_artifacts(st.session_state, agents, wait=wait)
+    for agent, artifact in collected.items():
+        persist(st.session_state, f"{agent}_artifact", artifact)
+    return collected
+
 def get_context(agent):
-    ctx = {}
-    if agent == "Designer":
-        ctx["Analyst_output"] = st.session_state["Analyst_output"]
-    elif agent == "Estimator":
-        ctx["Designer_output"] = st.session_state["Designer_output"]
-        ctx["Analyst_output"] = st.session_state["Analyst_output"]
-    elif agent == "Coder":
-        ctx["Designer_output"] = st.session_state["Designer_output"]
-        ctx["Analyst_output"] = st.session_state["Analyst_output"]
-    elif agent == "Reviewer":
-        ctx["Coder_output"] = st.session_state["Coder_output"]
-    elif agent == "Tester":
-        ctx["Designer_output"] = st.session_state["Designer_output"]
-        ctx["Analyst_output"] = st.session_state["Analyst_output"]
-    elif agent == "Deployer":
-        for upstream in AGENTS[:-1]:
-            ctx[f"{upstream}_output"] = st.session_state[f"{upstream}_output"]
-    return ctx
+    # Dependencies live in pipeline.AGENT_DEPENDENCIES so the DAG scheduler uses the same map
+    store_artifacts(AGENT_DEPENDENCIES[agent], wait=True)
+    return upstream_context(agent, st.session_state)
 
 
 
@@ -306,14 +409,21 @@ def get_context(agent):
 # #####################
 # START OF EXECUTION for agents
 # #####################
-# 📘 Show all completed agents' conversation history as expanders
+# 📘 Show all completed agents' conversation history
+# (rendered only while toggled open, one cached HTML page at a time)
 for i in range(current_index):
     agent = AGENTS[i]
     history = st.session_state.get(f"{agent}_history", [])
-    with st.expander(f"🕘 Conversation with `{agent.title()}` Agent (Completed)", expanded=False):
-        for msg in history:
-            with st.chat_message(msg["role"]):
-                st.markdown(render_messag(msg["content"], msg["role"], agent), unsafe_allow_html=True)
+    if st.toggle(f"🕘 Conversation with `{agent.title()}` Agent (Completed)", key=f"{agent}_show_history"):
+        with st.container(border=True):
+            pages = history_pages(len(history))
+            page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages,
+                                   key=f"{agent}_history_page") - 1 if pages > 1 else 0
+            st.markdown(render_history_html(agent, history, page), unsafe_allow_html=True)
+
+# 🧾 Hand-off artifacts that landed since the last rerun unblock their downstream agents' pre-warm
+if store_artifacts():
+    prewarm_opening_questions(st.session_state)
 
 # 🧠 Run current agent
 context_inputs = get_context(active_agent)
@@ -324,17 +434,57 @@ run_agent(active_agent, context_inputs)
 if st.session_state.get(f"{active_agent}_output") and current_index < len(AGENTS) - 1:
     st.markdown('<span id="pkr"></span>', unsafe_allow_html=True)
     if st.button("➡️ Proceed to Next Agent"):
-        st.session_state["workflow_index"] += 1
+        persist(st.session_state, "workflow_index", current_index + 1)
+        st.rerun()
+
+# ⚡ Fan out the remaining agents once the design is in: Estimator/Coder/Tester run together,
+# Reviewer starts when Coder lands and Deployer when everything else has.
+remaining = [agent for agent in AGENTS if not st.session_state.get(f"{agent}_output")]
+if st.session_state.get("Designer_output") and len(remaining) > 1:
+    if st.sidebar.button("⚡ Auto-run remaining agents in parallel"):
+        store_artifacts(wait=True)
+        state = {"session_id": st.session_state["session_id"]}
+        for agent in AGENTS:
+            state[f"{agent}_output"] = st.session_state.get(f"{agent}_output", "")
+            state[f"{agent}_artifact"] = st.session_state.get(f"{agent}_artifact", "")
+            state[f"{agent}_history"] = list(st.session_state.get(f"{agent}_history", []))
+        with st.spinner(f"Running {', '.join(remaining)} agents in parallel ..."):
+            outputs = run_sync(generate_outputs(state, remaining))
+        for agent, output in outputs.items():
+            persist(st.session_state, f"{agent}_spec", st.session_state.get(f"{agent}_spec") or opening_spec(agent))
+            persist(st.session_state, f"{agent}_qa_done", True)
+            persist(st.session_state, f"{agent}_user_feedback", st.session_state.get(f"{agent}_user_feedback") or "Auto-run")
+            persist(st.session_state, f"{agent}_artifact", state.get(f"{agent}_artifact", ""))
+            persist(st.session_state, f"{agent}_template", state.get(f"{agent}_template", ""))
+            persist(st.session_state, f"{agent}_output", output)
+            append_history(st.session_state, agent, "ai", output)
+            default_exports.put(workflow_id, agent, output, template=state.get(f"{agent}_template", ""))
+        persist(st.session_state, "workflow_index", len(AGENTS) - 1)
         st.rerun()
 
 if all(st.session_state.get(f"{agent}_output") for agent in AGENTS):
-    full_html = export_all_agents_html(AGENTS, st.session_state)
-    st.download_button(
-        label="📥 Download Full Agent Studio Report",
-        data=full_html,
-        file_name="multi_agent_studio.html",
-        mime="text/html"
-    )
+    # 🧾 Written only on request, section by section into a ZIP, and served from that file.
+    # The file is handed to Streamlit (which reads it into memory) only on the rerun after the
+    # user asked for it, not on every rerun once the bundle exists.
+    report_path = bundle_path(workflow_id, AGENTS, st.session_state)
+    if not os.path.exists(report_path):
+        if st.button("🧾 Prepare Full Agent Studio Report"):
+            with st.spinner("Writing the report bundle ..."):
+                build_report_bundle(workflow_id, AGENTS, st.session_state)
+            st.session_state["report_download_armed"] = True
+            st.rerun()
+    elif st.session_state.get("report_download_armed"):
+        with open(report_path, "rb") as report_file:
+            st.download_button(
+                label="📥 Download Full Agent Studio Report (HTML, Markdown, JSON)",
+                data=report_file,
+                file_name=BUNDLE_NAME,
+                mime="application/zip",
+                on_click=lambda: st.session_state.pop("report_download_armed", None)
+            )
+    elif st.button("🧾 Get Full Agent Studio Report"):
+        st.session_state["report_download_armed"] = True
+        st.rerun()
 # #####################
 # END OF EXECUTION
 # #####################
\ No newline at end of file
@@ -0,0 +1,171 @@
+"""
+Headless batch runner: drive the full SDLC agent pipeline for every spec in a JSONL file.
+
+Each input line is a JSON object:
+    {"id": "ITEM-1", "spec": "Build a ...",
+     "answers": {"Analyst": ["Yes", "No, weekly"], ...},    # optional, consumed in order
+     "feedback": {"Designer": "Favor serverless ..."}}       # optional
+
+Clarification questions without a supplied answer are auto-accepted with --default-answer.
+Results go to <out>/<id>/ using the same file layout as `export_agent_output`, plus a
+state.json checkpoint written after every agent. <out>/progress.jsonl records finished
+items, so re-running the same command resumes where a crash left off.
+
+Usage:
+    python batch_runner.py specs.jsonl --out batch_exports --workers 4
+"""
+import argparse
+import asyncio
+import datetime
+import hashlib
+import json
+import os
+from export_utils import export_agent_output
+from orchestrator import generate_agent_output_async, is_satisfied, opening_spec, reason_with_agent_async
+from pipeline import AGENTS, artifact_or_fallback, run_dag, upstream_context
+
+DEFAULT_ANSWER = "Yes, that assumption is correct."
+MAX_TURNS = 9  # 3 new questions [N] with up to 2 follow-ups [C] each
+
+
+def load_items(path: str) -> list:
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            item.setdefault("id", item.get("request_id") or hashlib.sha1(item["spec"].encode("utf-8")).hexdigest()[:12])
+            item["id"] = str(item["id"])
+            items.append(item)
+    return items
+
+
+def load_progress(out_dir: str) -> set:
+    path = os.path.join(out_dir, "progress.jsonl")
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return {record["id"] for record in records if record.get("status") == "done"}
+
+
+def record_progress(out_dir: str, item_id: str, status: str, error: str = ""):
+    with open(os.path.join(out_dir, "progress.jsonl"), "a", encoding="utf-8") as f:
+        f.write(json.dumps({"id": item_id, "status": status, "error": error,
+                            "finished": datetime.datetime.now().isoformat()}) + "\n")
+        f.flush()
+
+
+def load_checkpoint(item_dir: str) -> dict:
+    path = os.path.join(item_dir, "state.json")
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def save_checkpoint(item_dir: str, state: dict):
+    path = os.path.join(item_dir, "state.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+async def run_item(item: dict, out_dir: str, default_answer: str = DEFAULT_ANSWER,
+                   max_turns: int = MAX_TURNS, use_cache: bool = True) -> dict:
+    """Run every agent for one spec, skipping agents already checkpointed in state.json."""
+    item_dir = os.path.join(out_dir, item["id"])
+    os.makedirs(item_dir, exist_ok=True)
+    state = load_checkpoint(item_dir)
+    state["session_id"] = item["id"]
+    answers = item.get("answers", {})
+    feedback = item.get("feedback", {})
+
+    async def run_one(agent):
+        spec = item["spec"] if agent == "Analyst" else opening_spec(agent)
+        history = [{"role": "user", "content": spec}] if agent == "Analyst" else []
+        agent_state = {"session_id": state["session_id"], f"{agent}_spec": spec, f"{agent}_history": history}
+        context_inputs = upstream_context(agent, state)
+        pending_answers = list(answers.get(agent, []))
+
+        # 🌿 Non-interactive Q&A: scripted answers first, then auto-accept
+        for _ in range(max_turns):
+            question = await reason_with_agent_async(agent, agent_state, use_cache=use_cache, **context_inputs)
+            history.append({"role": "ai", "content": question})
+            if is_satisfied(question):
+                break
+            history.append({"role": "user", "content": pending_answers.pop(0) if pending_answers else default_answer})
+
+        if feedback.get(agent):
+            history.append({"role": "user", "content": f"User feedback:\n{feedback[agent]}"})
+
+        result = await generate_agent_output_async(agent, agent_state, use_cache=use_cache, **context_inputs)
+        output = result["text"]
+        history.append({"role": "ai", "content": output})
+        export_agent_output(agent, output, folder=item_dir)
+
+        state[f"{agent}_spec"] = spec
+        state[f"{agent}_history"] = history
+        state[f"{agent}_output"] = output
+        state[f"{agent}_template"] = result["template"]
+        state[f"{agent}_artifact"] = await artifact_or_fallback(agent, output, state["session_id"], use_cache=use_cache)
+        save_checkpoint(item_dir, state)
+        print(f"{datetime.datetime.now()} ----- [{item['id']}] {agent} agent done.")
+        return output
+
+    pending = [agent for agent in AGENTS if not state.get(f"{agent}_output")]
+    await run_dag(pending, run_one)
+    return state
+
+
+async def run_batch(items: list, out_dir: str, workers: int = 2, **run_kwargs) -> dict:
+    """Process `items` with a pool of `workers`, skipping those already recorded as done."""
+    os.makedirs(out_dir, exist_ok=True)
+    done = load_progress(out_dir)
+    queue = asyncio.Queue()
+    for item in items:
+        if item["id"] not in done:
+            queue.put_nowait(item)
+    print(f"{datetime.datetime.now()} ----- {len(items) - queue.qsize()} item(s) already done, {queue.qsize()} to go.")
+    summary = {"done": len(items) - queue.qsize(), "failed": 0}
+
+    async def worker():
+        while True:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                await run_item(item, out_dir, **run_kwargs)
+                record_progress(out_dir, item["id"], "done")
+                summary["done"] += 1
+            except Exception as e:
+                # Leave the checkpoint in place so the next run resumes this item mid-pipeline
+                record_progress(out_dir, item["id"], "failed", repr(e))
+                summary["failed"] += 1
+                print(f"{datetime.datetime.now()} ----- [{item['id']}] failed: {e!r}")
+
+    await asyncio.gather(*(worker() for _ in range(max(1, workers))))
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the SDLC agent pipeline for a JSONL file of specs.")
+    parser.add_argument("specs", help="JSONL file with one spec per line")
+    parser.add_argument("--out", default="batch_exports", help="output folder (default: batch_exports)")
+    parser.add_argument("--workers", type=int, default=2, help="specs processed in parallel (default: 2)")
+    parser.add_argument("--max-turns", type=int, default=MAX_TURNS, help="max clarification questions per agent")
+    parser.add_argument("--default-answer", default=DEFAULT_ANSWER, help="answer used when none is supplied")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the prompt/response cache")
+    args = parser.parse_args(argv)
+
+    summary = asyncio.run(run_batch(load_items(args.specs), args.out, workers=args.workers,
+                                    default_answer=args.default_answer, max_turns=args.max_turns,
+                                    use_cache=not args.no_cache))
+    print(f"{datetime.datetime.now()} ----- Batch finished: {summary}")
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,107 @@
+import copy
+import os
+from llm_client import estimate_tokens
+
+TOKEN_BUDGET = int(os.environ.get("CONVERSATION_TOKEN_BUDGET", "6000"))
+START_TURN = "Please start with your first question."
+
+SUMMARY_PROMPT = """Summarize the earlier part of a clarification conversation between a user and an SDLC agent.
+Keep every question the agent asked together with its [N]/[C] marker and the user's answer, and every decision or constraint the user stated.
+Be compact; do not add anything that was not said.
+
+Summary so far:
+{summary}
+
+Conversation to fold in:
+{transcript}"""
+
+
+class AgentConversation:
+    """
+    Multi-turn Gemini conversation for one agent.
+
+    The static persona, spec, rules and upstream context travel once as the model's
+    system instruction; `turns` only grows by the new user/agent messages taken from
+    `{agent}_history`. Turns beyond `token_budget` are folded into `summary`, which is
+    sent as the opening user turn in their place.
+    """
+
+    def __init__(self, agent_name: str, token_budget: int = TOKEN_BUDGET):
+        self.agent_name = agent_name
+        self.token_budget = token_budget
+        self.system_instruction = None
+        self.turns = []
+        self.summary = ""
+        self.consumed = 0  # how many history messages are already in `turns` (or folded into `summary`)
+
+    def prepare(self, system_instruction: str):
+        """Start over if the static part of the conversation changed (e.g. a new spec)."""
+        if system_instruction != self.system_instruction:
+            self.system_instruction = system_instruction
+            self.reset()
+
+    def reset(self):
+        self.turns, self.summary, self.consumed = [], "", 0
+
+    def sync(self, history: list):
+        """Append only the history messages that are not part of the conversation yet."""
+        if self.consumed > len(history):
+            # History was rewound/replaced; rebuild from scratch
+            self.reset()
+        for msg in history[self.consumed:]:
+            self._append("user" if msg["role"] == "user" else "model", msg["content"])
+        self.consumed = len(history)
+
+    def record_reply(self, text: str):
+        """Keep the model reply; the caller stores the same reply in `{agent}_history`."""
+        if not self.turns:
+            self._append("user", START_TURN)
+        self._append("model", text)
+        self.consumed += 1
+
+    def contents(self, user_turn: str = None) -> list:
+        """Gemini `contents` for the next call, always ending on a user turn."""
+        contents = []
+        if self.summary:
+            contents.append({"role": "user", "parts": [f"Summary of the earlier conversation:\n{self.summary}"]})
+        for turn in self.turns:
+            self._merge(contents, turn["role"], turn["parts"][0])
+        if user_turn:
+            self._merge(contents, "user", user_turn)
+        if not contents or contents[-1]["role"] != "user":
+            self._merge(contents, "user", START_TURN if not contents else "Please continue.")
+        return contents
+
+    def overflow(self) -> list:
+        """Oldest turns that must be folded into the summary to get back under the token budget."""
+        total = estimate_tokens(self.turns) + estimate_tokens(self.summary)
+        fold = 0
+        # Always keep the latest exchange verbatim
+        while total > self.token_budget and fold < len(self.turns) - 2:
+            total -= estimate_tokens(self.turns[fold])
+            fold += 1
+        return self.turns[:fold]
+
+    def summary_prompt(self, old_turns: list) -> str:
+        transcript = "\n".join(
+            f"{'User' if t['role'] == 'user' else self.agent_name + ' Agent'}: {t['parts'][0]}" for t in old_turns)
+        return SUMMARY_PROMPT.format(summary=self.summary or "(none)", transcript=transcript)
+
+    def fold(self, summary: str, count: int):
+        self.summary = summary.strip()
+        self.turns = self.turns[count:]
+
+    def fork(self) -> "AgentConversation":
+        """Independent copy, e.g. for speculative or background calls that may be discarded."""
+        return copy.deepcopy(self)
+
+    def _append(self, role: str, text: str):
+        self._merge(self.turns, role, text)
+
+    @staticmethod
+    def _merge(turns: list, role: str, text: str):
+        # Gemini expects alternating roles, so consecutive messages from one side are joined
+        if turns and turns[-1]["role"] == role:
+            turns[-1] = {"role": role, "parts": [f"{turns[-1]['parts'][0]}\n\n{text}"]}
+        else:
+            turns.append({"role": role, "parts": [text]})
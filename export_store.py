@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from export_utils import render_agent_html, to_markdown
+from log_sink import log_event
+
+EXPORT_ROOT = os.environ.get("EXPORT_ROOT", "exports")
+RETENTION_DAYS = float(os.environ.get("EXPORT_RETENTION_DAYS", "7"))
+MAX_WORKFLOWS = int(os.environ.get("EXPORT_MAX_WORKFLOWS", "500"))
+HTML_CACHE_SIZE = int(os.environ.get("EXPORT_HTML_CACHE_SIZE", "128"))
+EVICT_INTERVAL = 600  # seconds between retention sweeps
+
+
+class ExportStore:
+    """
+    Agent exports stored per workflow under `<root>/<workflow_id>/`, with file names
+    carrying the content hash (`designer_3fa2c1d09b7e.html`), so concurrent users never
+    share a path and unchanged content is never rewritten. `manifest.json` maps each
+    agent to its current files; rendered HTML is kept in an in-process LRU keyed by
+    hash, so reruns that display an export do not touch the disk.
+
+    Workflows untouched for `retention_days`, and the oldest beyond `max_workflows`,
+    are deleted by a sweep that runs at most every EVICT_INTERVAL seconds.
+    """
+
+    def __init__(self, root: str = EXPORT_ROOT, retention_days: float = RETENTION_DAYS,
+                 max_workflows: int = MAX_WORKFLOWS, cache_size: int = HTML_CACHE_SIZE):
+        self.root = root
+        self.retention_seconds = retention_days * 86400
+        self.max_workflows = max_workflows
+        self.cache_size = cache_size
+        self._html = OrderedDict()
+        self._manifests = {}
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def _dir(self, workflow_id: str) -> str:
+        """The workflow's folder; IDs that would resolve anywhere but directly under `root` are rejected."""
+        root = os.path.realpath(self.root)
+        if not workflow_id or os.path.dirname(os.path.realpath(os.path.join(root, workflow_id))) != root:
+            raise ValueError(f"Invalid workflow ID for exports: {workflow_id!r}")
+        return os.path.join(self.root, workflow_id)
+
+    def manifest(self, workflow_id: str) -> dict:
+        with self._lock:
+            if workflow_id not in self._manifests:
+                path = os.path.join(self._dir(workflow_id), "manifest.json")
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        self._manifests[workflow_id] = json.load(f)
+                except (OSError, ValueError):
+                    self._manifests[workflow_id] = {}
+            return self._manifests[workflow_id]
+
+    def put(self, workflow_id: str, name: str, content: str, template: str = "") -> dict:
+        """
+        Store an agent's output (as .md and .html) and return its manifest entry, which also
+        records the prompt template fingerprint the output was generated with.
+        """
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        manifest = self.manifest(workflow_id)
+        entry = manifest.get(name)
+        if entry and entry["sha256"] == digest and (not template or entry.get("template") == template):
+            return entry
+
+        folder = self._dir(workflow_id)
+        os.makedirs(folder, exist_ok=True)
+        base_name = f"{name.lower().replace(' ', '_')}_{digest[:12]}"
+        html_text = render_agent_html(name, content)
+        files = {"md": f"{base_name}.md", "html": f"{base_name}.html"}
+        for kind, text in (("md", to_markdown(name, content)), ("html", html_text)):
+            path = os.path.join(folder, files[kind])
+            if not os.path.exists(path):
+                _write_atomic(path, text)
+        self._remember(digest, html_text)
+
+        new_entry = {"sha256": digest, **files, "template": template or (entry or {}).get("template", ""),
+                     "updated": time.time()}
+        with self._lock:
+            manifest[name] = new_entry
+            _write_atomic(os.path.join(folder, "manifest.json"), json.dumps(manifest, indent=2))
+        if entry:
+            self._remove_unreferenced(folder, manifest, entry)
+        self.evict()
+        return new_entry
+
+    def html(self, workflow_id: str, name: str, content: str = None):
+        """
+        Rendered HTML of the agent's current export. When it is missing or stale (e.g. a
+        workflow resumed on another host) and `content` is given, it is exported first.
+        """
+        entry = self.manifest(workflow_id).get(name)
+        if content is not None and (entry is None or entry["sha256"] != hashlib.sha256(content.encode("utf-8")).hexdigest()):
+            entry = self.put(workflow_id, name, content)
+        if entry is None:
+            return None
+        with self._lock:
+            if entry["sha256"] in self._html:
+                self._html.move_to_end(entry["sha256"])
+                return self._html[entry["sha256"]]
+        try:
+            with open(os.path.join(self._dir(workflow_id), entry["html"]), "r", encoding="utf-8") as f:
+                html_text = f.read()
+        except OSError:
+            if content is None:
+                return None
+            html_text = render_agent_html(name, content)
+        self._remember(entry["sha256"], html_text)
+        return html_text
+
+    def path(self, workflow_id: str, name: str, kind: str = "html"):
+        entry = self.manifest(workflow_id).get(name)
+        return os.path.join(self._dir(workflow_id), entry[kind]) if entry else None
+
+    def _remember(self, digest: str, html_text: str):
+        with self._lock:
+            self._html[digest] = html_text
+            self._html.move_to_end(digest)
+            while len(self._html) > self.cache_size:
+                self._html.popitem(last=False)
+
+    def _remove_unreferenced(self, folder: str, manifest: dict, old_entry: dict):
+        in_use = {entry[kind] for entry in manifest.values() for kind in ("md", "html")}
+        for kind in ("md", "html"):
+            if old_entry[kind] not in in_use:
+                try:
+                    os.remove(os.path.join(folder, old_entry[kind]))
+                except OSError:
+                    pass
+
+    def evict(self, force: bool = False) -> list:
+        """Delete expired workflows and the oldest ones beyond `max_workflows`."""
+        now = time.time()
+        if not force and now - self._last_sweep < EVICT_INTERVAL:
+            return []
+        self._last_sweep = now
+        if not os.path.isdir(self.root):
+            return []
+        workflows = []
+        for workflow_id in os.listdir(self.root):
+            manifest_path = os.path.join(self.root, workflow_id, "manifest.json")
+            if os.path.isfile(manifest_path):
+                workflows.append((os.path.getmtime(manifest_path), workflow_id))
+        workflows.sort(reverse=True)
+        evicted = [workflow_id for i, (mtime, workflow_id) in enumerate(workflows)
+                   if i >= self.max_workflows or now - mtime > self.retention_seconds]
+        for workflow_id in evicted:
+            shutil.rmtree(self._dir(workflow_id), ignore_errors=True)
+            with self._lock:
+                self._manifests.pop(workflow_id, None)
+        if evicted:
+            log_event("exports.evicted", workflows=len(evicted), kept=len(workflows) - len(evicted))
+        return evicted
+
+
+def _write_atomic(path: str, text: str):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+default_exports = ExportStore()
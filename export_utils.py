@@ -1,5 +1,14 @@
+import hashlib
+import json
 import markdown
 import os
+import threading
+from collections import OrderedDict
+
+RENDER_CACHE_SIZE = int(os.environ.get("RENDER_CACHE_SIZE", "256"))
+HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", "20"))
+_rendered = OrderedDict()
+_rendered_lock = threading.Lock()
 
 custom_css = """ <style>
     #agent-output {font-family: "Segoe UI", sans-serif; color: #333; }
@@ -28,9 +37,31 @@ def to_markdown(title: str, content: str) -> str:
     """Wrap content with a title as Markdown."""
     return f"# {title} [AI agent] generated content:\n\n{content.strip()}"
 
+def _content_hash(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def _memoized(key: str, build):
+    """Bounded LRU shared by the render helpers below, keyed by content hash."""
+    with _rendered_lock:
+        if key in _rendered:
+            _rendered.move_to_end(key)
+            return _rendered[key]
+    value = build()
+    with _rendered_lock:
+        _rendered[key] = value
+        while len(_rendered) > RENDER_CACHE_SIZE:
+            _rendered.popitem(last=False)
+    return value
+
 def to_html(md_text: str) -> str:
-    """Convert Markdown to HTML."""
-    return markdown.markdown(md_text, extensions=["extra", "codehilite"])
+    """Convert Markdown to HTML (memoized, the same text is rendered once)."""
+    return _memoized(_content_hash("md", md_text),
+                     lambda: markdown.markdown(md_text, extensions=["extra", "codehilite"]))
+
+def render_agent_html(name: str, content: str) -> str:
+    """Styled HTML page fragment for one agent's output."""
+    html_body = to_html(to_markdown(name, content))
+    return f"""{custom_css}\n<div id="agent-output">{html_body}</div>"""
 
 def export_agent_output(name: str, content: str, folder: str="exports"):
     """Save content to .md and .html files."""
@@ -41,8 +72,7 @@ def export_agent_output(name: str, content: str, folder: str="exports"):
     html_path = os.path.join(folder, f"{base_name}_agent_out.html")
 
     md_text = to_markdown(name, content)
-    html_body = to_html(md_text) 
-    html_text = f"""{custom_css}\n<div id="agent-output">{html_body}</div>"""
+    html_text = render_agent_html(name, content)
 
     # Write MD file
     with open(md_path, "w", encoding="utf-8") as f_md:
@@ -95,6 +125,15 @@ def render_messag(content: str, role: str, agent_name : str) -> str:
              <div style="font-weight:bold; margin-bottom:6px;">{emoji} {agent_name if role == "ai" else role.title()}</div>
             {content} </div></div>"""
 
+def history_pages(message_count: int, page_size: int = HISTORY_PAGE_SIZE) -> int:
+    return max(1, -(-message_count // page_size))
+
+def render_history_html(agent_name: str, history: list, page: int = 0, page_size: int = HISTORY_PAGE_SIZE) -> str:
+    """One page of a transcript as a single HTML fragment, memoized by history length and hash."""
+    key = _content_hash("history", agent_name, len(history), page, page_size, history)
+    messages = history[page * page_size:(page + 1) * page_size]
+    return _memoized(key, lambda: "\n".join(render_messag(msg["content"], msg["role"], agent_name) for msg in messages))
+
 def export_agent_html(agent_name: str, session_state) -> str:
     history = session_state.get(f"{agent_name}_history", [])
     output = session_state.get(f"{agent_name}_output", "")
@@ -118,37 +157,61 @@ def export_agent_html(agent_name: str, session_state) -> str:
 
     return "\n".join(blocks)
 
-def export_all_agents_html(agent_list: list, session_state: dict) -> str:
-    html_parts = ["<html><head><style>"]
-    html_parts.append("""
-    body { font-family: 'Segoe UI', sans-serif; margin: 2rem; }
-    .agent-block { margin-bottom: 3rem; padding-bottom: 2rem; border-bottom: 1px solid #ccc; }
-    .role-user { text-align: right; background: #fff3e0; padding: 0.6rem; border-radius: 10px; margin: 0.4rem 0; }
-    .role-agent { text-align: left; background: #e0f7fa; padding: 0.6rem; border-radius: 10px; margin: 0.4rem 0; }
-    .agent-title { font-size: 1.4rem; font-weight: bold; margin-bottom: 1rem; color: #002B5B; }
-    .final-output { padding: 1rem; margin-top: 1rem; border-radius: 12px; }
-    </style>""")
-    html_parts.append(f"""{custom_css}</head><body>""")
-
+def agent_report_block(agent: str, history: list, output: str) -> str:
+    """One agent's section of the full report; memoized, so finished agents are built once."""
+    return _memoized(_content_hash("report", agent, history, output),
+                     lambda: _build_agent_report_block(agent, history, output))
+
+def _build_agent_report_block(agent: str, history: list, output: str) -> str:
+    html_parts = [f"<div class='agent-block'>",
+                  f"<div class='agent-title'>Conversation with {agent.title()} Agent</div>"]
+
+    # Add chat history
+    for msg in history:
+        role_class = f"role-{msg['role']}"
+        html_parts.append(f"<div class='{role_class}'>{msg['content']}</div>")
+
+    # Add final output
+    output = to_html(to_markdown(agent, output))
+    if output:
+        html_parts.append(f"<div id='agent-output'><strong>Final Output:</strong><hr>{output}</div>")
+
+    html_parts.append("</div>")
+    return "\n".join(html_parts)
+
+def report_fingerprint(agent_list: list, session_state, output_digests: dict = None) -> str:
+    """
+    Changes whenever any history or output that goes into the full report changes. Built from
+    per-agent keys, so nothing is serialized in full on a rerun: histories are append-only, so
+    their length and last message identify them, and outputs use the sha256 already recorded
+    in `output_digests` (the export manifest), hashing the text only when none is recorded.
+    """
+    output_digests = output_digests or {}
+    keys = []
     for agent in agent_list:
-        history_key = f"{agent}_history"
-        output_key = f"{agent}_output"
-
-        html_parts.append(f"<div class='agent-block'>")
-        html_parts.append(f"<div class='agent-title'>Conversation with {agent.title()} Agent</div>")
-
-        # Add chat history
-        history = session_state.get(history_key, [])
-        for msg in history:
-            role_class = f"role-{msg['role']}"
-            html_parts.append(f"<div class='{role_class}'>{msg['content']}</div>")
-
-        # Add final output
-        output = to_html(to_markdown(agent, session_state.get(output_key, "")))
-        if output:
-            html_parts.append(f"<div id='agent-output'><strong>Final Output:</strong><hr>{output}</div>")
-
-        html_parts.append("</div>")
+        history = session_state.get(f"{agent}_history", [])
+        output = session_state.get(f"{agent}_output", "")
+        keys.append((agent, len(history), _content_hash(history[-1]) if history else "",
+                     output_digests.get(agent) or hashlib.sha256(output.encode("utf-8")).hexdigest()))
+    return _content_hash(keys)
+
+REPORT_HEAD = f"""<html><head><style>
+    body {{ font-family: 'Segoe UI', sans-serif; margin: 2rem; }}
+    .agent-block {{ margin-bottom: 3rem; padding-bottom: 2rem; border-bottom: 1px solid #ccc; }}
+    .role-user {{ text-align: right; background: #fff3e0; padding: 0.6rem; border-radius: 10px; margin: 0.4rem 0; }}
+    .role-agent {{ text-align: left; background: #e0f7fa; padding: 0.6rem; border-radius: 10px; margin: 0.4rem 0; }}
+    .agent-title {{ font-size: 1.4rem; font-weight: bold; margin-bottom: 1rem; color: #002B5B; }}
+    .final-output {{ padding: 1rem; margin-top: 1rem; border-radius: 12px; }}
+    </style>{custom_css}</head><body>"""
+REPORT_TAIL = "</body></html>"
+
+def iter_report_html(agent_list: list, session_state):
+    """The full report, one section at a time (for writing to a file or a stream)."""
+    yield REPORT_HEAD
+    for agent in agent_list:
+        yield agent_report_block(agent, session_state.get(f"{agent}_history", []),
+                                 session_state.get(f"{agent}_output", ""))
+    yield REPORT_TAIL
 
-    html_parts.append("</body></html>")
-    return "\n".join(html_parts)
\ No newline at end of file
+def export_all_agents_html(agent_list: list, session_state: dict) -> str:
+    return "\n".join(iter_report_html(agent_list, session_state))
@@ -0,0 +1,205 @@
+"""
+Deterministic stand-in for `genai.GenerativeModel`, for load tests and offline runs.
+
+Enable it with LLM_BACKEND=fake (optionally FAKE_LLM_LATENCY / FAKE_LLM_TTFT, e.g.
+"lognormal:1.5,0.6", and FAKE_LLM_ERROR_RATE to inject 503s) or programmatically with
+`llm_client.set_backend(FakeGenerativeModel)`. Each call's wire size is kept in
+`call_log` (see `bytes_summary`), including what cached content saved.
+"""
+import asyncio
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+
+QUESTIONS_PER_AGENT = int(os.environ.get("FAKE_LLM_QUESTIONS", "3"))
+ERROR_RATE = float(os.environ.get("FAKE_LLM_ERROR_RATE", "0"))
+
+
+class ServiceUnavailable(Exception):
+    """Shaped like google.api_core's 503 so retry classification treats it the same way."""
+    code = 503
+
+
+class LatencyModel:
+    """Seeded latency distribution: "const:S", "uniform:LO,HI" or "lognormal:MEDIAN,SIGMA" (seconds)."""
+
+    def __init__(self, spec: str = "const:0", seed: int = 0):
+        kind, _, args = spec.partition(":")
+        self.kind = kind
+        self.args = [float(a) for a in args.split(",") if a] or [0.0]
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.kind == "uniform":
+                return self._rng.uniform(self.args[0], self.args[1])
+            if self.kind == "lognormal":
+                return self._rng.lognormvariate(math.log(max(self.args[0], 1e-6)), self.args[1])
+            return self.args[0]
+
+
+def _text_of(contents) -> str:
+    if isinstance(contents, str):
+        return contents
+    return json.dumps(contents, ensure_ascii=False, default=str)
+
+
+def scripted_reply(system_instruction: str, contents) -> str:
+    """Default script: a few marked yes/no questions, "I AM SATISFIED", then a Markdown document."""
+    text = _text_of(contents)
+    digest = hashlib.sha256((str(system_instruction) + text).encode("utf-8")).hexdigest()[:8]
+    if "Based on the conversation and context above" in text:
+        sections = "\n\n".join(f"## Section {i}\n\n| Item | Detail |\n|---|---|\n| {digest}-{i} | generated |"
+                               for i in range(1, 6))
+        return f"# Generated document {digest}\n\n{sections}"
+    if "Evaluate the latest user reply" in str(system_instruction or ""):
+        asked = sum(1 for turn in (contents if isinstance(contents, list) else []) if turn.get("role") == "model")
+        if asked >= QUESTIONS_PER_AGENT:
+            return "I AM SATISFIED"
+        marker = "[N]" if asked % 2 == 0 else "[C]"
+        return f"Should we assume requirement {digest}-{asked} applies? {marker}"
+    if "Evaluate the user's answers to the questionnaire" in str(system_instruction or ""):
+        return f"- Should we assume answer {digest}-1 covers every environment?"
+    return "\n".join(f"- Clarifying question {digest}-{i}?" for i in range(1, 4))
+
+
+def json_reply(text: str, schema: dict) -> str:
+    """Reshape a scripted reply into the JSON an orchestrator response schema asks for."""
+    properties = (schema or {}).get("properties", {})
+    if "done" in properties:
+        text = text.strip()
+        done = text.upper().startswith("I AM SATISFIED")
+        marker = text[-2] if text.endswith(("[N]", "[C]")) else ""
+        question = "" if done else (text[:-3] if marker else text).strip()
+        return json.dumps({"done": done, "question": question, "marker": marker})
+    if "questions" in properties:
+        return json.dumps({"questions": [line.strip("-• ") for line in text.splitlines() if line.strip("-• ")]})
+    if "summary" in properties:
+        return json.dumps({"summary": text.splitlines()[0][:200] if text else "",
+                           "items": [{"kind": "item", "name": line.strip("-#• ")[:60], "detail": "scripted"}
+                                     for line in text.splitlines()[:5] if line.strip("-#• ")],
+                           "decisions": [], "constraints": [], "risks": []})
+    return json.dumps({"text": text})
+
+
+# Every call of every fake model, with what it would put on the wire
+call_log = deque(maxlen=20000)
+cached_contents = {}
+_cache_ids = itertools.count(1)
+
+
+def create_cached_content(model_name: str, system_instruction: str, ttl_seconds: float = 3600):
+    """Stand-in for `caching.CachedContent.create`: registers the prefix and returns its handle."""
+    # Like the real API, every creation gets its own name, so a renewed prefix never collides with its predecessor
+    digest = hashlib.sha256(f"{model_name}\n{system_instruction}".encode("utf-8")).hexdigest()[:12]
+    name = f"cachedContents/{digest}-{next(_cache_ids)}"
+    handle = SimpleNamespace(name=name, model=model_name, system_instruction=system_instruction,
+                             expire_time=time.time() + ttl_seconds,
+                             usage_metadata=SimpleNamespace(total_token_count=len(system_instruction) // 4))
+    handle.delete = lambda: cached_contents.pop(name, None)
+    cached_contents[name] = handle
+    return handle
+
+
+def bytes_summary() -> dict:
+    """Bytes each recorded call sent, split into contents, inline system instruction and cached-content handle."""
+    calls = list(call_log)
+    if not calls:
+        return {"calls": 0}
+    total = [c["bytes_sent"] + c["system_instruction_bytes"] + c["cached_handle_bytes"] for c in calls]
+    return {"calls": len(calls), "mean_bytes_per_call": sum(total) / len(calls), "max_bytes_per_call": max(total),
+            "system_instruction_bytes": sum(c["system_instruction_bytes"] for c in calls),
+            "cached_calls": sum(1 for c in calls if c["cached_handle_bytes"]),
+            "cached_prefix_bytes_not_sent": sum(c["cached_prefix_bytes"] for c in calls)}
+
+
+class FakeGenerativeModel:
+    """
+    Drop-in for `genai.GenerativeModel` with scripted responses, configurable latency,
+    streaming, usage_metadata, and a record of how many bytes each call would send.
+    """
+
+    def __init__(self, model_name: str = "fake-gemini", system_instruction=None, generation_config=None,
+                 script=scripted_reply, latency: str = None, ttft: str = None, chunks: int = 8, seed: int = 0,
+                 error_rate: float = None, **kwargs):
+        self.model_name = model_name
+        self._generation_config = generation_config
+        self.cached_content = kwargs.get("cached_content")
+        if self.cached_content is not None:
+            if system_instruction is not None:
+                raise ValueError("system_instruction cannot be combined with cached_content")
+            if self.cached_content.name not in cached_contents:
+                raise LookupError(f"404 {self.cached_content.name} not found (expired or deleted)")
+            system_instruction = self.cached_content.system_instruction  # the script still routes on it
+        self._system_instruction = system_instruction
+        self.script = script
+        self.latency = LatencyModel(latency or os.environ.get("FAKE_LLM_LATENCY", "const:0"), seed)
+        self.ttft = LatencyModel(ttft or os.environ.get("FAKE_LLM_TTFT", "const:0"), seed + 1)
+        self.chunks = chunks
+        self.error_rate = ERROR_RATE if error_rate is None else error_rate
+        self._errors = random.Random(seed + 2)
+        self.calls = []
+
+    def _respond(self, contents, stream: bool, generation_config=None):
+        if self.error_rate and self._errors.random() < self.error_rate:
+            raise ServiceUnavailable("503 The model is overloaded. Please try again later.")
+        text = self.script(self._system_instruction, contents)
+        config = generation_config or self._generation_config or {}
+        if config.get("response_mime_type") == "application/json":
+            text = json_reply(text, config.get("response_schema"))
+        instruction_bytes = len(str(self._system_instruction or "").encode("utf-8"))
+        cached = self.cached_content is not None
+        call = {"time": time.time(), "stream": stream, "bytes_sent": len(_text_of(contents).encode("utf-8")),
+                # A cached prefix is referenced by name instead of being sent
+                "system_instruction_bytes": 0 if cached else instruction_bytes,
+                "cached_handle_bytes": len(self.cached_content.name) if cached else 0,
+                "cached_prefix_bytes": instruction_bytes if cached else 0}
+        self.calls.append(call)
+        call_log.append(call)
+        usage = SimpleNamespace(prompt_token_count=(len(_text_of(contents)) + len(str(self._system_instruction or ""))) // 4,
+                                candidates_token_count=len(text) // 4)
+        return text, usage
+
+    def _split(self, text: str) -> list:
+        size = max(1, math.ceil(len(text) / self.chunks))
+        return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+    def generate_content(self, contents, stream: bool = False, generation_config=None, **kwargs):
+        text, usage = self._respond(contents, stream, generation_config)
+        if not stream:
+            time.sleep(self.latency.sample())
+            return SimpleNamespace(text=text, usage_metadata=usage)
+        return self._stream(text, usage)
+
+    def _stream(self, text: str, usage):
+        time.sleep(self.ttft.sample())
+        pieces = self._split(text)
+        rest = self.latency.sample() / len(pieces)
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(rest)
+            yield SimpleNamespace(text=piece, usage_metadata=usage if i == len(pieces) - 1 else None)
+
+    async def generate_content_async(self, contents, stream: bool = False, generation_config=None, **kwargs):
+        text, usage = self._respond(contents, stream, generation_config)
+        if stream:
+            return self._stream_async(text, usage)
+        await asyncio.sleep(self.latency.sample())
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    async def _stream_async(self, text: str, usage):
+        await asyncio.sleep(self.ttft.sample())
+        pieces = self._split(text)
+        rest = self.latency.sample() / len(pieces)
+        for i, piece in enumerate(pieces):
+            if i:
+                await asyncio.sleep(rest)
+            yield SimpleNamespace(text=piece, usage_metadata=usage if i == len(pieces) - 1 else None)
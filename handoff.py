@@ -0,0 +1,111 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from llm_client import estimate_tokens
+from log_sink import log_event
+
+DEFAULT_TOKEN_BUDGET = int(os.environ.get("HANDOFF_TOKEN_BUDGET", "12000"))
+MODEL_CONTEXT_LIMIT = int(os.environ.get("MODEL_CONTEXT_LIMIT", "1000000"))
+
+# Upstream context budget per downstream agent (tokens)
+TOKEN_BUDGETS = {
+    "Designer": DEFAULT_TOKEN_BUDGET,
+    "Estimator": DEFAULT_TOKEN_BUDGET,
+    "Coder": DEFAULT_TOKEN_BUDGET,
+    "Reviewer": DEFAULT_TOKEN_BUDGET,
+    "Tester": DEFAULT_TOKEN_BUDGET,
+    "Deployer": DEFAULT_TOKEN_BUDGET,
+}
+
+# What each consumer actually needs from upstream outputs
+HANDOFF_FOCUS = {
+    "Designer": "business goals, features, epics and stories, functional and non-functional requirements, data sources and destinations, data rules, constraints and KPIs",
+    "Estimator": "scope items, features and modules, system components, technology choices, integrations, assumptions, constraints and risks that drive effort and cost",
+    "Coder": "modules and their responsibilities, interfaces and APIs, data models, integration touchpoints, technology stack and functional requirements",
+    "Reviewer": "code structure, key modules and functions, API layer, error handling, security-sensitive code and the design decisions the code relies on; keep short code excerpts where they matter",
+    "Tester": "features and acceptance criteria, user roles, workflows, interfaces and APIs, edge cases, non-functional requirements and constraints",
+    "Deployer": "infrastructure, deployable components and services, environments, technologies and frameworks, configuration and secrets, integration touchpoints, test gates and operational risks; omit function bodies and test code",
+}
+
+DIGEST_PROMPT = """You are preparing a handoff for the {consumer} agent in an SDLC pipeline.
+Condense the {producer} agent's output below to what the {consumer} needs: {focus}.
+Keep names, numbers, decisions and table contents that matter; drop everything else.
+Answer in Markdown, at most about {max_tokens} tokens.
+
+{producer} Output:
+{text}"""
+
+_digests = OrderedDict()
+_digests_lock = threading.Lock()
+MAX_DIGESTS = 512
+
+
+def _digest_key(producer: str, consumer: str, text: str, max_tokens: int) -> tuple:
+    return (producer, consumer, hashlib.sha256(text.encode("utf-8")).hexdigest(), max_tokens)
+
+
+def cached_digest(producer: str, consumer: str, text: str, max_tokens: int):
+    with _digests_lock:
+        key = _digest_key(producer, consumer, text, max_tokens)
+        if key in _digests:
+            _digests.move_to_end(key)
+            return _digests[key]
+    return None
+
+
+def store_digest(producer: str, consumer: str, text: str, max_tokens: int, digest: str) -> str:
+    digest = truncate_to_tokens(digest.strip(), max_tokens)
+    with _digests_lock:
+        _digests[_digest_key(producer, consumer, text, max_tokens)] = digest
+        while len(_digests) > MAX_DIGESTS:
+            _digests.popitem(last=False)
+    return digest
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[:max_tokens * 4].rstrip() + "\n…(truncated)"
+
+
+def digest_prompt(producer: str, consumer: str, text: str, max_tokens: int) -> str:
+    return DIGEST_PROMPT.format(producer=producer, consumer=consumer, text=text, max_tokens=max_tokens,
+                                focus=HANDOFF_FOCUS.get(consumer, "the facts needed to do its job"))
+
+
+def plan_handoff(consumer: str, context_inputs: dict, budget: int = None):
+    """
+    Split the consumer's token budget across its upstream outputs.
+
+    Returns `(handoff, to_digest)`: outputs that fit their share pass through verbatim
+    in `handoff`; the rest are listed in `to_digest` as (key, producer, text, max_tokens).
+    Space left over by small outputs is redistributed to the larger ones.
+    """
+    budget = budget or TOKEN_BUDGETS.get(consumer, DEFAULT_TOKEN_BUDGET)
+    sizes = {key: estimate_tokens(value or "") for key, value in context_inputs.items()}
+    if sum(sizes.values()) <= budget:
+        return dict(context_inputs), []
+
+    handoff, remaining, to_digest = {}, budget, []
+    pending = sorted(sizes, key=sizes.get)  # smallest first, so leftovers flow to the big ones
+    while pending:
+        share = remaining // len(pending)
+        key = pending.pop(0)
+        value = context_inputs[key] or ""
+        if sizes[key] <= share:
+            handoff[key] = value
+            remaining -= sizes[key]
+        else:
+            producer = key.replace("_output", "")
+            to_digest.append((key, producer, value, max(share, 1)))
+            remaining -= share
+    return handoff, to_digest
+
+
+def fits(consumer: str, prompt_tokens: int, limit: int = MODEL_CONTEXT_LIMIT) -> bool:
+    """Pre-flight check of an estimated prompt size against the model context window."""
+    if prompt_tokens > limit:
+        log_event("handoff.over_context_limit", agent=consumer, est_tokens=prompt_tokens, limit=limit)
+        return False
+    return True
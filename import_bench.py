@@ -0,0 +1,64 @@
+"""
+Cold-start benchmark: import time of the app's modules, each measured in a fresh interpreter.
+
+    python import_bench.py                     # orchestrator, pipeline, export_utils, ...
+    python import_bench.py orchestrator --runs 10 --top 15
+
+Reports the median wall time per module and, from `-X importtime`, the slowest imports
+underneath it (cumulative microseconds), which is where lazy imports pay off.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+DEFAULT_MODULES = ["orchestrator", "pipeline", "export_utils", "workflow_store", "llm_client"]
+
+
+def _import_once(module: str) -> tuple:
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr.strip().splitlines()[-1]}")
+    return elapsed, result.stderr
+
+
+def _slowest(importtime_log: str, module: str, top: int) -> list:
+    rows = []
+    for line in importtime_log.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.rstrip()))
+    # Nested imports are listed too (their time is included in their parents')
+    return sorted((r for r in rows if r[1].strip() != module), reverse=True)[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold import time of the app modules.")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="slowest imports to list per module")
+    args = parser.parse_args(argv)
+
+    for module in args.modules:
+        try:
+            runs = [_import_once(module) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"{module}: {e}")
+            continue
+        times = [elapsed for elapsed, _ in runs]
+        print(f"{module}: median {statistics.median(times) * 1000:.0f} ms "
+              f"(min {min(times) * 1000:.0f}, max {max(times) * 1000:.0f}, {args.runs} runs, incl. interpreter start)")
+        for cumulative, name in _slowest(runs[-1][1], module, args.top):
+            print(f"    {cumulative / 1000:8.1f} ms  {name.strip()}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
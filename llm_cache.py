@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_PATH = os.environ.get("LLM_CACHE_PATH", ".cache/llm_cache.sqlite")
+CACHE_DISABLED = os.environ.get("LLM_CACHE_DISABLED", "").lower() in ("1", "true", "yes")
+
+
+def make_cache_key(model_name: str, generation_config, prompt, kind: str = "text") -> str:
+    """Content address of a model call: model name + generation config + exact prompt."""
+    payload = json.dumps(
+        {"model": model_name, "config": generation_config, "prompt": prompt, "kind": kind},
+        sort_keys=True, default=str, ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Two-tier prompt/response cache.
+
+    - Memory tier: LRU over the most recent `max_memory_items` responses.
+    - Disk tier: SQLite table bounded by `max_disk_items` / `max_disk_bytes`,
+      evicting the least recently accessed rows first.
+    Both tiers honour `ttl_seconds`. Counters are available through `stats()`.
+    Disk rows also record the fingerprint of the prompt template that produced them.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_memory_items: int = 256,
+                 max_disk_items: int = 5000, max_disk_bytes: int = 200 * 1024 * 1024,
+                 ttl_seconds: float = 7 * 24 * 3600):
+        self.path = path
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,
+                created REAL NOT NULL, accessed REAL NOT NULL, expires REAL NOT NULL)""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)")
+            if "template" not in {row[1] for row in self._conn.execute("PRAGMA table_info(llm_cache)")}:
+                self._conn.execute("ALTER TABLE llm_cache ADD COLUMN template TEXT NOT NULL DEFAULT ''")
+            self._conn.commit()
+        return self._conn
+
+    def get_memory(self, key: str):
+        """Memory tier only; never touches SQLite, so it is safe on an event loop. Misses are not counted."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None or entry[1] <= now:
+                return None
+            self._memory.move_to_end(key)
+            self.counters["memory_hits"] += 1
+            return entry[0]
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > now:
+                    self._memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            db = self._db()
+            row = db.execute("SELECT value, expires FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] > now:
+                db.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+                db.commit()
+                self._remember(key, row[0], row[1])
+                self.counters["disk_hits"] += 1
+                return row[0]
+            if row is not None:
+                db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                db.commit()
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, key: str, value: str, template: str = ""):
+        if value is None:
+            return
+        now = time.time()
+        expires = now + self.ttl_seconds
+        with self._lock:
+            self._remember(key, value, expires)
+            db = self._db()
+            db.execute("INSERT OR REPLACE INTO llm_cache (key, value, size, created, accessed, expires, template) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       (key, value, len(value.encode("utf-8")), now, now, expires, template or ""))
+            self.counters["writes"] += 1
+            self._evict_disk(db, now)
+            db.commit()
+
+    def _remember(self, key: str, value: str, expires: float):
+        self._memory[key] = (value, expires)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def _evict_disk(self, db: sqlite3.Connection, now: float):
+        db.execute("DELETE FROM llm_cache WHERE expires <= ?", (now,))
+        count, total = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        while count > self.max_disk_items or total > self.max_disk_bytes:
+            row = db.execute("SELECT key, size FROM llm_cache ORDER BY accessed LIMIT 1").fetchone()
+            if row is None:
+                break
+            db.execute("DELETE FROM llm_cache WHERE key = ?", (row[0],))
+            count, total = count - 1, total - row[1]
+            self.counters["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._db().execute("DELETE FROM llm_cache")
+            self._db().commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total = self._db().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+            templates = dict(self._db().execute(
+                "SELECT template, COUNT(*) FROM llm_cache WHERE template != '' GROUP BY template").fetchall())
+            hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+            lookups = hits + self.counters["misses"]
+            return {**self.counters, "memory_items": len(self._memory), "disk_items": count,
+                    "disk_bytes": total, "hit_ratio": (hits / lookups) if lookups else 0.0,
+                    "items_by_template": templates}
+
+
+default_cache = LLMCache()
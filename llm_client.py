@@ -0,0 +1,606 @@
+import asyncio
+import hashlib
+import itertools
+import os
+import queue
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait as futures_wait
+from contextlib import AsyncExitStack, asynccontextmanager
+from llm_cache import CACHE_DISABLED, default_cache, make_cache_key
+from log_sink import log_event
+from metrics import record_call, record_queue_wait, usage_tokens
+from resilience import call_with_resilience, call_with_resilience_async
+from singleflight import flights
+
+MODEL_NAME = os.environ.get("GEMINI_MODEL", "gemini-1.5-flash")
+KEY_PATH = os.environ.get("GEMINI_KEY_PATH", os.path.join("keys", ".gemini_key"))
+
+MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+# 3 = widest level of the agent DAG (Estimator, Coder and Tester fan out together)
+MAX_PER_SESSION = int(os.environ.get("LLM_MAX_PER_SESSION", "3"))
+
+# 📌 Server-side context caching of large, stable system instructions (Gemini CachedContent).
+# Off by default: with the API minimum below and the 12k-token handoff budgets, the app's own prompts
+# stay under it. Turn it on (CONTEXT_CACHE=1) for long prefixes or models with a lower minimum.
+CONTEXT_CACHE = os.environ.get("CONTEXT_CACHE", "0") == "1"
+# Below the API minimum (32,768 tokens on 1.5 models, smaller on later ones) the prefix travels as system_instruction
+CONTEXT_CACHE_MIN_TOKENS = int(os.environ.get("CONTEXT_CACHE_MIN_TOKENS", "32768"))
+CONTEXT_CACHE_TTL = int(os.environ.get("CONTEXT_CACHE_TTL", "3600"))
+CONTEXT_CACHE_MODEL = os.environ.get("CONTEXT_CACHE_MODEL", "")  # caching needs a versioned name, e.g. gemini-1.5-flash-002
+MAX_CACHED_CONTEXTS = 32
+
+
+_models = OrderedDict()
+_models_lock = threading.Lock()
+MAX_MODELS = 64
+_backend = None
+
+
+def set_backend(factory):
+    """
+    Swap the model class behind `get_model`, e.g. `fake_backend.FakeGenerativeModel` for
+    load tests. `factory(model_name, system_instruction=...)` must behave like
+    `genai.GenerativeModel`; pass None to go back to Gemini.
+    """
+    global _backend
+    with _models_lock:
+        _backend = factory
+        _models.clear()
+    context_cache.clear()
+
+
+class MissingAPIKeyError(RuntimeError):
+    """No Gemini API key in GEMINI_API_KEY / GOOGLE_API_KEY or the key file."""
+
+
+_configured = False
+_configure_lock = threading.Lock()
+_status = {"state": "cold", "error": "", "seconds": None, "failed_at": 0.0}
+WARM_UP_RETRY = float(os.environ.get("WARM_UP_RETRY", "30"))
+
+
+def read_api_key() -> str:
+    key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
+    if key:
+        return key.strip()
+    try:
+        with open(KEY_PATH, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+
+def configure_client():
+    """Import and configure the Gemini SDK on first use instead of at import time."""
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        import google.generativeai as genai  # heavy (grpc, protobuf); deferred until a model is needed
+        api_key = read_api_key()
+        if not api_key:
+            raise MissingAPIKeyError(f"No Gemini API key: set GEMINI_API_KEY or create {KEY_PATH}.")
+        genai.configure(api_key=api_key)
+        _configured = True
+
+
+def _model_factory():
+    if _backend is not None:
+        return _backend
+    if os.environ.get("LLM_BACKEND", "").lower() == "fake":
+        from fake_backend import FakeGenerativeModel
+        return FakeGenerativeModel
+    configure_client()
+    import google.generativeai as genai
+    return genai.GenerativeModel
+
+
+def warm_up():
+    """
+    Make the client ready ahead of the first request: SDK import, configuration and the
+    default model. Runs in a daemon thread; `client_status()` reports the outcome. A failed
+    warm-up (e.g. no key yet) is retried at most every WARM_UP_RETRY seconds, so fixing the
+    key or config turns the client ready without a restart.
+    """
+    with _configure_lock:
+        if _status["state"] in ("warming", "ready"):
+            return
+        if _status["state"] == "error" and time.time() - _status["failed_at"] < WARM_UP_RETRY:
+            return
+        _status["state"] = "warming"
+
+    def run():
+        started = time.perf_counter()
+        try:
+            get_model(MODEL_NAME)
+        except Exception as e:
+            _status.update(state="error", error=str(e), failed_at=time.time())
+        else:
+            _status.update(state="ready", error="")
+        _status["seconds"] = round(time.perf_counter() - started, 3)
+
+    threading.Thread(target=run, name="llm-client-warmup", daemon=True).start()
+
+
+def client_status() -> dict:
+    """{"state": cold|warming|ready|error, "error": ..., "seconds": warm-up time}; an error is re-checked."""
+    if _status["state"] == "error":
+        warm_up()
+    return {key: _status[key] for key in ("state", "error", "seconds")}
+
+
+def _uses_stand_in() -> bool:
+    return _backend is not None or os.environ.get("LLM_BACKEND", "").lower() == "fake"
+
+
+class ContextCache:
+    """
+    Large system instructions (persona + spec + long upstream outputs, the proposal
+    framework) registered once as Gemini cached content, so each call sends only the
+    handle and its variable contents.
+
+    Registering is a network call, so it never runs on the caller's thread (which may be
+    the shared async client loop): the first calls with a new prefix send it as a plain
+    system_instruction while a worker creates the handle, once per prefix. Handles are
+    renewed in the background shortly before their TTL runs out; the replaced and the
+    evicted handles are deleted. Prefixes the API refuses are not tried again.
+    """
+
+    RENEW_MARGIN = 60  # seconds before expiry at which a handle is re-created
+
+    def __init__(self, min_tokens: int = CONTEXT_CACHE_MIN_TOKENS, ttl_seconds: int = CONTEXT_CACHE_TTL,
+                 max_items: int = MAX_CACHED_CONTEXTS, enabled: bool = CONTEXT_CACHE):
+        self.min_tokens, self.ttl_seconds, self.max_items = min_tokens, ttl_seconds, max_items
+        self.enabled = enabled
+        self._entries = OrderedDict()  # digest -> (model, expires, handle)
+        self._pending = {}  # digest -> Future of the registration in progress (one per prefix)
+        self._refused = set()
+        self._lock = threading.Lock()
+        self._workers = ThreadPoolExecutor(max_workers=2, thread_name_prefix="context-cache")
+
+    def model(self, model_name: str, system_instruction: str, digest: str):
+        """A model bound to the cached prefix, or None (send it inline) when it is not cached (yet)."""
+        if not self.enabled or not system_instruction or estimate_tokens(system_instruction) < self.min_tokens:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry:
+                self._entries.move_to_end(digest)
+            register = (entry is None or entry[1] - self.RENEW_MARGIN <= now) \
+                and digest not in self._pending and digest not in self._refused
+            if register:
+                self._pending[digest] = self._workers.submit(self._register, model_name, system_instruction, digest)
+        return entry[0] if entry and entry[1] > now else None
+
+    def wait(self, timeout: float = None):
+        """Block until the registrations in progress have finished (tests, load test warm-up)."""
+        with self._lock:
+            pending = list(self._pending.values())
+        futures_wait(pending, timeout=timeout)
+
+    def _register(self, model_name: str, system_instruction: str, digest: str):
+        try:
+            handle = self._create(CONTEXT_CACHE_MODEL or model_name, system_instruction)
+            model = self._bind(model_name, handle)
+        except Exception as e:
+            with self._lock:
+                self._refused.add(digest)
+                self._pending.pop(digest, None)
+            log_event("context_cache.refused", model=model_name, est_tokens=estimate_tokens(system_instruction),
+                      error=f"{type(e).__name__}: {e}")
+            return
+        # Same response-cache identity as the inline model: the answer does not depend on how the prefix travels
+        _tag(model, model_name, system_instruction)
+        with self._lock:
+            replaced = self._entries.get(digest)
+            self._entries[digest] = (model, time.time() + self.ttl_seconds, handle)
+            self._entries.move_to_end(digest)
+            self._pending.pop(digest, None)
+            stale = [replaced[2]] if replaced else []
+            while len(self._entries) > self.max_items:
+                stale.append(self._entries.popitem(last=False)[1][2])
+        log_event("context_cache.created", model=model_name, name=getattr(handle, "name", ""),
+                  est_tokens=estimate_tokens(system_instruction), renewed=bool(replaced))
+        for old in stale:
+            self._delete(old)
+
+    def _create(self, model_name: str, system_instruction: str):
+        if _uses_stand_in():
+            from fake_backend import create_cached_content
+            return create_cached_content(model_name, system_instruction, self.ttl_seconds)
+        configure_client()
+        import datetime
+        from google.generativeai import caching
+        return caching.CachedContent.create(model=model_name, system_instruction=system_instruction,
+                                            ttl=datetime.timedelta(seconds=self.ttl_seconds))
+
+    def _bind(self, model_name: str, handle):
+        factory = _model_factory()
+        from_cached_content = getattr(factory, "from_cached_content", None)
+        if from_cached_content is not None:
+            return from_cached_content(cached_content=handle)
+        return factory(model_name, cached_content=handle)
+
+    @staticmethod
+    def _delete(handle):
+        try:
+            handle.delete()
+        except Exception as e:
+            log_event("context_cache.delete_failed", name=getattr(handle, "name", ""), error=type(e).__name__)
+
+    def clear(self):
+        self.wait()
+        with self._lock:
+            handles = [handle for _, _, handle in self._entries.values()]
+            self._entries.clear()
+            self._refused.clear()
+        for handle in handles:
+            self._delete(handle)
+
+
+context_cache = ContextCache()
+
+
+def get_model(model_name: str = MODEL_NAME, system_instruction: str = None):
+    """
+    Shared GenerativeModel per (model name, system instruction). Instances share the
+    SDK's default transport, so per-agent models do not open extra connections. Large
+    system instructions are served from `context_cache` instead of being resent.
+    """
+    digest = hashlib.sha256(system_instruction.encode("utf-8")).hexdigest() if system_instruction else ""
+    cached = context_cache.model(model_name, system_instruction, digest)
+    if cached is not None:
+        return cached
+    key = (model_name, digest)
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            model = _tag(_model_factory()(model_name, system_instruction=system_instruction), model_name,
+                         system_instruction)
+            _models[key] = model
+        _models.move_to_end(key)
+        while len(_models) > MAX_MODELS:
+            _models.popitem(last=False)
+    return model
+
+
+def estimate_tokens(content) -> int:
+    """Cheap local token estimate (~4 characters per token) for strings or Gemini `contents` lists."""
+    if isinstance(content, str):
+        return (len(content) + 3) // 4
+    if isinstance(content, dict):
+        return sum(estimate_tokens(part) for part in content.get("parts", []))
+    return sum(estimate_tokens(item) for item in content or [])
+
+
+def _tag(model, model_name: str, system_instruction: str = None):
+    """
+    Record the model name and raw system instruction a model was requested with. Response-cache
+    keys are built from these, not from SDK attributes, which differ between an inline model
+    (a Content proto) and one bound to cached content (the versioned cache model name).
+    """
+    model.cache_identity = (model_name, system_instruction or "")
+    return model
+
+
+def _model_identity(model, generation_config=None):
+    model_name, system_instruction = getattr(model, "cache_identity", None) \
+        or (getattr(model, "model_name", type(model).__name__), "")
+    config = generation_config if generation_config is not None else getattr(model, "_generation_config", None)
+    # The system instruction changes the answer just like the prompt does
+    if system_instruction:
+        config = {"generation_config": config, "system_instruction": system_instruction}
+    return model_name, config
+
+
+def cached_call(key: str, produce, use_cache: bool = True, agent: str = "", phase: str = ""):
+    """Return the cached value for `key`, or compute it with `produce()` (retried like a model call) and store it."""
+    started = time.perf_counter()
+    use_cache = use_cache and not CACHE_DISABLED
+    if use_cache:
+        value = default_cache.get(key)
+        if value is not None:
+            record_call(agent, phase, time.perf_counter() - started, cache_hit=True)
+            return value
+
+    def run():
+        try:
+            value = call_with_resilience(produce)
+        except Exception as e:
+            record_call(agent, phase, time.perf_counter() - started, error=type(e).__name__)
+            raise
+        elapsed = time.perf_counter() - started
+        record_call(agent, phase, elapsed, ttft=elapsed)
+        if use_cache:
+            default_cache.put(key, value)
+        return value
+
+    return flights.do(key, run)
+
+
+def generate_text(model, prompt, use_cache: bool = True, generation_config=None,
+                  agent: str = "", phase: str = "", template: str = "") -> str:
+    """
+    Run `model.generate_content(prompt)` through the prompt/response cache and return its text.
+    `template` is the prompt template fingerprint, stored with the cached response.
+    """
+    model_name, config = _model_identity(model, generation_config)
+    key = make_cache_key(model_name, config, prompt)
+    started = time.perf_counter()
+    use_cache = use_cache and not CACHE_DISABLED
+    if use_cache:
+        cached = default_cache.get(key)
+        if cached is not None:
+            record_call(agent, phase, time.perf_counter() - started, cache_hit=True)
+            return cached
+
+    kwargs = {"generation_config": generation_config} if generation_config is not None else {}
+
+    def produce():
+        try:
+            response = call_with_resilience(lambda: model.generate_content(prompt, **kwargs))
+            text = response.text
+        except Exception as e:
+            record_call(agent, phase, time.perf_counter() - started, error=type(e).__name__)
+            raise
+        elapsed = time.perf_counter() - started
+        record_call(agent, phase, elapsed, ttft=elapsed, **usage_tokens(response))
+        if use_cache:
+            default_cache.put(key, text, template=template)
+        return text
+
+    # Identical prompts already in flight (another session, a double click) share one call
+    return flights.do(key, produce)
+
+
+def _open_stream(model, prompt, kwargs):
+    """Start a streamed call and pull its first chunk, where connection and quota errors surface."""
+    stream = iter(model.generate_content(prompt, stream=True, **kwargs))
+    return [chunk for chunk in itertools.islice(stream, 1)], stream
+
+
+def stream_text(model, prompt, use_cache: bool = True, generation_config=None,
+                agent: str = "", phase: str = "", template: str = ""):
+    """Yield response text chunks; a cache hit is replayed as a single chunk."""
+    model_name, config = _model_identity(model, generation_config)
+    key = make_cache_key(model_name, config, prompt)
+    started = time.perf_counter()
+    use_cache = use_cache and not CACHE_DISABLED
+    if use_cache:
+        cached = default_cache.get(key)
+        if cached is not None:
+            record_call(agent, phase, time.perf_counter() - started, ttft=time.perf_counter() - started, cache_hit=True)
+            yield cached
+            return
+
+    kwargs = {"generation_config": generation_config} if generation_config is not None else {}
+
+    def produce():
+        chunks, ttft, usage = [], None, {}
+        try:
+            # Retries are only safe until the first chunk has been handed to the caller
+            first, stream = call_with_resilience(lambda: _open_stream(model, prompt, kwargs))
+            for chunk in itertools.chain(first, stream):
+                text = getattr(chunk, "text", "")
+                # usage_metadata is complete on the last chunk
+                usage = usage_tokens(chunk) or usage
+                if text:
+                    if ttft is None:
+                        ttft = time.perf_counter() - started
+                    chunks.append(text)
+                    yield text
+        except Exception as e:
+            record_call(agent, phase, time.perf_counter() - started, ttft=ttft, error=type(e).__name__)
+            raise
+        record_call(agent, phase, time.perf_counter() - started, ttft=ttft, **usage)
+        # Only a stream that ran to completion is worth caching
+        if use_cache:
+            default_cache.put(key, "".join(chunks), template=template)
+
+    # Followers of an identical in-flight stream replay its chunks from the start
+    yield from flights.stream("stream:" + key, produce)
+
+
+class AsyncLLMClient:
+    """
+    Async front-end for `generate_content_async`.
+
+    All calls execute on one long-lived background event loop, so the gRPC aio
+    channel each GenerativeModel opens on its first async call is reused by every
+    later call from every Streamlit session. Concurrency is bounded globally by
+    `max_concurrency`; a session may hold at most `max_per_session` of those
+    slots, so one user fanning out many calls cannot starve the others.
+    """
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, max_per_session: int = MAX_PER_SESSION):
+        self.max_concurrency = max_concurrency
+        self.max_per_session = max_per_session
+        self._loop = None
+        self._lock = threading.Lock()
+        self._global = None
+        self._sessions = weakref.WeakValueDictionary()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-client-loop", daemon=True).start()
+                self._loop = loop
+        return self._loop
+
+    def submit(self, coro):
+        """Schedule `coro` on the client loop from any thread; returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro):
+        """Blocking helper for synchronous callers such as the Streamlit script thread."""
+        if self._loop is not None and threading.current_thread().name == "llm-client-loop":
+            coro.close()
+            raise RuntimeError("AsyncLLMClient.run() called on the client loop; await the coroutine instead.")
+        return self.submit(coro).result()
+
+    async def _on_loop(self, coro):
+        # Coroutines awaited from a foreign loop (e.g. asyncio.run in a batch job) hop onto ours
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            return await coro
+        return await asyncio.wrap_future(self.submit(coro))
+
+    @asynccontextmanager
+    async def _slot(self, session_id: str):
+        if self._global is None:
+            self._global = asyncio.Semaphore(self.max_concurrency)
+        session_slots = self._sessions.get(session_id)
+        if session_slots is None:
+            session_slots = asyncio.Semaphore(self.max_per_session)
+            self._sessions[session_id] = session_slots
+        queued = time.perf_counter()
+        async with session_slots:
+            async with self._global:
+                record_queue_wait(session_id, time.perf_counter() - queued)
+                yield
+
+    async def generate_text(self, model, prompt, session_id: str = "default", use_cache: bool = True,
+                            generation_config=None, agent: str = "", phase: str = "", template: str = "") -> str:
+        return await self._on_loop(self._generate_text(model, prompt, session_id, use_cache, generation_config,
+                                                       agent, phase, template))
+
+    async def _generate_text(self, model, prompt, session_id, use_cache, generation_config, agent, phase,
+                             template="") -> str:
+        model_name, config = _model_identity(model, generation_config)
+        key = make_cache_key(model_name, config, prompt)
+        started = time.perf_counter()
+        use_cache = use_cache and not CACHE_DISABLED
+        if use_cache:
+            # The SQLite tier commits on every hit; only the memory tier is read on the shared loop
+            cached = default_cache.get_memory(key)
+            if cached is None:
+                cached = await asyncio.to_thread(default_cache.get, key)
+            if cached is not None:
+                record_call(agent, phase, time.perf_counter() - started, cache_hit=True)
+                return cached
+
+        return await flights.do_async(key, lambda: self._call(model, prompt, key, session_id, use_cache,
+                                                               generation_config, agent, phase, started, template))
+
+    async def _call(self, model, prompt, key, session_id, use_cache, generation_config, agent, phase, started,
+                    template=""):
+        kwargs = {"generation_config": generation_config} if generation_config is not None else {}
+        called = None
+
+        async def attempt():
+            nonlocal called
+            # Backoff sleeps happen outside the slot, so a retrying call does not hold capacity
+            async with self._slot(session_id):
+                # Latency is measured from slot acquisition; queueing shows up separately as wall time
+                called = time.perf_counter()
+                return await model.generate_content_async(prompt, **kwargs)
+
+        try:
+            response = await call_with_resilience_async(attempt)
+            text = response.text
+        except Exception as e:
+            record_call(agent, phase, time.perf_counter() - (called or started), error=type(e).__name__)
+            raise
+        elapsed = time.perf_counter() - called
+        record_call(agent, phase, elapsed, ttft=elapsed, **usage_tokens(response))
+        if use_cache:
+            await asyncio.to_thread(default_cache.put, key, text, template)
+        return text
+
+    def stream_text(self, model, prompt, session_id: str = "default", use_cache: bool = True,
+                    generation_config=None, agent: str = "", phase: str = "", template: str = ""):
+        """
+        Blocking generator of response text chunks for synchronous callers (e.g. `st.write_stream`).
+        The stream runs on the client loop and holds one of the session's slots until it ends;
+        a cache hit is replayed as a single chunk.
+        """
+        model_name, config = _model_identity(model, generation_config)
+        key = make_cache_key(model_name, config, prompt)
+        started = time.perf_counter()
+        use_cache = use_cache and not CACHE_DISABLED
+        if use_cache:
+            cached = default_cache.get(key)
+            if cached is not None:
+                record_call(agent, phase, time.perf_counter() - started, ttft=time.perf_counter() - started, cache_hit=True)
+                yield cached
+                return
+
+        def produce():
+            chunks = queue.Queue()
+            future = self.submit(self._stream(model, prompt, session_id, generation_config, agent, phase, started,
+                                              chunks))
+            try:
+                for text in iter(chunks.get, None):
+                    yield text
+            except GeneratorExit:
+                # Our consumer went away (e.g. a Streamlit rerun): stop the upstream stream and free the slot
+                future.cancel()
+                raise
+            text = "".join(future.result())
+            # Only a stream that ran to completion is worth caching
+            if use_cache:
+                default_cache.put(key, text, template=template)
+
+        # Shares in-flight streams with `stream_text` above
+        yield from flights.stream("stream:" + key, produce)
+
+    async def _stream(self, model, prompt, session_id, generation_config, agent, phase, started,
+                      out: queue.Queue) -> list:
+        kwargs = {"generation_config": generation_config} if generation_config is not None else {}
+        texts, ttft, usage, called = [], None, {}, None
+
+        async def open_stream():
+            nonlocal called
+            # Retries are only safe until the first chunk; the slot is then held for the whole stream
+            stack = AsyncExitStack()
+            await stack.enter_async_context(self._slot(session_id))
+            try:
+                called = time.perf_counter()
+                stream = (await model.generate_content_async(prompt, stream=True, **kwargs)).__aiter__()
+                try:
+                    first = [await stream.__anext__()]
+                except StopAsyncIteration:
+                    first, stream = [], None
+            except BaseException:
+                await stack.aclose()
+                raise
+            return stack, first, stream
+
+        def handle(chunk):
+            nonlocal ttft, usage
+            text = getattr(chunk, "text", "")
+            # usage_metadata is complete on the last chunk
+            usage = usage_tokens(chunk) or usage
+            if text:
+                if ttft is None:
+                    ttft = time.perf_counter() - called
+                texts.append(text)
+                out.put(text)
+
+        try:
+            stack, first, stream = await call_with_resilience_async(open_stream)
+            async with stack:
+                for chunk in first:
+                    handle(chunk)
+                if stream is not None:
+                    async for chunk in stream:
+                        handle(chunk)
+        except Exception as e:
+            record_call(agent, phase, time.perf_counter() - (called or started), ttft=ttft, error=type(e).__name__)
+            raise
+        finally:
+            out.put(None)
+        record_call(agent, phase, time.perf_counter() - called, ttft=ttft, **usage)
+        return texts
+
+
+async_client = AsyncLLMClient()
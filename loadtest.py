@@ -0,0 +1,205 @@
+"""
+Offline load test: drive N simulated users through the seven-agent flow against the fake
+Gemini backend and report per-rerun latency, LLM queue wait and memory per session.
+
+    python loadtest.py --users 20 --latency lognormal:1.5,0.6 --ttft const:0.4
+    python loadtest.py --users 5 --mode apptest     # full app.py reruns via Streamlit's AppTest
+    python loadtest.py --users 10 --qa-mode compare # conversational vs questionnaire Q&A
+
+`--mode api` replays the UI's call sequence directly against the orchestrator (one awaited
+call per rerun); `--mode apptest` runs the real app script, so each measured step is a
+complete Streamlit rerun.
+"""
+import argparse
+import asyncio
+import os
+import pickle
+import statistics
+import threading
+import time
+
+os.environ.setdefault("LLM_BACKEND", "fake")
+
+import fake_backend
+import llm_client
+import metrics
+import resilience
+from fake_backend import FakeGenerativeModel
+from llm_client import async_client, set_backend
+from orchestrator import (SATISFIED, evaluate_questionnaire_async, generate_agent_output_async,
+                          get_agent_questions_async, is_satisfied, opening_spec, reason_with_agent_async, snapshot_state)
+from pipeline import AGENTS, upstream_context
+
+MAX_TURNS = 9
+
+
+def _percentiles(values: list) -> dict:
+    if not values:
+        return {"n": 0}
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+    return {"n": len(values), "mean": statistics.fmean(values), "p50": pick(0.5), "p95": pick(0.95), "max": values[-1]}
+
+
+def session_bytes(session_state: dict) -> int:
+    """Approximate memory held by one session: the pickled size of its state."""
+    picklable = {}
+    for key, value in session_state.items():
+        try:
+            pickle.dumps(value)
+            picklable[key] = value
+        except Exception:
+            continue
+    return len(pickle.dumps(picklable))
+
+
+async def conversational_qa(agent: str, session: dict, context_inputs: dict, steps: list) -> int:
+    """One reason call per answer until the agent is satisfied; returns the round trips."""
+    for turn in range(1, MAX_TURNS + 1):
+        started = time.perf_counter()
+        question = await reason_with_agent_async(agent, snapshot_state(agent, session), use_cache=False,
+                                                 **context_inputs)
+        steps.append(("reason", time.perf_counter() - started))
+        session[f"{agent}_history"].append({"role": "ai", "content": question})
+        if is_satisfied(question):
+            break
+        session[f"{agent}_history"].append({"role": "user", "content": "yes"})
+    return turn
+
+
+async def questionnaire_qa(agent: str, session: dict, context_inputs: dict, steps: list) -> int:
+    """The question set in one call, every answer "yes", one evaluation call; returns the round trips."""
+    started = time.perf_counter()
+    questions = await get_agent_questions_async(agent, session[f"{agent}_spec"], False, session["session_id"],
+                                                **context_inputs)
+    steps.append(("questions", time.perf_counter() - started))
+    round_trips = 1
+    for qa_round in (1, 2):
+        for question in questions:
+            session[f"{agent}_history"] += [{"role": "ai", "content": question}, {"role": "user", "content": "yes"}]
+        if qa_round == 2 or not questions:
+            break
+        started = time.perf_counter()
+        questions = await evaluate_questionnaire_async(agent, snapshot_state(agent, session), questions,
+                                                       ["yes"] * len(questions), False, **context_inputs)
+        steps.append(("evaluate", time.perf_counter() - started))
+        round_trips += 1
+    session[f"{agent}_history"].append({"role": "ai", "content": SATISFIED})
+    return round_trips
+
+
+async def simulate_user(user_id: int, steps: list, qa_mode: str = "conversational") -> int:
+    """Click through every agent like a user answering "yes"; returns the session's size in bytes."""
+    session = {"session_id": f"loadtest-{user_id}"}
+    for index, agent in enumerate(AGENTS):
+        spec = f"Load test spec #{user_id}: build an order tracking portal" if index == 0 \
+            else opening_spec(agent)
+        session[f"{agent}_spec"] = spec
+        session[f"{agent}_history"] = [{"role": "user", "content": spec}] if index == 0 else []
+        context_inputs = upstream_context(agent, session)
+
+        started = time.perf_counter()
+        run_qa = questionnaire_qa if qa_mode == "questionnaire" else conversational_qa
+        round_trips = await run_qa(agent, session, context_inputs, steps)
+        metrics.record_qa(agent, qa_mode, round_trips, time.perf_counter() - started)
+
+        started = time.perf_counter()
+        output = await generate_agent_output_async(agent, snapshot_state(agent, session), use_cache=False,
+                                                   **context_inputs)
+        steps.append(("output", time.perf_counter() - started))
+        session[f"{agent}_output"] = output["text"]
+        session[f"{agent}_history"].append({"role": "ai", "content": output["text"]})
+    return session_bytes(session)
+
+
+async def run_api(users: int, ramp: float, steps: list, qa_mode: str = "conversational") -> list:
+    async def delayed(user_id):
+        await asyncio.sleep(ramp * user_id / max(users, 1))
+        return await simulate_user(user_id, steps, qa_mode)
+    return await asyncio.gather(*(delayed(i) for i in range(users)))
+
+
+def apptest_user(user_id: int, steps: list, sizes: list, timeout: float):
+    """Drive app.py through AppTest; every timed `run()` is one full script rerun."""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file("app.py", default_timeout=timeout)
+
+    def rerun(label, action):
+        started = time.perf_counter()
+        action()
+        steps.append((label, time.perf_counter() - started))
+
+    rerun("initial", at.run)
+    for index, agent in enumerate(AGENTS):
+        if index == 0:
+            rerun("spec", lambda: at.text_area(key=f"{agent}_spec_input").input(f"Load test spec #{user_id}").run())
+            rerun("reason", lambda: at.button(key="{key}_continue").click().run())
+        for _ in range(MAX_TURNS):
+            if not at.chat_input:
+                break
+            rerun("reason", lambda: at.chat_input[0].set_value("yes").run())
+        rerun("feedback", lambda: at.text_area(key=f"{agent}_feedback_text").input("Keep it lean.").run())
+        rerun("feedback", lambda: at.button(key="{key}_feedback_continue").click().run())
+        generate = [b for b in at.button if b.label.startswith("🚀 Generate")]
+        rerun("output", lambda: generate[0].click().run())
+        proceed = [b for b in at.button if b.label.startswith("➡️ Proceed")]
+        if proceed:
+            rerun("proceed", lambda: proceed[0].click().run())
+    sizes.append(session_bytes({key: at.session_state[key] for key in at.session_state}))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test against the fake Gemini backend.")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--mode", choices=["api", "apptest"], default="api")
+    parser.add_argument("--latency", default="lognormal:1.0,0.5", help="fake call latency distribution")
+    parser.add_argument("--ttft", default="const:0.3", help="fake time-to-first-token distribution (streaming)")
+    parser.add_argument("--rpm", type=float, default=6000, help="process-wide request rate limit (per minute)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake calls failing with 503")
+    parser.add_argument("--qa-mode", choices=["conversational", "questionnaire", "compare"], default="conversational",
+                        help="clarification mode of the simulated users (api mode); compare runs both in turn")
+    parser.add_argument("--context-cache-min-tokens", type=int, default=None,
+                        help="turn on context caching for system instructions of at least this many tokens")
+    parser.add_argument("--ramp", type=float, default=0.0, help="seconds over which users arrive")
+    parser.add_argument("--timeout", type=float, default=120.0, help="AppTest per-rerun timeout")
+    args = parser.parse_args(argv)
+
+    set_backend(lambda name, **kw: FakeGenerativeModel(name, latency=args.latency, ttft=args.ttft,
+                                                                error_rate=args.error_rate, **kw))
+    resilience.rate_limiter = resilience.TokenBucket(args.rpm, burst=max(args.rpm / 60, 1))
+    if args.context_cache_min_tokens is not None:
+        llm_client.context_cache.enabled = True
+        llm_client.context_cache.min_tokens = args.context_cache_min_tokens
+    steps, sizes = [], []
+    started = time.perf_counter()
+    if args.mode == "api":
+        qa_modes = ["conversational", "questionnaire"] if args.qa_mode == "compare" else [args.qa_mode]
+        for qa_mode in qa_modes:
+            sizes += async_client.run(run_api(args.users, args.ramp, steps, qa_mode))
+    else:
+        threads = [threading.Thread(target=apptest_user, args=(i, steps, sizes, args.timeout)) for i in range(args.users)]
+        for i, thread in enumerate(threads):
+            thread.start()
+            time.sleep(args.ramp / max(args.users, 1))
+        for thread in threads:
+            thread.join()
+    wall = time.perf_counter() - started
+
+    print(f"Users: {args.users} ({args.mode} mode), wall time {wall:.1f}s, "
+          f"{args.users / wall * 60:.1f} pipelines/min")
+    for label in sorted({label for label, _ in steps}):
+        print(f"  rerun latency [{label:8}] {_percentiles([s for l, s in steps if l == label])}")
+    print(f"  LLM queue wait           {_percentiles([w['seconds'] for w in metrics.recent_queue_waits])}")
+    print(f"  session state bytes      {_percentiles(sizes)}")
+    print(f"  retries                  {dict(metrics.retries_total.series)}")
+    print(f"  bytes sent               {fake_backend.bytes_summary()}")
+    for row in metrics.qa_summary_rows():
+        print(f"  Q&A [{row['mode']:14}] {row['qa_sessions']} agent Q&As, "
+              f"{row['round_trips_mean']:.1f} round trips (p95 {row['round_trips_p95']}), "
+              f"wall p50 {row['p50_s']:.3f}s p95 {row['p95_s']:.3f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,96 @@
+import atexit
+import datetime
+import hashlib
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+LOG_PATH = os.environ.get("LOG_SINK_PATH", "")  # empty → stdout
+PROMPT_SAMPLE_RATE = float(os.environ.get("LOG_PROMPT_SAMPLE_RATE", "0.0"))
+
+
+class JsonLogSink:
+    """
+    Non-blocking structured log sink.
+
+    `log()` only enqueues a dict; a daemon thread drains the queue and writes JSON lines
+    in batches (every `batch_size` records or `flush_interval` seconds), so the Streamlit
+    script thread never waits on console or file I/O. When the queue is full, records are
+    dropped and counted instead of blocking the caller.
+    """
+
+    def __init__(self, path: str = LOG_PATH, prompt_sample_rate: float = PROMPT_SAMPLE_RATE,
+                 max_queue: int = 10000, batch_size: int = 200, flush_interval: float = 0.5):
+        self.path = path
+        self.prompt_sample_rate = prompt_sample_rate
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def log(self, event: str, **fields):
+        record = {"ts": datetime.datetime.now().isoformat(timespec="milliseconds"), "event": event, **fields}
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def log_prompt(self, event: str, prompt, **fields):
+        """Log a prompt as hash + size; the full body only for a sampled fraction of calls."""
+        body = prompt if isinstance(prompt, str) else json.dumps(prompt, ensure_ascii=False, default=str)
+        fields["prompt_sha256"] = hashlib.sha256(body.encode("utf-8")).hexdigest()[:16]
+        fields["prompt_chars"] = len(body)
+        if self.prompt_sample_rate > 0 and random.random() < self.prompt_sample_rate:
+            fields["prompt"] = body
+        self.log(event, **fields)
+
+    def flush(self, timeout: float = 2.0):
+        """Wait (bounded) until queued records are written, e.g. at process exit."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="json-log-sink", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.flush)
+
+    def _run(self):
+        out = open(self.path, "a", encoding="utf-8") if self.path else sys.stdout
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            lines = [json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in batch]
+            if self.dropped:
+                lines.append(json.dumps({"event": "log_sink.dropped", "count": self.dropped}) + "\n")
+                self.dropped = 0
+            try:
+                out.write("".join(lines))
+                out.flush()
+            except Exception:
+                pass
+            for _ in batch:
+                self._queue.task_done()
+
+
+default_sink = JsonLogSink()
+log_event = default_sink.log
+log_prompt = default_sink.log_prompt
@@ -0,0 +1,264 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from log_sink import log_event
+
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9464"))
+# Loopback by default; containers set 0.0.0.0 so kubelet / load-balancer probes can reach /ready
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 90, 120, float("inf"))
+TOKEN_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, float("inf"))
+ROUND_TRIP_BUCKETS = (1, 2, 3, 4, 6, 9, 12, float("inf"))
+QA_BUCKETS = (10, 30, 60, 120, 300, 600, 1200, float("inf"))  # Q&A wall time includes the user's typing
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple):
+        self.name, self.help_text, self.buckets = name, help_text, buckets
+        self.series = {}  # labels tuple -> [bucket counts..., sum, count]
+
+    def observe(self, labels: tuple, value: float):
+        series = self.series.setdefault(labels, [0] * len(self.buckets) + [0.0, 0])
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self, label_names: tuple) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self.series.items()):
+            base = _labels(label_names, labels)
+            for bound, count in zip(self.buckets, series):
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{base},le="{le}"}} {count}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-2]}")
+            lines.append(f"{self.name}_count{{{base}}} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name, self.help_text = name, help_text
+        self.series = {}
+
+    def inc(self, labels: tuple, value: float = 1):
+        self.series[labels] = self.series.get(labels, 0) + value
+
+    def render(self, label_names: tuple) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.series.items()):
+            lines.append(f"{self.name}{{{_labels(label_names, labels)}}} {value}")
+        return lines
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    return ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+
+
+_lock = threading.Lock()
+CALL_LABELS = ("agent", "phase", "cache", "error")
+PHASE_LABELS = ("agent", "phase")
+
+calls_total = Counter("sdlc_llm_calls_total", "Model calls by agent, phase, cache result and error class.")
+latency_seconds = Histogram("sdlc_llm_latency_seconds", "Wall time of a model call.", LATENCY_BUCKETS)
+ttft_seconds = Histogram("sdlc_llm_ttft_seconds", "Time to first token (equals latency for non-streamed calls).", LATENCY_BUCKETS)
+prompt_tokens = Histogram("sdlc_llm_prompt_tokens", "Prompt tokens per call (usage_metadata).", TOKEN_BUCKETS)
+response_tokens = Histogram("sdlc_llm_response_tokens", "Response tokens per call (usage_metadata).", TOKEN_BUCKETS)
+tokens_total = Counter("sdlc_llm_tokens_total", "Tokens spent by agent, phase and kind (prompt/response).")
+
+queue_wait_seconds = Histogram("sdlc_llm_queue_wait_seconds", "Time a call waited for an async client slot.", LATENCY_BUCKETS)
+retries_total = Counter("sdlc_llm_retries_total", "Retried model calls by error kind (rate_limited/transient).")
+coalesced_total = Counter("sdlc_llm_coalesced_total", "Requests served by attaching to an identical in-flight call.")
+speculation_total = Counter("sdlc_llm_speculation_total", "Speculative next-question calls by agent and outcome (started/hit/miss).")
+circuit_transitions_total = Counter("sdlc_llm_circuit_transitions_total", "Circuit breaker state changes by new state.")
+breaker_state = "closed"
+qa_round_trips = Histogram("sdlc_qa_round_trips", "Model round trips per agent Q&A, by clarification mode.", ROUND_TRIP_BUCKETS)
+qa_seconds = Histogram("sdlc_qa_seconds", "Wall time from an agent's first clarification call to the end of its Q&A.", QA_BUCKETS)
+
+# Raw recent calls for the admin page (exact percentiles over a sliding window)
+recent_calls = deque(maxlen=5000)
+recent_queue_waits = deque(maxlen=5000)
+recent_qa = deque(maxlen=1000)
+
+
+def usage_tokens(response) -> dict:
+    """Prompt/response token counts from a Gemini response's usage_metadata, if present."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return {}
+    return {"prompt_tokens_count": getattr(usage, "prompt_token_count", None),
+            "response_tokens_count": getattr(usage, "candidates_token_count", None)}
+
+
+def record_call(agent: str, phase: str, latency: float, ttft: float = None, prompt_tokens_count: int = None,
+                response_tokens_count: int = None, cache_hit: bool = False, error: str = None):
+    agent, phase = agent or "unknown", phase or "unknown"
+    with _lock:
+        calls_total.inc((agent, phase, "hit" if cache_hit else "miss", error or "none"))
+        latency_seconds.observe((agent, phase), latency)
+        if ttft is not None:
+            ttft_seconds.observe((agent, phase), ttft)
+        if prompt_tokens_count:
+            prompt_tokens.observe((agent, phase), prompt_tokens_count)
+            tokens_total.inc((agent, phase, "prompt"), prompt_tokens_count)
+        if response_tokens_count:
+            response_tokens.observe((agent, phase), response_tokens_count)
+            tokens_total.inc((agent, phase, "response"), response_tokens_count)
+        recent_calls.append({"time": time.time(), "agent": agent, "phase": phase, "latency": latency,
+                             "ttft": ttft, "prompt_tokens": prompt_tokens_count or 0,
+                             "response_tokens": response_tokens_count or 0, "cache_hit": cache_hit,
+                             "error": error or ""})
+
+
+def record_queue_wait(session_id: str, seconds: float):
+    with _lock:
+        queue_wait_seconds.observe(("all",), seconds)
+        recent_queue_waits.append({"time": time.time(), "session": session_id, "seconds": seconds})
+
+
+def record_retry(kind: str):
+    with _lock:
+        retries_total.inc((kind,))
+
+
+def record_coalesced(mode: str):
+    with _lock:
+        coalesced_total.inc((mode,))
+
+
+def record_speculation(agent: str, outcome: str, count: int = 1):
+    with _lock:
+        speculation_total.inc((agent or "unknown", outcome), count)
+
+
+def record_breaker_state(state: str):
+    global breaker_state
+    with _lock:
+        breaker_state = state
+        circuit_transitions_total.inc((state,))
+
+
+def record_qa(agent: str, mode: str, round_trips: int, seconds: float):
+    agent = agent or "unknown"
+    with _lock:
+        qa_round_trips.observe((agent, mode), round_trips)
+        qa_seconds.observe((agent, mode), seconds)
+        recent_qa.append({"time": time.time(), "agent": agent, "mode": mode, "round_trips": round_trips,
+                          "seconds": seconds})
+
+
+def render_prometheus() -> str:
+    with _lock:
+        lines = calls_total.render(CALL_LABELS)
+        for histogram in (latency_seconds, ttft_seconds, prompt_tokens, response_tokens):
+            lines += histogram.render(PHASE_LABELS)
+        lines += tokens_total.render(("agent", "phase", "kind"))
+        lines += queue_wait_seconds.render(("pool",))
+        lines += retries_total.render(("kind",))
+        lines += coalesced_total.render(("mode",))
+        lines += speculation_total.render(("agent", "outcome"))
+        lines += circuit_transitions_total.render(("state",))
+        lines += qa_round_trips.render(("agent", "mode"))
+        lines += qa_seconds.render(("agent", "mode"))
+        lines += ["# HELP sdlc_llm_circuit_open 1 while the model circuit breaker is open.",
+                  "# TYPE sdlc_llm_circuit_open gauge",
+                  f"sdlc_llm_circuit_open {int(breaker_state == 'open')}"]
+    return "\n".join(lines) + "\n"
+
+
+def _percentile(values: list, q: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def summary_rows() -> list:
+    """Per agent/phase aggregates over the recent window, for the admin page."""
+    with _lock:
+        calls = list(recent_calls)
+    groups = {}
+    for call in calls:
+        groups.setdefault((call["agent"], call["phase"]), []).append(call)
+    rows = []
+    for (agent, phase), items in sorted(groups.items()):
+        latencies = [c["latency"] for c in items]
+        rows.append({"agent": agent, "phase": phase, "calls": len(items),
+                     "cache_hits": sum(c["cache_hit"] for c in items),
+                     "errors": sum(bool(c["error"]) for c in items),
+                     "p50_s": _percentile(latencies, 0.5), "p95_s": _percentile(latencies, 0.95),
+                     "p95_ttft_s": _percentile([c["ttft"] for c in items if c["ttft"] is not None], 0.95),
+                     "prompt_tokens": sum(c["prompt_tokens"] for c in items),
+                     "response_tokens": sum(c["response_tokens"] for c in items)})
+    return rows
+
+
+def qa_summary_rows() -> list:
+    """Round trips and wall time of recent agent Q&As per clarification mode, for the admin page."""
+    with _lock:
+        sessions = list(recent_qa)
+    modes = {}
+    for qa in sessions:
+        modes.setdefault(qa["mode"], []).append(qa)
+    return [{"mode": mode, "qa_sessions": len(items),
+             "round_trips_mean": sum(q["round_trips"] for q in items) / len(items),
+             "round_trips_p95": _percentile([q["round_trips"] for q in items], 0.95),
+             "p50_s": _percentile([q["seconds"] for q in items], 0.5),
+             "p95_s": _percentile([q["seconds"] for q in items], 0.95)}
+            for mode, items in sorted(modes.items())]
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/ready":
+            self._ready()
+            return
+        if path not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _ready(self):
+        """Readiness probe: 200 once the LLM client has warmed up, 503 before or on error."""
+        from llm_client import client_status  # imported late, llm_client itself imports metrics
+        status = client_status()
+        body = json.dumps(status).encode("utf-8")
+        self.send_response(200 if status["state"] == "ready" else 503)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_attempted = False
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = METRICS_HOST):
+    """Serve /metrics and /ready on a daemon thread; safe to call on every Streamlit rerun."""
+    global _server, _server_attempted
+    with _lock:
+        if _server_attempted or port <= 0:
+            return _server
+        _server_attempted = True
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            # Another process (e.g. a second Streamlit worker) already owns the port
+            log_event("metrics.server_not_started", host=host, port=port, error=str(e))
+            return None
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+    return _server
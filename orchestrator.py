@@ -1,13 +1,17 @@
-import google.generativeai as genai
-from PIL import Image
-import io
-import datetime
+import asyncio
+import json
+import os
+import time
+from llm_client import MODEL_NAME, async_client, cached_call, estimate_tokens, get_model
+from conversation import AgentConversation
+from log_sink import log_event, log_prompt
+from handoff import cached_digest, digest_prompt, fits, plan_handoff, store_digest
+from llm_cache import make_cache_key
+from metrics import record_qa, record_speculation
+from prompt_templates import templates
+from qa_state import qa_state
 
-with open("keys/.gemini_key", "r") as f:
-    genai.configure(api_key=f.read().strip())
-
-model = genai.GenerativeModel("gemini-1.5-flash")
-visual_model = genai.GenerativeModel("gemini-1.5-flash")
+# 🔑 The Gemini client is configured lazily by llm_client on the first model call
 
 AGENT_FEEDBACK_LIBRARY = {
     "Designer": [
@@ -89,262 +93,416 @@ AGENT_FEEDBACK_LIBRARY = {
     ]
 }
 
-def get_agent_questions(agent_key: str, user_input: str, **context_inputs) -> list:
-    # 🔍 Step 1: Combine inputs
-    context_summary = "\n".join(
-        [f"{key.replace('_output', '').title()} Output:\n{value}" for key, value in context_inputs.items()]
-    )
-    questionPromptDict = {
-        "Estimator": f"""
-You are  a pragmatic cost estimator who specializes in forecasting budget and resource allocation.
-Given the idea 
-📋 Input: \n{user_input}\n
-📥 and Upstream Context: \n{context_summary}\n
-Ask meaninful clarifying questions to clarify budget, resource assumptions, team capacity and delivery constraints, that would help you do the estimation for the requirements.
-Be precise, cost-sensitive, and anticipate risk. Avoid technical implementation details. 
-Ask questions around onsite offshore resource distribution, technology considerations, cloud technology, the designations of the resources, buffer capacity etc.
-Ask questions around resource location [US/UK/Europe/India/Other], designation [(designations high to low order: Director, Associate Director, Senior Manager, Manager, Senior Associate, Associate, Analyst)], bill rate and cost rates.
-Make sure the questions are relevant to the given spec and required for effort estimation, do not assume anything; return questions in plain text, each on its own line.
-Try to form the questions with yes/no or 1 line answer.""",
-        "Analyst": f"""
-You are senior business analyst who excels in aligning stakeholder goals with system requirements. Speak empathetically and systemically.
-Given the idea 
-📋 Input: \n{user_input}\n
-📥 and Upstream Context: \n{context_summary}\n
-Ask meaninful clarifying questions to clarify stakeholder goals, KPIs, business and data rules, data quality, and regulatory concerns that would help you build the features, epics, and stories as requirements.
-Ask questions around sources, destinations, data modelling, data integration, and data rules.
-Make sure the questions are relevant to the given spec and required for building specification, do not assume anything; return questions in plain text, each on its own line.
-Try to form the questions with yes/no or 1 line answer.""",
-        "Designer": f"""
-You are senior architect who loves designing scalable systems with clean boundaries. 
-Given the idea 
-📋 Input: \n{user_input}\n
-📥 and Upstream Context: \n{context_summary}\n
-Ask meaninful clarifying questions to clarify technical constraints, scalability, and integration needs that would help you build the design for the requirements.
-Ask questions around source and destination specification, technology requirements, technical landscape, and any tech constraints.
-Make sure the questions are relevant to the given spec, do not assume anything; return questions in plain text, each on its own line.
-Try to form the questions with yes/no or 1 line answer.""",
-        "Coder": f"""
-You are a full-stack developer who cares about efficiency, tooling, and implementation clarity. Be concise and technically grounded.
-Given the idea 
-📋 Input: \n{user_input}\n
-📥 and Upstream Context: \n{context_summary}\n
-Ask clarifying questions to identify technology stacks, integration risks, third-party dependencies, and coding expectations.
-Try to form the questions with yes/no or 1 line answer.""",
-        "Reviewer": f"""
-You are a meticulous technical reviewer who catches inconsistencies and blind spots in design. Be direct and diagnostic.
-Given the idea 
-📋 Input: \n{user_input}\n
-📥 and Upstream Context: \n{context_summary}\n
-Ask 1 question relevant for reviewing the code. 
-Try to form the questions with yes/no or 1 line answer.""",
-        "Tester": f""" 
-You are a methodical QA tester and QA automation engineer who anticipates edge cases before users ever find them. 
-Be skeptical and scenario-driven.
-Given the idea 
-📋 Input: \n{user_input}\n
-📥 and Upstream Context: \n{context_summary}\n
-Ask clarifying questions relevant for generating the test case. 
-Try to form the questions with yes/no or 1 line answer.""",
-        "Deployer": f""" 
-You are a reliable deployment engineer who ensures smooth releases and rollback readiness. 
-Focus on launch continuity and uptime resilience.
-Given the idea 
-📋 Input: \n{user_input}\n
-📥 and Upstream Context: \n{context_summary}\n
-Ask questions relevant for generating the deployment plan. 
-Try to form the questions with yes/no or 1 line answer."""
-    }
-    print("#########################################################################")
-    print(f"{datetime.datetime.now()} ----- {agent_key} agent is thinking of clarification questions.")
-    questions = model.generate_content(questionPromptDict[agent_key]).text.strip().split("\n")
-    print(f"{datetime.datetime.now()} ----- {agent_key} agent finished thinking. Found {len(questions)} questions")
-    print("-------------------------------------------------------------------------")
-    return [q.strip("-• ") for q in questions if q]
-
-
-def reason_with_agent(agent_name: str, session_state, **context_inputs) -> str:
-    # 🔍 Step 1: Combine inputs
-    context_summary = "\n".join(
+def get_agent_questions(agent_key: str, user_input: str, use_cache: bool = True, session_id: str = "default",
+                        **context_inputs) -> list:
+    return run_sync(get_agent_questions_async(agent_key, user_input, use_cache, session_id, **context_inputs))
+
+async def get_agent_questions_async(agent_key: str, user_input: str, use_cache: bool = True,
+                                    session_id: str = "default", **context_inputs) -> list:
+    # 🔍 Step 1: Combine inputs; only this agent's template is rendered
+    context_summary = _context_summary(await _handoff_async(agent_key, context_inputs, session_id))
+    prompt = templates.render("questions", agent_key, user_input=user_input, context_summary=context_summary)
+    prompt += "\n" + (QUESTIONS_FORMAT if STRUCTURED_OUTPUT else FREE_TEXT_QUESTIONS_FORMAT)
+    log_prompt("agent.questions.start", prompt, agent=agent_key)
+    reply = await async_client.generate_text(get_model(), prompt, session_id=session_id, use_cache=use_cache,
+                                             generation_config=json_config(QUESTIONS_SCHEMA), agent=agent_key,
+                                             phase="questions", template=templates.fingerprint(agent_key, "questions"))
+    questions = parse_questions(reply)
+    log_event("agent.questions.done", agent=agent_key, questions=len(questions))
+    return questions
+
+
+def is_satisfied(message: str) -> bool:
+    """True when an agent reply ends the Q&A (the prompt spells it both "satisfied" and "satified")."""
+    text = (message or "").strip().lower()
+    return text.startswith("i am satisfied") or text.startswith("i am satified")
+
+def opening_spec(agent_name: str) -> str:
+    """Spec of a downstream agent, whose real input is the upstream context."""
+    return f"Generate {agent_name} agent output based on the following questionnaire"
+
+def _session_id(session_state) -> str:
+    return session_state.get("session_id", "default")
+
+def snapshot_state(agent_name: str, session_state) -> dict:
+    """Plain-dict copy of the keys an agent call reads, safe to hand to another thread or event loop."""
+    snapshot = {"session_id": _session_id(session_state)}
+    for suffix in ("spec", "output", "user_feedback"):
+        snapshot[f"{agent_name}_{suffix}"] = session_state.get(f"{agent_name}_{suffix}", "")
+    snapshot[f"{agent_name}_history"] = list(session_state.get(f"{agent_name}_history", []))
+    # The conversation object is shared (not copied) so the turns it records survive the call
+    conversation_key = f"{agent_name}_conversation"
+    if session_state.get(conversation_key) is None:
+        session_state[conversation_key] = AgentConversation(agent_name)
+    snapshot[conversation_key] = session_state[conversation_key]
+    # The budget is copied: it is re-synced from the session's history on the next call anyway
+    snapshot[f"{agent_name}_qa_state"] = qa_state(agent_name, session_state).fork()
+    return snapshot
+
+def _context_summary(context_inputs: dict) -> str:
+    return "\n".join(
         [f"{key.replace('_output', '').title()} Output:\n{value}" for key, value in context_inputs.items()]
     )
-    spec = session_state[f"{agent_name}_spec"]
 
-    history = session_state.get(f"{agent_name}_history", [])
-    # Format chat history for Gemini
-    transcript = ""
-    for msg in history:
-        prefix = "User:" if msg["role"] == "user" else f"{agent_name.title()} Agent:"
-        transcript += f"{prefix} {msg['content']}\n"
-    
-    action = f""" Given the specification \n{spec}\n and conversation: \n{transcript}\n and Upstream Context: \n{context_summary}\n
-Evaluate the latest user reply. Decide whether to:
+# 🗣️ Static Q&A rules; they travel once in the system instruction instead of on every turn
+REASON_RULES = """Evaluate the latest user reply. Decide whether to:
 - Ask a followup question to clarify an user input to gather more details around the response if it is not clear.
-- Ask a original new relevant question to get more information based on the spec {spec} 
+- Ask a original new relevant question to get more information based on the specification.
 - Or, if satisfied, return a string "I AM SATISFIED"
 Form your question on some assumption, and ask user to respond in yes/no so that user is not frustrated by the information requested.
 Try to validate the assumptions, and when you are ready, stop. 
 When you ask a new relevant question, put a marker "[N]" to the end so that you can identify it as a new relevant question later in the transcript.
 When you ask a followup clarification question, put a marker "[C]" at the end so that you can identify it as a followup clarification question later in the transcript. 
 For followup questions [C], take cure from the user answer of the original question [N].
-Please refer to the transcript to check marker to ensure that the agent has not asked more than 2 followup clarification questions [C] for a single new relevant question [N].
-Form the conversation like 1 new original question followed by 0-2 followup questions.
-Do not ask more than 3 new [N] questions.
-Based on your evaluation, just send 1 question at a time, or send the string 'I am satified' """
-
-    qpDict = {
-        "Estimator": f"""
-You are  a pragmatic cost estimator who specializes in forecasting budget and resource allocation.
-Be precise, cost-sensitive, and anticipate risk. Avoid technical implementation details. 
-You should know about budget, resource assumptions, team capacity and delivery constraints, onsite offshore resource distribution, technology considerations, cloud technology, the designations of the resources, buffer capacity etc.
-You should also know about resource location [US/UK/Europe/India/Other], designation [(designations high to low order: Director, Associate Director, Senior Manager, Manager, Senior Associate, Associate, Analyst)], bill rate and cost rates.""",
-        "Analyst": f"""
-You are senior business analyst who excels in aligning stakeholder goals with system requirements. Speak empathetically and systemically.
-You should know about stakeholder goals, KPIs, business and data rules, data quality, and regulatory concerns that would help you build the features, epics, and stories as requirements.
-You should also know about sources, destinations, data modelling, data integration, and data rules.""",
-        "Designer": f"""
-You are senior architect who loves designing scalable systems with clean boundaries. 
-You should know about technical constraints, scalability, and integration needs that would help you build the design for the requirements.
-You should also know about source and destination specification, technology requirements, technical landscape, and any tech constraints.""",
-        "Coder": f"""
-You are a full-stack developer who cares about efficiency, tooling, and implementation clarity. Be concise and technically grounded.
-You should know about technology stacks, integration risks, third-party dependencies, and coding expectations.""",
-        "Reviewer": f"""
-You are a meticulous technical reviewer who catches inconsistencies and blind spots in design. Be direct and diagnostic.""",
-        "Tester": f""" 
-You are a methodical QA tester and QA automation engineer who anticipates edge cases before users ever find them. 
-Be skeptical and scenario-driven. You should know about all the details for generating the test case.""",
-        "Deployer": f""" 
-You are a reliable deployment engineer who ensures smooth releases and rollback readiness. Focus on launch continuity and uptime resilience."""
-    }
-    prompt = f"{qpDict[agent_name] }\n{action}"
-    print("#########################################################################")
-    print(f"{datetime.datetime.now()} ----- {agent_name} agent is thinking of further questions based on prompt {prompt}")
-    question = model.generate_content(prompt).text.strip()
-    print(f"{datetime.datetime.now()} ----- {agent_name} agent has thought of this question: {question}")
-    print("-------------------------------------------------------------------------")
+Form the conversation like 1 new original question followed by its followup questions, within the question budget given with the user reply.
+Based on your evaluation, just send 1 question at a time, or send the string 'I AM SATISFIED' """
+
+# 🧾 Structured (schema-constrained JSON) responses; STRUCTURED_OUTPUT=0 falls back to free text
+STRUCTURED_OUTPUT = os.environ.get("STRUCTURED_OUTPUT", "1") != "0"
+SATISFIED = "I AM SATISFIED"
+
+QUESTIONS_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {"questions": {"type": "ARRAY", "items": {"type": "STRING"}}},
+    "required": ["questions"],
+}
+
+DECISION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "done": {"type": "BOOLEAN", "description": "true when you are satisfied and the Q&A should end"},
+        "question": {"type": "STRING", "description": "the single next question, without marker; empty when done"},
+        "marker": {"type": "STRING", "enum": ["N", "C", ""], "description": "N = new question, C = followup clarification"},
+    },
+    "required": ["done", "question", "marker"],
+}
+
+def decision_schema(allowed_markers: list) -> dict:
+    """DECISION_SCHEMA with "marker" limited to the markers the question budget still allows."""
+    marker = dict(DECISION_SCHEMA["properties"]["marker"], enum=[*allowed_markers, ""])
+    return dict(DECISION_SCHEMA, properties=dict(DECISION_SCHEMA["properties"], marker=marker))
+
+# How the question list comes back: the "questions" array of QUESTIONS_SCHEMA, or one per line in free-text mode
+QUESTIONS_FORMAT = 'Return the questions as the items of the "questions" list, one question per item.'
+FREE_TEXT_QUESTIONS_FORMAT = "Return the questions in plain text, each on its own line."
+
+DECISION_RULES = """Answer in JSON: set "done" to true instead of writing "I AM SATISFIED"; otherwise put the question
+in "question" and its marker letter (N or C) in "marker" instead of appending "[N]"/"[C]" to the text."""
+
+ARTIFACT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "summary": {"type": "STRING"},
+        "items": {"type": "ARRAY", "items": {"type": "OBJECT", "properties": {
+            "kind": {"type": "STRING"}, "name": {"type": "STRING"}, "detail": {"type": "STRING"}},
+            "required": ["kind", "name", "detail"]}},
+        "decisions": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "constraints": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "risks": {"type": "ARRAY", "items": {"type": "STRING"}},
+    },
+    "required": ["summary", "items", "decisions", "constraints", "risks"],
+}
+
+ARTIFACT_PROMPT = """Extract a compact structured artifact from the {agent} agent output below, for downstream SDLC agents
+that will read it instead of the full document. "items" lists the concrete things the document defines
+(requirements, stories, components, modules, APIs, tasks, test cases, environments...) with "kind", "name"
+and a one-line "detail". Keep names and numbers exact; leave out prose, formatting and code bodies.
+
+{agent} Output:
+{text}"""
+
+def json_config(schema: dict):
+    """generation_config asking Gemini for JSON matching `schema` (None in free-text mode)."""
+    if not STRUCTURED_OUTPUT:
+        return None
+    return {"response_mime_type": "application/json", "response_schema": schema}
+
+def _loads(reply: str):
+    try:
+        return json.loads(reply)
+    except (TypeError, ValueError):
+        return None
+
+def parse_questions(reply: str) -> list:
+    data = _loads(reply)
+    if isinstance(data, dict) and isinstance(data.get("questions"), list):
+        return [str(q).strip() for q in data["questions"] if str(q).strip()]
+    # Free-text fallback: one question per line, bullets stripped
+    return [q.strip("-• ") for q in (reply or "").strip().split("\n") if q.strip("-• ")]
+
+def format_decision(reply: str) -> str:
+    """Chat text for a decision reply: the question with its [N]/[C] marker, or "I AM SATISFIED"."""
+    data = _loads(reply)
+    if not isinstance(data, dict) or "done" not in data:
+        return (reply or "").strip()  # free-text reply, already in chat form
+    question = str(data.get("question") or "").strip()
+    if data["done"] or not question:
+        return SATISFIED
+    marker = str(data.get("marker") or "").strip("[] ").upper()
+    return f"{question} [{marker}]" if marker in ("N", "C") else question
+
+def _artifact_text(reply: str) -> str:
+    data = _loads(reply)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")) if isinstance(data, dict) else ""
+
+def extract_artifact(agent_name: str, output: str, use_cache: bool = True, session_id: str = "default") -> str:
+    """Compact JSON artifact of an agent's output for downstream agents ("" in free-text mode)."""
+    return run_sync(extract_artifact_async(agent_name, output, session_id, use_cache))
+
+async def extract_artifact_async(agent_name: str, output: str, session_id: str = "default", use_cache: bool = True) -> str:
+    if not STRUCTURED_OUTPUT or not output:
+        return ""
+    reply = await async_client.generate_text(get_model(), ARTIFACT_PROMPT.format(agent=agent_name, text=output),
+                                             session_id=session_id, use_cache=use_cache,
+                                             generation_config=json_config(ARTIFACT_SCHEMA), agent=agent_name,
+                                             phase="artifact")
+    return _artifact_text(reply)
+
+# 📝 Clarification modes: one question per round trip, or the whole question set in a single form
+QA_MODES = {"conversational": "💬 One question at a time", "questionnaire": "📝 All questions in one form"}
+DEFAULT_QA_MODE = os.environ.get("QA_MODE", "conversational")
+QUESTIONNAIRE_FOLLOWUPS = int(os.environ.get("QUESTIONNAIRE_MAX_FOLLOWUPS", "3"))
+
+FOLLOWUP_RULES = """Evaluate the user's answers to the questionnaire below. For an answer that is unclear, contradicts
+another answer or leaves an assumption unvalidated, ask a targeted followup question, in yes/no or 1 line form.
+Ask at most {limit} followup questions, and none if the answers are sufficient."""
+
+def qa_mode(agent_name: str, session_state) -> str:
+    """The agent's clarification mode: fixed once its Q&A started, else the user's pick, else QA_MODE."""
+    mode = session_state.get(f"{agent_name}_qa_mode") or session_state.get(f"{agent_name}_qa_mode_choice")
+    return mode if mode in QA_MODES else DEFAULT_QA_MODE
+
+def count_qa_call(agent_name: str, session_state):
+    """Count one Q&A model round trip; the first one starts the Q&A clock."""
+    session_state.setdefault(f"{agent_name}_qa_started", time.time())
+    session_state[f"{agent_name}_qa_calls"] = session_state.get(f"{agent_name}_qa_calls", 0) + 1
+
+def finish_qa(agent_name: str, session_state, mode: str):
+    """Record the round trips and wall time the agent's Q&A took, per mode (once)."""
+    started = session_state.pop(f"{agent_name}_qa_started", None)
+    if started is not None:
+        record_qa(agent_name, mode, session_state.pop(f"{agent_name}_qa_calls", 0), time.time() - started)
+
+def evaluate_questionnaire(agent_name: str, session_state, questions: list, answers: list, use_cache: bool = True,
+                           **context_inputs) -> list:
+    """One call over the whole answered questionnaire; returns the followup questions ([] when satisfied)."""
+    return run_sync(evaluate_questionnaire_async(agent_name, snapshot_state(agent_name, session_state), questions,
+                                                 answers, use_cache, **context_inputs))
+
+async def evaluate_questionnaire_async(agent_name: str, session_state, questions: list, answers: list,
+                                       use_cache: bool = True, **context_inputs) -> list:
+    spec = session_state[f"{agent_name}_spec"]
+    session_id = _session_id(session_state)
+    handoff = await _handoff_async(agent_name, context_inputs, session_id)
+    system_instruction = f"""{templates.get("reason", agent_name)}
+You are clarifying the specification: \n{spec}\n
+Upstream Context: \n{_context_summary(handoff)}\n
+{FOLLOWUP_RULES.format(limit=QUESTIONNAIRE_FOLLOWUPS)}
+{QUESTIONS_FORMAT if STRUCTURED_OUTPUT else FREE_TEXT_QUESTIONS_FORMAT}"""
+    transcript = "\n".join(f"Q: {q}\nA: {a.strip() or '(no answer)'}" for q, a in zip(questions, answers))
+    log_prompt("agent.questionnaire.start", transcript, agent=agent_name, questions=len(questions))
+    reply = await async_client.generate_text(get_model(MODEL_NAME, system_instruction), transcript, session_id=session_id,
+                                             use_cache=use_cache, generation_config=json_config(QUESTIONS_SCHEMA),
+                                             agent=agent_name, phase="questionnaire")
+    followups = [q for q in parse_questions(reply) if not is_satisfied(q)][:QUESTIONNAIRE_FOLLOWUPS]
+    log_event("agent.questionnaire.done", agent=agent_name, followups=len(followups))
+    return followups
+
+def _handoff(agent_name: str, context_inputs: dict, session_id: str = "default") -> dict:
+    return run_sync(_handoff_async(agent_name, context_inputs, session_id))
+
+async def _handoff_async(agent_name: str, context_inputs: dict, session_id: str = "default") -> dict:
+    """Upstream outputs for `agent_name`, digested per consumer where they exceed its token budget."""
+    handoff, to_digest = plan_handoff(agent_name, context_inputs)
+
+    async def digest_one(key, producer, text, max_tokens):
+        digest = cached_digest(producer, agent_name, text, max_tokens)
+        if digest is None:
+            summary = await async_client.generate_text(get_model(), digest_prompt(producer, agent_name, text, max_tokens),
+                                                       session_id=session_id, agent=agent_name, phase="handoff")
+            digest = store_digest(producer, agent_name, text, max_tokens, summary)
+        handoff[key] = digest
+
+    await asyncio.gather(*(digest_one(*item) for item in to_digest))
+    return {key: handoff[key] for key in context_inputs}
+
+def _conversation(agent_name: str, session_state) -> AgentConversation:
+    conversation_key = f"{agent_name}_conversation"
+    conversation = session_state.get(conversation_key)
+    if conversation is None:
+        conversation = AgentConversation(agent_name)
+        session_state[conversation_key] = conversation
+    return conversation
+
+def _reason_request(agent_name: str, session_state, **context_inputs):
+    """Model carrying the static system instruction, plus the conversation synced with the history."""
+    spec = session_state[f"{agent_name}_spec"]
+    system_instruction = f"""{templates.get("reason", agent_name)}
+You are clarifying the specification: \n{spec}\n
+Upstream Context: \n{_context_summary(context_inputs)}\n
+{REASON_RULES}
+{DECISION_RULES if STRUCTURED_OUTPUT else ""}"""
+    conversation = _conversation(agent_name, session_state)
+    conversation.prepare(system_instruction)
+    conversation.sync(session_state.get(f"{agent_name}_history", []))
+    fits(agent_name, estimate_tokens(system_instruction) + estimate_tokens(conversation.contents()))
+    return get_model(MODEL_NAME, system_instruction), conversation
+
+def _budget_stop(agent_name: str, session_state):
+    """The question budget once it is used up (the Q&A then ends without a model call), else None."""
+    budget = qa_state(agent_name, session_state)
+    if budget.exhausted:
+        log_event("agent.reason.budget_stop", agent=agent_name, new=budget.new, followups=budget.followups)
+        return None
+    return budget
+
+def _admit(agent_name: str, budget, question: str) -> str:
+    """The model's question, or "I AM SATISFIED" when it would overshoot the budget."""
+    if is_satisfied(question) or budget.admits(question):
+        return question
+    log_event("agent.reason.budget_overshoot", agent=agent_name, new=budget.new, followups=budget.followups)
+    return SATISFIED
+
+def reason_with_agent(agent_name: str, session_state, use_cache: bool = True, **context_inputs) -> str:
+    return run_sync(reason_with_agent_async(agent_name, snapshot_state(agent_name, session_state), use_cache,
+                                            **context_inputs))
+
+async def reason_with_agent_async(agent_name: str, session_state, use_cache: bool = True, phase: str = "reason",
+                                  **context_inputs) -> str:
+    """Awaitable `reason_with_agent`, bounded by the shared async client's concurrency limits."""
+    budget = _budget_stop(agent_name, session_state)
+    if budget is None:
+        return SATISFIED
+    session_id = _session_id(session_state)
+    handoff = await _handoff_async(agent_name, context_inputs, session_id)
+    agent_model, conversation = _reason_request(agent_name, session_state, **handoff)
+    old_turns = conversation.overflow()
+    if old_turns:
+        summary = await async_client.generate_text(get_model(), conversation.summary_prompt(old_turns), session_id=session_id,
+                                                   agent=agent_name, phase="summary")
+        conversation.fold(summary, len(old_turns))
+    contents = conversation.contents(budget.budget_prompt())
+    log_prompt("agent.reason.start", contents, agent=agent_name, session=session_id, turns=len(contents),
+               est_tokens=estimate_tokens(contents))
+    question = _admit(agent_name, budget, format_decision(await async_client.generate_text(
+        agent_model, contents, session_id=session_id, use_cache=use_cache,
+        generation_config=json_config(decision_schema(budget.allowed_markers())), agent=agent_name, phase=phase,
+        template=templates.fingerprint(agent_name, "reason"))))
+    conversation.record_reply(question)
+    log_event("agent.reason.done", agent=agent_name, session=session_id, reply_chars=len(question))
     return question
 
-def generate_agent_output(agent_name: str, session_state, **context_inputs) -> dict:
-    
-    # 🔍 Step 1: Combine inputs
-    context_summary = "\n".join(
-        [f"{key.replace('_output', '').title()} Output:\n{value}" for key, value in context_inputs.items()]
-    )
+# 🔮 Speculative next question: the Q&A asks yes/no questions, so precompute both answers
+SPECULATIVE_ANSWERS = {"yes": ("yes", "y", "yeah", "yep", "sure", "correct"), "no": ("no", "n", "nope", "not really")}
 
-    # 🧠 Step 2: Format Q&A
+def normalize_answer(answer: str):
+    """'yes' / 'no' for the short replies speculation covers, None for anything else."""
+    text = (answer or "").strip().lower().rstrip(".!")
+    return next((key for key, variants in SPECULATIVE_ANSWERS.items() if text in variants), None)
+
+def speculate_replies(agent_name: str, session_state, use_cache: bool = True, **context_inputs) -> dict:
+    """
+    Start background reason calls for every speculative answer to the question on screen.
+    Each runs on its own forked conversation and question budget, so the real ones are
+    untouched until a result is adopted by `take_speculation`. Stored as
+    `{agent}_speculation` in `session_state`.
+    """
     history = session_state.get(f"{agent_name}_history", [])
-    # Format chat history for Gemini
-    transcript = ""
-    for msg in history:
-        prefix = "User:" if msg["role"] == "user" else f"{agent_name.title()} Agent:"
-        transcript += f"{prefix} {msg['content']}\n"
-
-
-    inputs = f"""Given the conversation: \n{transcript}\n and Upstream Context: \n{context_summary}\n 
-Based on the conversation and context above,"""
-
-    promptDict = {
-        "Estimator": f"""
-You are  a pragmatic cost estimator who specializes in forecasting budget and resource allocation. 
-Be precise, cost-sensitive, and anticipate risk. Avoid technical implementation details.
-{inputs} prepare an effort estimation by identifying detailed level tasks and activities.
-Create a table for simple vs medium vs complex task efforts. 
-Categorize the tasks as simple, medium, and complex jobs and assign effort at each task level and come up with the total efforts.
-Show the additional tasks related to design, design review, implementation, code review, test case preparation and review, test script preparation and review, test script execution for system integration testing and user acceptance testing and sign-off for each phases followed by go-live and hypercare.
-Include effort estimates with a proper gantt chart along with proposed timeline and weekly resource requirements for entire duration of the project and task dependency in separate tabular structures. 
-Also, please show the assumptions, dependencies, scope items, and out of scope items based on the requirements in an numbered ordered list.
-Please show the resource location and designations (Designations high to low order: Director, Associate Director, Senior Manager, Manager, Senior Associate, Associate, Analyst) and resource skills in a table.
-Please also calculate profitability based on resource bill rate and resource cost rates.
-Also include: budget breakdown and estimates, Resource allocation model, Risk factors""",
-        "Analyst": f"""
-You are senior business analyst who excels in aligning stakeholder goals with system requirements. Speak empathetically and systemically.
-{inputs} write multiple detailed software requirement specifications along with features, epics, and stories.
-Include the following details in a tabular format for each story: Title, Business Objective, Functional Requirements, Non-Functional Requirements, User Roles & Personas, Assumptions & Constraints, Success Criteria.
-Please also include stakeholder impact report that identifies KPIs, goals, workflows, and risks. Focus on clarity, alignment, and business strategy.
-Create a detailed requirement specification document with the above areas as different sections. """,
-        "Designer": f"""
-You are senior architect who loves designing scalable systems with clean boundaries. Focus on system-level clarity and trade-offs.
-{inputs} create a detailed design document with the following as different sections : 
-1. High-Level Design (component overview, responsibilities) with a high level data flow schematic diagram
-2. Low-Level Design (class/module breakdown, interfaces, system modules, integration touchpoints, )
-3. Technical Architecture Description (deployment layers, communication paths, external integrations)
-4. List of Tools, Technologies, and Frameworks
-5. Assumptions and Constraints
-6. Notes on future Scalability Considerations
-7. Data Quality considerations
-8. Data Governance considerations
-9. Infrastructure decisions
-10. Data security considerations
-Can you please also create a visual diagram to explain the architecture?""",
-        "Coder": f"""
-You are a full-stack developer who cares about efficiency, tooling, and implementation clarity. Be concise and technically grounded.
-{inputs} generate backend code for core business logic.
-Create a detailed code document with the following as different sections : 
-1. Actual code implementation (core logic with modular functions and code comments) [in Python/Java/NodeJS/PySpark]
-2. RESTful API layer (Python Flask or Java Spring Boot-based) if relevant for the design
-3. Unit test cases clubbed into the code
-4. Tech stack suggestions
-5. Tooling and framework choices
-6. Setup and build instructions
-7. Integration approach""",
-        "Reviewer": f"""
-You are a meticulous technical reviewer who catches inconsistencies and blind spots in design/code. Be direct and diagnostic.
-{inputs} review the above backend code and the conversation and provide actionable feedback:
-Create a detailed code review document with the following as different sections : 
-1. Code quality (readability, modularity, naming)
-2. Memory leaks and Performance suggestions
-3. Design inconsistencies
-4. Bug detection or logical flaws
-5. Security risks or gaps
-6. Style consistency (e.g., PEP8 or Java conventions)
-7. Scalability concerns
-8. Suggested improvements (rewrite snippets if needed)""",
-        "Tester": f"""
-You are a methodical QA tester and QA automation engineer who anticipates edge cases before users ever find them. Be skeptical and scenario-driven.
-{inputs} generate test cases and automation scripts.
-Create a detailed test case document with the following details as multiple sections or tables: 
-1. Functional Test Cases (positive & negative)
-2. Scenarios to cover
-3. Edge Case Scenarios
-4. Unit Test Snippets (Python or Java)
-5. Automation Test Script (Pytest, JUnit, or Selenium)
-6. Expected Results & Assertions
-7. Acceptance criteria
-8. Test Data Preparation Notes
-9. Test automation strategy and scripts""",
-        "Deployer": f"""
-You are a reliable deployment engineer who ensures smooth releases and rollback readiness. Focus on launch continuity and uptime resilience.
-{inputs} create a detailed code deployment document with the following as different sections : 
-1. Deployment Environment Setup (dev, staging, production)
-2. Step-by-step CI/CD workflow configuration
-3. Infrastructure (containers, cloud setup, orchestration tools) details
-4. Configuration management (e.g., Docker, Kubernetes)
-5. Rollback strategies & Monitoring
-6. Security & Compliance Notes
-7. Launch sequences
-8. Deployment checklist"""
-    }
-    
-    print("#########################################################################")
-    print(f"{datetime.datetime.now()} ----- {agent_name} agent is running... {promptDict[agent_name]} ")
-    response = model.generate_content(promptDict[agent_name])
-    print(f"{datetime.datetime.now()} ----- {agent_name} agent finished.")
-    print("-------------------------------------------------------------------------")
-    image_data = None
-    #if hasattr(response, "media"):
-    #    print(ResourceWarning.media)
-    #    for media in response.media:
-    #        if hasattr(media, "mime_type") and media.mime_type.startswith("image"):
-    #            image_bytes = media.data
-    #            image_data = Image.open(io.BytesIO(image_bytes))
-    #            break
-    return {
-        "text": response.text.strip() if hasattr(response, "text") else "",
-        "image": image_data  # Reserved for future diagram generation
-    }
-
-def create_diagram(agent_name: str, session_state: dict) -> str:
+    base = _conversation(agent_name, session_state).fork()
+    speculation = {"after": len(history), "conversation": base, "answers": {}}
+    for answer in SPECULATIVE_ANSWERS:
+        snapshot = snapshot_state(agent_name, session_state)
+        conversation = base.fork()
+        snapshot[f"{agent_name}_conversation"] = conversation
+        snapshot[f"{agent_name}_history"].append({"role": "user", "content": answer})
+        future = async_client.submit(reason_with_agent_async(agent_name, snapshot, use_cache=use_cache,
+                                                             phase="reason_speculative", **context_inputs))
+        speculation["answers"][answer] = (future, conversation, snapshot[f"{agent_name}_qa_state"])
+    session_state[f"{agent_name}_speculation"] = speculation
+    record_speculation(agent_name, "started", len(speculation["answers"]))
+    return speculation
+
+def take_speculation(agent_name: str, session_state, answer: str):
+    """
+    The precomputed next question for `answer` (adopting its conversation and question
+    budget), or None when the user said something else. Speculation that is not used is
+    cancelled either way.
+    """
+    speculation = session_state.pop(f"{agent_name}_speculation", None)
+    if not speculation:
+        return None
+    history = session_state.get(f"{agent_name}_history", [])
+    match = normalize_answer(answer) if len(history) == speculation["after"] + 1 else None
+    question = None
+    for key, (future, conversation, budget) in speculation["answers"].items():
+        if key != match:
+            future.cancel()
+            continue
+        try:
+            question = future.result()
+        except Exception as e:
+            log_event("agent.speculation.failed", agent=agent_name, error=type(e).__name__)
+            continue
+        if history[-1]["content"] != key:
+            # The model saw the canonical "yes"/"no"; keep the user's own words ("Yeah") instead
+            conversation = speculation["conversation"]
+            conversation.sync(history)
+            conversation.record_reply(question)
+        session_state[f"{agent_name}_conversation"] = conversation
+        session_state[f"{agent_name}_qa_state"] = budget
+    record_speculation(agent_name, "hit" if question is not None else "miss")
+    return question
+
+def output_template(agent_name: str) -> str:
+    """Fingerprint of the templates behind an agent's final output, stored alongside it."""
+    return templates.fingerprint(agent_name, "output", "task")
+
+def _output_request(agent_name: str, session_state, **context_inputs):
+    """Model with the output persona + upstream context as system instruction, and the Q&A turns."""
+    system_instruction = f"""{templates.get("output", agent_name)}
+Upstream Context: \n{_context_summary(context_inputs)}\n"""
+    conversation = _conversation(agent_name, session_state)
+    conversation.sync(session_state.get(f"{agent_name}_history", []))
+    contents = conversation.contents(templates.get("task", agent_name))
+    fits(agent_name, estimate_tokens(system_instruction) + estimate_tokens(contents))
+    return get_model(MODEL_NAME, system_instruction), contents
+
+def generate_agent_output(agent_name: str, session_state, use_cache: bool = True, **context_inputs) -> dict:
+    return run_sync(generate_agent_output_async(agent_name, snapshot_state(agent_name, session_state), use_cache,
+                                                **context_inputs))
+
+async def generate_agent_output_async(agent_name: str, session_state, use_cache: bool = True, **context_inputs) -> dict:
+    """Awaitable `generate_agent_output`, bounded by the shared async client's concurrency limits."""
+    session_id = _session_id(session_state)
+    handoff = await _handoff_async(agent_name, context_inputs, session_id)
+    agent_model, contents = _output_request(agent_name, session_state, **handoff)
+    log_prompt("agent.output.start", contents, agent=agent_name, session=session_id, turns=len(contents),
+               est_tokens=estimate_tokens(contents))
+    text = await async_client.generate_text(agent_model, contents, session_id=session_id, use_cache=use_cache,
+                                            agent=agent_name, phase="output", template=output_template(agent_name))
+    log_event("agent.output.done", agent=agent_name, session=session_id, output_chars=len(text or ""))
+    return {"text": text.strip() if text else "", "image": None, "template": output_template(agent_name)}
+
+def run_sync(coro):
+    """Run an orchestrator coroutine from synchronous code (e.g. the Streamlit script thread)."""
+    return async_client.run(coro)
+
+def stream_agent_output(agent_name: str, session_state, use_cache: bool = True, **context_inputs):
+    """
+    Yield the final agent output as text chunks while Gemini is still generating it. The stream
+    runs on the shared async client, so it counts against the same concurrency limits.
+    """
+    session_id = _session_id(session_state)
+    agent_model, contents = _output_request(agent_name, session_state, **_handoff(agent_name, context_inputs, session_id))
+    log_prompt("agent.output.stream", contents, agent=agent_name, turns=len(contents), est_tokens=estimate_tokens(contents))
+    chars = 0
+    for text in async_client.stream_text(agent_model, contents, session_id=session_id, use_cache=use_cache,
+                                         agent=agent_name, phase="output", template=output_template(agent_name)):
+        chars += len(text)
+        yield text
+    log_event("agent.output.done", agent=agent_name, output_chars=chars)
+
+def create_diagram(agent_name: str, session_state: dict, use_cache: bool = True) -> str:
     spec = session_state.get(f"{agent_name}_spec", "")
     output = session_state.get(f"{agent_name}_output", "")
 
@@ -359,6 +517,7 @@ def create_diagram(agent_name: str, session_state: dict) -> str:
     else:
         prompt = f"{base} Based on:\n\nSpec:\n{spec}\n\nOutput:\n{output}"
     
-    response = model.generate_content(prompt, stream=False)
-    image_data = response.images[0]
-    return image_data.url
\ No newline at end of file
+    # The diagram URL is what callers consume, so that is what gets cached
+    key = make_cache_key(MODEL_NAME, None, prompt, kind="diagram")
+    return cached_call(key, lambda: get_model().generate_content(prompt, stream=False).images[0].url, use_cache,
+                       agent=agent_name, phase="diagram")
\ No newline at end of file
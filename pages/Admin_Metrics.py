@@ -0,0 +1,28 @@
+import pandas as pd
+import streamlit as st
+from llm_cache import default_cache
+from metrics import METRICS_PORT, qa_summary_rows, render_prometheus, start_metrics_server, summary_rows
+
+st.set_page_config(page_title="📈 Agent Metrics", layout="wide")
+st.title("📈 Agent Metrics")
+start_metrics_server()
+
+rows = summary_rows()
+if rows:
+    st.markdown("#### ⏱️ Latency and spend by agent / phase (recent calls)")
+    df = pd.DataFrame(rows).sort_values("p95_s", ascending=False)
+    st.dataframe(df, use_container_width=True, hide_index=True)
+    st.bar_chart(df.groupby("agent")[["prompt_tokens", "response_tokens"]].sum())
+else:
+    st.info("No model calls recorded in this process yet.")
+
+qa_rows = qa_summary_rows()
+if qa_rows:
+    st.markdown("#### 📝 Clarification modes (round trips and wall time per agent Q&A)")
+    st.dataframe(pd.DataFrame(qa_rows), use_container_width=True, hide_index=True)
+
+st.markdown("#### 🗄️ Prompt cache")
+st.json(default_cache.stats())
+
+with st.expander(f"Prometheus exposition (also served on http://127.0.0.1:{METRICS_PORT}/metrics)", expanded=False):
+    st.code(render_prometheus(), language="text")
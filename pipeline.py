@@ -0,0 +1,207 @@
+import asyncio
+import hashlib
+import json
+import time
+from conversation import AgentConversation
+from llm_client import async_client
+from log_sink import log_event
+from metrics import record_speculation
+from orchestrator import (extract_artifact_async, generate_agent_output_async, opening_spec, qa_mode,
+                          reason_with_agent_async)
+
+AGENTS = ["Analyst", "Designer", "Estimator", "Coder", "Reviewer", "Tester", "Deployer"]
+
+# Which upstream outputs each agent consumes (the same map `get_context` hands to the agents)
+AGENT_DEPENDENCIES = {
+    "Analyst": [],
+    "Designer": ["Analyst"],
+    "Estimator": ["Designer", "Analyst"],
+    "Coder": ["Designer", "Analyst"],
+    "Reviewer": ["Coder"],
+    "Tester": ["Designer", "Analyst"],
+    "Deployer": AGENTS[:-1],
+}
+
+
+# Hand-offs where the consumer needs the producer's full prose (the Reviewer reviews the actual code)
+VERBATIM_HANDOFFS = {("Coder", "Reviewer")}
+
+
+def upstream_context(agent: str, session_state) -> dict:
+    """
+    Build the `{upstream}_output` kwargs for an agent from its dependencies, using each
+    upstream's compact structured artifact instead of its Markdown where one exists.
+    """
+    context = {}
+    for upstream in AGENT_DEPENDENCIES[agent]:
+        artifact = session_state.get(f"{upstream}_artifact")
+        if artifact and (upstream, agent) not in VERBATIM_HANDOFFS:
+            context[f"{upstream}_output"] = f"Structured artifact (JSON):\n{artifact}"
+        else:
+            context[f"{upstream}_output"] = session_state[f"{upstream}_output"]
+    return context
+
+
+def ready_agents(session_state, agents=AGENTS) -> list:
+    """Agents without an output whose upstream outputs are all available."""
+    return [agent for agent in agents
+            if not session_state.get(f"{agent}_output")
+            and all(session_state.get(f"{upstream}_output") for upstream in AGENT_DEPENDENCIES[agent])]
+
+
+async def artifact_or_fallback(agent: str, output: str, session_id: str = "default", use_cache: bool = True) -> str:
+    """
+    The agent's structured artifact, or "" if extraction fails: the artifact is only an
+    optimisation, and `upstream_context` hands downstream agents the Markdown without it.
+    """
+    try:
+        return await extract_artifact_async(agent, output, session_id, use_cache=use_cache)
+    except Exception as e:
+        log_event("dag.artifact.failed", agent=agent, session=session_id, error=type(e).__name__)
+        return ""
+
+
+def start_artifact(agent: str, output: str, session_state, use_cache: bool = True):
+    """
+    Extract the agent's artifact on the client loop instead of blocking the script; the
+    future is kept as `{agent}_artifact_job` until `collect_artifacts` picks it up.
+    """
+    session_id = session_state.get("session_id", "default")
+    session_state[f"{agent}_artifact_job"] = async_client.submit(
+        artifact_or_fallback(agent, output, session_id, use_cache=use_cache))
+
+
+def collect_artifacts(session_state, agents=AGENTS, wait: bool = False) -> dict:
+    """Artifacts of `agents` whose background extraction has finished (or all of them, if `wait`)."""
+    collected = {}
+    for agent in agents:
+        job = session_state.get(f"{agent}_artifact_job")
+        if job is not None and (wait or job.done()):
+            session_state.pop(f"{agent}_artifact_job")
+            collected[agent] = job.result()
+    return collected
+
+
+async def run_dag(agents: list, run_one, dependencies: dict = AGENT_DEPENDENCIES) -> dict:
+    """
+    Run `await run_one(agent)` for each agent as soon as its dependencies in `agents`
+    have finished. Dependencies outside `agents` are treated as already done, so wall
+    time follows the critical path instead of the sum of every agent.
+    """
+    tasks = {}
+
+    async def run_after_dependencies(agent):
+        upstream = [tasks[dep] for dep in dependencies[agent] if dep in tasks]
+        if upstream:
+            await asyncio.gather(*upstream)
+        return await run_one(agent)
+
+    # AGENTS is in topological order, so every dependency task exists before its dependents
+    for agent in [a for a in AGENTS if a in agents]:
+        tasks[agent] = asyncio.ensure_future(run_after_dependencies(agent))
+    if not tasks:
+        return {}
+    try:
+        await asyncio.wait(list(tasks.values()), return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        # 🛑 First failure (or our own cancellation): stop siblings and dependents before returning
+        unfinished = [task for task in tasks.values() if not task.done()]
+        for task in unfinished:
+            task.cancel()
+        await asyncio.gather(*unfinished, return_exceptions=True)
+    # Retrieve every exception so none is left "never retrieved"; the earliest agent is the root cause
+    failures = [task.exception() for task in tasks.values() if not task.cancelled() and task.exception()]
+    if failures:
+        raise failures[0]
+    return {agent: task.result() for agent, task in tasks.items()}
+
+
+async def generate_outputs(state: dict, agents: list, use_cache: bool = True) -> dict:
+    """
+    Generate final outputs for `agents` without further Q&A, fanning out every agent
+    whose upstream outputs are ready. `state` is a plain dict (see `snapshot_state`)
+    and receives each `{agent}_output` as it lands.
+    """
+    async def run_one(agent):
+        agent_state = {"session_id": state.get("session_id", "default"),
+                       f"{agent}_history": list(state.get(f"{agent}_history", []))}
+        started = time.perf_counter()
+        log_event("dag.agent.start", agent=agent, session=agent_state["session_id"])
+        result = await generate_agent_output_async(agent, agent_state, use_cache=use_cache,
+                                                   **upstream_context(agent, state))
+        state[f"{agent}_output"] = result["text"]
+        state[f"{agent}_template"] = result["template"]
+        state[f"{agent}_artifact"] = await artifact_or_fallback(agent, result["text"], agent_state["session_id"],
+                                                                use_cache=use_cache)
+        log_event("dag.agent.done", agent=agent, session=agent_state["session_id"],
+                  seconds=round(time.perf_counter() - started, 3))
+        return result["text"]
+
+    return await run_dag(agents, run_one)
+
+
+def _context_fingerprint(context_inputs: dict) -> str:
+    return hashlib.sha256(json.dumps(context_inputs, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def prewarm_opening_questions(session_state, use_cache: bool = True) -> list:
+    """
+    Start, in the background, the opening clarification question of every agent that has
+    just become ready, i.e. all its upstream outputs are final. Call it whenever an
+    `{agent}_output` is stored; the future and the conversation it runs on are kept as
+    `{agent}_prewarm` until `take_prewarmed` adopts them.
+    """
+    started = []
+    for agent in ready_agents(session_state):
+        if session_state.get(f"{agent}_history") or session_state.get(f"{agent}_spec"):
+            continue  # already started interactively
+        if any(session_state.get(f"{upstream}_artifact_job") for upstream in AGENT_DEPENDENCIES[agent]):
+            continue  # its context changes once the upstream artifact lands; pre-warm after `collect_artifacts`
+        if qa_mode(agent, session_state) != "conversational":
+            cancel_prewarm(agent, session_state)  # the questionnaire opens with its own question set
+            continue
+        context_inputs = upstream_context(agent, session_state)
+        fingerprint = _context_fingerprint(context_inputs)
+        if session_state.get(f"{agent}_prewarm", {}).get("context") == fingerprint:
+            continue
+        conversation = AgentConversation(agent)
+        state = {"session_id": session_state.get("session_id", "default"), f"{agent}_spec": opening_spec(agent),
+                 f"{agent}_history": [], f"{agent}_conversation": conversation}
+        future = async_client.submit(reason_with_agent_async(agent, state, use_cache=use_cache, phase="reason_prewarm",
+                                                             **context_inputs))
+        session_state[f"{agent}_prewarm"] = {"future": future, "conversation": conversation, "context": fingerprint}
+        started.append(agent)
+    if started:
+        log_event("dag.prewarm.start", agents=started, session=session_state.get("session_id", "default"))
+        for agent in started:
+            record_speculation(agent, "prewarm_started")
+    return started
+
+
+def cancel_prewarm(agent: str, session_state) -> bool:
+    """Drop the agent's outstanding prewarm (e.g. its clarification mode changed); True if there was one."""
+    prewarm = session_state.pop(f"{agent}_prewarm", None)
+    if not prewarm:
+        return False
+    prewarm["future"].cancel()
+    record_speculation(agent, "prewarm_cancelled")
+    return True
+
+
+def take_prewarmed(agent: str, session_state, context_inputs: dict):
+    """The pre-warmed opening question for `agent` (adopting its conversation), or None if stale or failed."""
+    prewarm = session_state.pop(f"{agent}_prewarm", None)
+    if not prewarm:
+        return None
+    if prewarm["context"] != _context_fingerprint(context_inputs):
+        prewarm["future"].cancel()
+        record_speculation(agent, "prewarm_stale")
+        return None
+    try:
+        question = prewarm["future"].result()
+    except Exception as e:
+        log_event("dag.prewarm.failed", agent=agent, error=type(e).__name__)
+        return None
+    session_state[f"{agent}_conversation"] = prewarm["conversation"]
+    record_speculation(agent, "prewarm_hit")
+    return question
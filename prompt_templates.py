@@ -0,0 +1,54 @@
+import hashlib
+import os
+
+TEMPLATE_ROOT = os.environ.get("PROMPT_TEMPLATE_ROOT", os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates"))
+TEMPLATE_VERSION = os.environ.get("PROMPT_TEMPLATE_VERSION", "v1")
+
+# templates/<version>/<kind>/<Agent>.txt
+KINDS = {
+    "questions": "clarifying-questions prompt; placeholders {user_input} and {context_summary}",
+    "reason": "persona of the Q&A system instruction",
+    "output": "persona of the output system instruction",
+    "task": "output task, sent as the last user turn",
+}
+
+
+class TemplateRegistry:
+    """
+    Per-agent prompt templates of one version, read once from versioned text files so
+    prompts can be edited and rolled forward (v1 -> v2) without touching the code.
+    Each call renders only the template it uses; `fingerprint` identifies the exact
+    template text an output was produced with.
+    """
+
+    def __init__(self, root: str = TEMPLATE_ROOT, version: str = TEMPLATE_VERSION):
+        self.root, self.version = root, version
+        self._templates = {}
+        for kind in KINDS:
+            folder = os.path.join(root, version, kind)
+            for file_name in sorted(os.listdir(folder)):
+                agent, ext = os.path.splitext(file_name)
+                if ext == ".txt":
+                    with open(os.path.join(folder, file_name), "r", encoding="utf-8", newline="") as f:
+                        # Files end with one newline that is not part of the template
+                        self._templates[(kind, agent)] = f.read().removesuffix("\n")
+        self._fingerprints = {key: hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+                              for key, text in self._templates.items()}
+
+    def get(self, kind: str, agent: str) -> str:
+        try:
+            return self._templates[(kind, agent)]
+        except KeyError:
+            raise KeyError(f"No '{kind}' prompt template for {agent} in {os.path.join(self.root, self.version)}") from None
+
+    def render(self, kind: str, agent: str, **values) -> str:
+        return self.get(kind, agent).format(**values)
+
+    def fingerprint(self, agent: str, *kinds: str) -> str:
+        """`<version>:<kind>@<sha12>+...` of the templates a call used, e.g. "v1:reason@3fa2c1d09b7e"."""
+        for kind in kinds:
+            self.get(kind, agent)  # unknown templates raise here
+        return f"{self.version}:" + "+".join(f"{kind}@{self._fingerprints[(kind, agent)]}" for kind in kinds)
+
+
+templates = TemplateRegistry()
@@ -0,0 +1,86 @@
+import copy
+import os
+import re
+
+MAX_NEW_QUESTIONS = int(os.environ.get("QA_MAX_NEW_QUESTIONS", "3"))
+MAX_FOLLOWUPS = int(os.environ.get("QA_MAX_FOLLOWUPS", "2"))  # per new question
+
+_MARKER = re.compile(r"\[([NC])\]\s*$", re.IGNORECASE)
+_SATISFIED = ("i am satisfied", "i am satified")
+
+
+def parse_marker(message: str):
+    """The marker letter ("N" or "C") a question ends with, None if it has none."""
+    match = _MARKER.search((message or "").strip())
+    return match.group(1).upper() if match else None
+
+
+class QAState:
+    """
+    Question budget of one agent's clarification loop, counted locally from the markers
+    of the questions in `{agent}_history` instead of by the model re-reading the
+    transcript. Like `AgentConversation`, it only parses messages it has not seen yet.
+    """
+
+    def __init__(self, max_new: int = MAX_NEW_QUESTIONS, max_followups: int = MAX_FOLLOWUPS):
+        self.max_new = max_new
+        self.max_followups = max_followups
+        self.reset()
+
+    def reset(self):
+        self.new, self.followups, self.consumed = 0, 0, 0
+
+    def sync(self, history: list):
+        if self.consumed > len(history):
+            self.reset()
+        for msg in history[self.consumed:]:
+            if msg["role"] == "ai" and not msg["content"].strip().lower().startswith(_SATISFIED):
+                self.count(msg["content"])
+        self.consumed = len(history)
+
+    def count(self, question: str):
+        # An unmarked question is taken as a followup once a new question is open
+        marker = parse_marker(question) or ("C" if self.new else "N")
+        if marker == "N":
+            self.new, self.followups = self.new + 1, 0
+        else:
+            self.followups += 1
+
+    @property
+    def new_left(self) -> int:
+        return max(self.max_new - self.new, 0)
+
+    @property
+    def followups_left(self) -> int:
+        return max(self.max_followups - self.followups, 0) if self.new else 0
+
+    @property
+    def exhausted(self) -> bool:
+        return not self.new_left and not self.followups_left
+
+    def allowed_markers(self) -> list:
+        return [marker for marker, left in (("N", self.new_left), ("C", self.followups_left)) if left]
+
+    def admits(self, question: str) -> bool:
+        """Whether the model's next question fits the remaining budget."""
+        marker = parse_marker(question) or ("C" if self.new else "N")
+        return marker in self.allowed_markers()
+
+    def fork(self) -> "QAState":
+        """Independent copy for calls that run off the session (background or speculative)."""
+        return copy.copy(self)
+
+    def budget_prompt(self) -> str:
+        return (f"(Question budget left: {self.new_left} new [N], "
+                f"{self.followups_left} followup [C] for the current [N] question.)")
+
+
+def qa_state(agent_name: str, session_state) -> QAState:
+    """The agent's `{agent}_qa_state`, created on first use and synced with its history."""
+    key = f"{agent_name}_qa_state"
+    state = session_state.get(key)
+    if state is None:
+        state = QAState()
+        session_state[key] = state
+    state.sync(session_state.get(f"{agent_name}_history", []))
+    return state
@@ -0,0 +1,78 @@
+"""
+Full report as one compressed ZIP (report.html, report.md and outputs.json), written
+section by section straight into the archive so no complete copy of the report is held
+in memory, and served to the user from the file.
+"""
+import glob
+import json
+import os
+import zipfile
+from export_store import default_exports
+from export_utils import iter_report_html, report_fingerprint, to_markdown
+
+BUNDLE_NAME = "multi_agent_studio.zip"
+
+
+def _write_sections(archive: zipfile.ZipFile, name: str, sections):
+    with archive.open(name, "w") as f:
+        for section in sections:
+            f.write(section.encode("utf-8"))
+
+
+def _markdown_sections(agent_list: list, session_state):
+    for agent in agent_list:
+        output = session_state.get(f"{agent}_output", "")
+        if output:
+            yield to_markdown(f"{agent} Agent Output", output) + "\n\n"
+
+
+def _loads(text: str):
+    try:
+        return json.loads(text) if text else None
+    except ValueError:
+        return None
+
+
+def _json_sections(agent_list: list, session_state, workflow_id: str):
+    yield f'{{"workflow_id": {json.dumps(workflow_id)}, "agents": ['
+    for i, agent in enumerate(agent_list):
+        record = {"agent": agent,
+                  "spec": session_state.get(f"{agent}_spec", ""),
+                  "user_feedback": session_state.get(f"{agent}_user_feedback", ""),
+                  "history": session_state.get(f"{agent}_history", []),
+                  "output": session_state.get(f"{agent}_output", ""),
+                  "artifact": _loads(session_state.get(f"{agent}_artifact", "")),
+                  "template": session_state.get(f"{agent}_template", "")}
+        yield ("," if i else "") + "\n" + json.dumps(record, ensure_ascii=False)
+    yield "\n]}\n"
+
+
+def write_report_bundle(path: str, agent_list: list, session_state, workflow_id: str = "") -> str:
+    """Write the ZIP to `path` (atomically) and return the path."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        _write_sections(archive, "report.html", iter_report_html(agent_list, session_state))
+        _write_sections(archive, "report.md", _markdown_sections(agent_list, session_state))
+        _write_sections(archive, "outputs.json", _json_sections(agent_list, session_state, workflow_id))
+    os.replace(tmp_path, path)
+    return path
+
+
+def bundle_path(workflow_id: str, agent_list: list, session_state, store=default_exports) -> str:
+    """Where the bundle for the workflow's current content lives (it may not be built yet)."""
+    digests = {agent: entry["sha256"] for agent, entry in store.manifest(workflow_id).items()}
+    fingerprint = report_fingerprint(agent_list, session_state, digests)
+    return os.path.join(store._dir(workflow_id), f"report_{fingerprint[:16]}.zip")
+
+
+def build_report_bundle(workflow_id: str, agent_list: list, session_state, store=default_exports) -> str:
+    """Build the bundle next to the workflow's exports unless it exists; older bundles are removed."""
+    path = bundle_path(workflow_id, agent_list, session_state, store)
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_report_bundle(path, agent_list, session_state, workflow_id)
+    for stale in glob.glob(os.path.join(os.path.dirname(path), "report_*.zip")):
+        if stale != path:
+            os.remove(stale)
+    return path
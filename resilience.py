@@ -0,0 +1,174 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from log_sink import log_event
+from metrics import record_breaker_state, record_retry
+
+RATE_PER_MINUTE = float(os.environ.get("LLM_RATE_PER_MINUTE", "120"))
+RATE_BURST = float(os.environ.get("LLM_RATE_BURST", "20"))
+MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "4"))
+BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", "1.0"))
+BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", "30.0"))
+BREAKER_THRESHOLD = int(os.environ.get("LLM_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.environ.get("LLM_BREAKER_COOLDOWN", "30.0"))
+
+RATE_LIMITED_ERRORS = {"ResourceExhausted", "TooManyRequests"}
+TRANSIENT_ERRORS = {"ServiceUnavailable", "InternalServerError", "DeadlineExceeded", "GatewayTimeout",
+                    "BadGateway", "Aborted", "Unknown", "ConnectionError", "TimeoutError", "RetryError"}
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without calling the model while the upstream is considered degraded."""
+
+
+def classify_error(exc: Exception) -> str:
+    """'rate_limited', 'transient' (both retried) or 'fatal' (bad request, auth, safety block...)."""
+    names = {cls.__name__ for cls in type(exc).__mro__}
+    code = getattr(exc, "code", None)
+    code = getattr(code, "value", code)
+    if names & RATE_LIMITED_ERRORS or code == 429:
+        return "rate_limited"
+    if names & TRANSIENT_ERRORS or code in (500, 502, 503, 504):
+        return "transient"
+    return "fatal"
+
+
+class TokenBucket:
+    """Process-wide request budget shared by every session (refills at `rate_per_minute`)."""
+
+    def __init__(self, rate_per_minute: float = RATE_PER_MINUTE, burst: float = RATE_BURST):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(burst, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take a token, returning how long the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive upstream failures; while open every call fails
+    fast with CircuitOpenError. After `cooldown` seconds one probe call is let through
+    (half-open): success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    raise CircuitOpenError("Gemini upstream is degraded; try again shortly.")
+                self._set_state("half_open")
+            elif self.state == "half_open" and self.probing:
+                # A probe is already in flight
+                raise CircuitOpenError("Gemini upstream is recovering; try again shortly.")
+            if self.state == "half_open":
+                self.probing = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.probing = False
+            if self.state != "closed":
+                self._set_state("closed")
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == "half_open" or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                self._set_state("open")
+
+    def release_probe(self):
+        """
+        A half-open probe ended with a non-upstream (fatal) error, e.g. a bad request: it
+        says nothing about the upstream, so the circuit stays half-open and the next call probes.
+        """
+        with self._lock:
+            self.probing = False
+
+    def _set_state(self, state: str):
+        self.state = state
+        record_breaker_state(state)
+        log_event("llm.circuit", state=state, failures=self.failures)
+
+
+rate_limiter = TokenBucket()
+breaker = CircuitBreaker()
+
+
+def backoff_delay(attempt: int, kind: str) -> float:
+    """Full-jitter exponential backoff; rate limits start from a longer base."""
+    base = BACKOFF_BASE * (4 if kind == "rate_limited" else 1)
+    return random.uniform(0, min(BACKOFF_MAX, base * (2 ** attempt)))
+
+
+def _handle_failure(exc: Exception, attempt: int) -> float:
+    kind = classify_error(exc)
+    if kind == "fatal":
+        breaker.release_probe()
+        raise exc
+    breaker.record_failure()
+    record_retry(kind)
+    if attempt >= MAX_RETRIES or breaker.state == "open":
+        raise exc
+    delay = backoff_delay(attempt, kind)
+    log_event("llm.retry", kind=kind, error=type(exc).__name__, attempt=attempt + 1, delay=round(delay, 2))
+    return delay
+
+
+def call_with_resilience(call):
+    """Run `call()` behind the shared rate limiter and circuit breaker, retrying transient errors."""
+    for attempt in range(MAX_RETRIES + 1):
+        breaker.allow()
+        rate_limiter.acquire()
+        try:
+            result = call()
+        except Exception as e:
+            time.sleep(_handle_failure(e, attempt))
+            continue
+        breaker.record_success()
+        return result
+
+
+async def call_with_resilience_async(make_call):
+    """Async `call_with_resilience`; `make_call()` must return a fresh awaitable per attempt."""
+    for attempt in range(MAX_RETRIES + 1):
+        breaker.allow()
+        await rate_limiter.acquire_async()
+        try:
+            result = await make_call()
+        except Exception as e:
+            await asyncio.sleep(_handle_failure(e, attempt))
+            continue
+        breaker.record_success()
+        return result
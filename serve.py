@@ -0,0 +1,28 @@
+"""
+Container entry point: starts the metrics / readiness server and the Gemini warm-up with
+the process instead of with the first browser session, then runs the Streamlit app in
+the same process (the counters /metrics reports live here).
+
+    python serve.py [app.py [script args ...]]
+"""
+import os
+import sys
+from llm_client import warm_up
+from metrics import start_metrics_server
+
+APP = os.environ.get("STREAMLIT_APP", "app.py")
+PORT = int(os.environ.get("PORT", "8501"))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    start_metrics_server()
+    warm_up()
+    from streamlit.web import bootstrap  # after the probes are up; Streamlit's import is slow
+    flags = {"server_port": PORT, "server_address": "0.0.0.0"}  # flag names as `streamlit run` passes them
+    bootstrap.load_config_options(flags)
+    bootstrap.run(argv[0] if argv else APP, False, argv[1:], flags)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import asyncio
+import threading
+from metrics import record_coalesced
+
+
+class _Call:
+    """One in-flight call: its final result or error, plus the chunks streamed so far."""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.chunks = []
+        self.result = None
+        self.error = None
+        self.done = False
+        self.followers = 0
+
+    def push(self, chunk):
+        with self.cond:
+            self.chunks.append(chunk)
+            self.cond.notify_all()
+
+    def finish(self, result=None, error=None):
+        with self.cond:
+            self.result, self.error, self.done = result, error, True
+            self.cond.notify_all()
+
+    def wait(self):
+        with self.cond:
+            self.cond.wait_for(lambda: self.done)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def follow(self):
+        """Replay the chunks already streamed, then the rest as the leader receives them."""
+        index = 0
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.done or len(self.chunks) > index)
+                new, done, error = self.chunks[index:], self.done, self.error
+            index += len(new)
+            yield from new
+            if done and index == len(self.chunks):
+                if error is not None:
+                    raise error
+                return
+
+
+class SingleFlight:
+    """
+    Coalesce identical in-flight requests: the first caller for a key (the leader) runs
+    the call, concurrent callers with the same key attach to it and receive the same
+    result, error or stream of chunks. Nothing is kept once the call completes; results
+    outlive the call only through the response cache.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._tasks = {}
+
+    def _join(self, key: str):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                return call, True
+            call.followers += 1
+            return call, False
+
+    def _finish(self, key: str, call: _Call, result=None, error=None):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.finish(result, error)
+
+    def do(self, key: str, fn):
+        call, leader = self._join(key)
+        if not leader:
+            record_coalesced("sync")
+            return call.wait()
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key, call, error=e)
+            raise
+        self._finish(key, call, result=result)
+        return result
+
+    def stream(self, key: str, make_iter):
+        call, leader = self._join(key)
+        if not leader:
+            record_coalesced("stream")
+            yield from call.follow()
+            return
+        source = iter(make_iter())
+        try:
+            for chunk in source:
+                call.push(chunk)
+                yield chunk
+        except GeneratorExit:
+            # Our consumer went away (e.g. a Streamlit rerun); finish upstream for attached followers
+            self._abandon(key, call, source)
+            raise
+        except BaseException as e:
+            self._finish(key, call, error=e)
+            raise
+        self._finish(key, call)
+
+    def _abandon(self, key: str, call: _Call, source):
+        with self._lock:
+            if call.followers:
+                threading.Thread(target=self._drain, args=(key, call, source), name="singleflight-drain",
+                                 daemon=True).start()
+                return
+            del self._calls[key]
+        call.finish(error=RuntimeError("Streamed call abandoned by its caller."))
+        if hasattr(source, "close"):
+            source.close()
+
+    def _drain(self, key: str, call: _Call, source):
+        try:
+            for chunk in source:
+                call.push(chunk)
+        except Exception as e:
+            self._finish(key, call, error=e)
+            return
+        self._finish(key, call)
+
+    async def do_async(self, key: str, make_coro):
+        """Async variant; must always be awaited on the same event loop (the LLM client loop)."""
+        entry = self._tasks.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(make_coro())
+            entry = self._tasks[key] = {"task": task, "waiters": 0}
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            record_coalesced("async")
+        task = entry["task"]
+        entry["waiters"] += 1
+        try:
+            # Shielded, so one waiter being cancelled does not cancel the call for the others ...
+            return await asyncio.shield(task)
+        finally:
+            entry["waiters"] -= 1
+            # ... but once nobody is waiting any more (e.g. discarded speculation) stop paying for it
+            if not entry["waiters"] and not task.done():
+                task.cancel()
+
+    def _forget(self, key: str, task):
+        entry = self._tasks.get(key)
+        if entry is not None and entry["task"] is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved even if every waiter was cancelled
+
+
+flights = SingleFlight()
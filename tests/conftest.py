@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# The app is a set of top-level modules; keep every default store of the imported modules out of the repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_tmp = tempfile.mkdtemp(prefix="agent-studio-tests-")
+os.environ.setdefault("LLM_CACHE_PATH", os.path.join(_tmp, "llm_cache.sqlite"))
+os.environ.setdefault("WORKFLOW_STORE", "memory")
+os.environ.setdefault("EXPORT_ROOT", os.path.join(_tmp, "exports"))
+os.environ.setdefault("LOG_SINK_PATH", os.path.join(_tmp, "events.log"))
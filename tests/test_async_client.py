@@ -0,0 +1,35 @@
+import pytest
+from fake_backend import FakeGenerativeModel
+from llm_client import AsyncLLMClient
+
+
+@pytest.fixture
+def client():
+    return AsyncLLMClient(max_concurrency=1, max_per_session=1)
+
+
+def test_stream_runs_on_the_client_loop_and_is_cached(client):
+    model = FakeGenerativeModel("gemini-test", system_instruction="persona", chunks=4)
+    chunks = list(client.stream_text(model, "Write the design.", session_id="s1", phase="output"))
+    assert len(chunks) == 4
+    assert client._global is not None  # the call went through the shared slots
+    assert list(client.stream_text(model, "Write the design.", session_id="s1")) == ["".join(chunks)]
+
+
+def test_abandoned_stream_frees_its_slot(client):
+    model = FakeGenerativeModel("gemini-test", chunks=8, latency="const:0.2")
+    stream = client.stream_text(model, "Long output", session_id="s1", use_cache=False)
+    assert next(stream)
+    stream.close()  # e.g. a Streamlit rerun while the output is streaming
+    # With one slot per session, this only completes once the abandoned stream gave its slot back
+    text = client.run(client.generate_text(FakeGenerativeModel("gemini-test"), "Short", session_id="s1",
+                                           use_cache=False))
+    assert text
+
+
+def test_run_refuses_to_block_the_client_loop(client):
+    async def nested():
+        return client.run(client.generate_text(FakeGenerativeModel("gemini-test"), "Q", use_cache=False))
+
+    with pytest.raises(RuntimeError):
+        client.run(nested())
@@ -0,0 +1,90 @@
+import asyncio
+import json
+import os
+import pytest
+import batch_runner
+import llm_client
+import resilience
+from fake_backend import FakeGenerativeModel
+from pipeline import AGENTS
+
+
+@pytest.fixture
+def fake_backend(monkeypatch):
+    # A full pipeline is ~40 calls; keep the production rate limit out of the test's wall time
+    monkeypatch.setattr(resilience, "rate_limiter", resilience.TokenBucket(rate_per_minute=60000, burst=1000))
+    llm_client.set_backend(FakeGenerativeModel)
+    yield
+    llm_client.set_backend(None)
+
+
+@pytest.fixture
+def generated(monkeypatch):
+    """Agents whose final output the runner generated, in order."""
+    agents = []
+    generate = batch_runner.generate_agent_output_async
+
+    async def recording(agent, *args, **kwargs):
+        agents.append(agent)
+        return await generate(agent, *args, **kwargs)
+
+    monkeypatch.setattr(batch_runner, "generate_agent_output_async", recording)
+    return agents
+
+
+def _progress(out_dir):
+    with open(os.path.join(out_dir, "progress.jsonl"), encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_batch_runs_every_agent_and_skips_finished_specs(fake_backend, generated, tmp_path):
+    out_dir = str(tmp_path)
+    items = [{"id": "ITEM-1", "spec": "Build a CRM"}, {"id": "ITEM-2", "spec": "Build a wiki"}]
+    assert asyncio.run(batch_runner.run_batch(items, out_dir, use_cache=False)) == {"done": 2, "failed": 0}
+    assert sorted(generated) == sorted(AGENTS * 2)
+    state = batch_runner.load_checkpoint(os.path.join(out_dir, "ITEM-1"))
+    assert all(state[f"{agent}_output"] for agent in AGENTS)
+    assert os.path.exists(os.path.join(out_dir, "ITEM-1", "deployer_agent_out.md"))
+
+    generated.clear()
+    assert asyncio.run(batch_runner.run_batch(items, out_dir, use_cache=False)) == {"done": 2, "failed": 0}
+    assert generated == []
+    assert sorted(record["id"] for record in _progress(out_dir)) == ["ITEM-1", "ITEM-2"]  # nothing re-recorded
+
+
+def test_resume_skips_checkpointed_agents(fake_backend, generated, tmp_path):
+    item_dir = tmp_path / "ITEM-1"
+    item_dir.mkdir()
+    checkpoint = {"Analyst_output": "# Analysis (checkpointed)", "Designer_output": "# Design (checkpointed)",
+                  "Designer_artifact": ""}
+    batch_runner.save_checkpoint(str(item_dir), checkpoint)
+
+    state = asyncio.run(batch_runner.run_item({"id": "ITEM-1", "spec": "Build a CRM"}, str(tmp_path),
+                                              use_cache=False))
+    assert "Analyst" not in generated and "Designer" not in generated
+    assert sorted(generated) == sorted(AGENTS[2:])
+    assert state["Designer_output"] == "# Design (checkpointed)"
+    assert batch_runner.load_checkpoint(str(item_dir))["Deployer_output"]
+
+
+def test_failed_spec_keeps_its_checkpoint_and_is_retried(fake_backend, monkeypatch, tmp_path):
+    out_dir = str(tmp_path)
+    items = [{"id": "ITEM-1", "spec": "Build a CRM"}]
+    generate = batch_runner.generate_agent_output_async
+
+    async def coder_fails(agent, *args, **kwargs):
+        if agent == "Coder":
+            raise RuntimeError("quota exhausted")
+        return await generate(agent, *args, **kwargs)
+
+    monkeypatch.setattr(batch_runner, "generate_agent_output_async", coder_fails)
+    assert asyncio.run(batch_runner.run_batch(items, out_dir, use_cache=False)) == {"done": 0, "failed": 1}
+    assert batch_runner.load_progress(out_dir) == set()
+    checkpoint = batch_runner.load_checkpoint(os.path.join(out_dir, "ITEM-1"))
+    assert checkpoint["Designer_output"] and "Coder_output" not in checkpoint
+    assert "Reviewer_output" not in checkpoint and "Deployer_output" not in checkpoint
+
+    monkeypatch.setattr(batch_runner, "generate_agent_output_async", generate)
+    assert asyncio.run(batch_runner.run_batch(items, out_dir, use_cache=False)) == {"done": 1, "failed": 0}
+    assert batch_runner.load_progress(out_dir) == {"ITEM-1"}
+    assert [record["status"] for record in _progress(out_dir)] == ["failed", "done"]
@@ -0,0 +1,96 @@
+import time
+import pytest
+import fake_backend
+import llm_client
+from fake_backend import FakeGenerativeModel
+from llm_client import ContextCache, _model_identity, get_model
+
+PREFIX = "You are the Reviewer agent.\n" + "Upstream context line.\n" * 50
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(llm_client, "_backend", FakeGenerativeModel)
+    cache = ContextCache(min_tokens=100, ttl_seconds=3600, enabled=True)
+    yield cache
+    cache.clear()
+
+
+def _registered(cache, digest="d1", model_name="gemini-test"):
+    assert cache.model(model_name, PREFIX, digest) is None  # sent inline while the handle is created
+    cache.wait(2)
+    model = cache.model(model_name, PREFIX, digest)
+    assert model is not None and model.cached_content is not None
+    return model
+
+
+def test_small_or_disabled_prefixes_stay_inline(monkeypatch):
+    monkeypatch.setattr(llm_client, "_backend", FakeGenerativeModel)
+    assert ContextCache(min_tokens=10**6, enabled=True).model("gemini-test", PREFIX, "d1") is None
+    disabled = ContextCache(min_tokens=100, enabled=False)
+    assert disabled.model("gemini-test", PREFIX, "d1") is None
+    assert disabled._pending == {}
+
+
+def test_cached_and_inline_models_share_response_cache_keys(cache):
+    cached = _registered(cache)
+    # The real SDK reports the cache's versioned model and a Content proto; neither may leak into the key
+    cached.model_name, cached._system_instruction = "models/gemini-test-002", f"parts {{ text: {PREFIX!r} }}"
+    inline = llm_client._tag(FakeGenerativeModel("gemini-test", system_instruction=PREFIX), "gemini-test", PREFIX)
+    config = {"response_mime_type": "application/json"}
+    assert _model_identity(cached, config) == _model_identity(inline, config)
+    assert _model_identity(cached, config)[0] == "gemini-test"
+
+
+def test_registration_happens_once_per_prefix(cache, monkeypatch):
+    created = []
+    original = cache._create
+    monkeypatch.setattr(cache, "_create", lambda *args: created.append(1) or original(*args))
+    for _ in range(5):
+        cache.model("gemini-test", PREFIX, "d1")
+    cache.wait(2)
+    assert len(created) == 1
+
+
+def test_renewal_keeps_serving_and_deletes_the_old_handle(cache):
+    model = _registered(cache)
+    old = model.cached_content
+    digest_entry = cache._entries["d1"]
+    cache._entries["d1"] = (digest_entry[0], time.time() + cache.RENEW_MARGIN / 2, digest_entry[2])
+
+    assert cache.model("gemini-test", PREFIX, "d1") is model  # still valid while the renewal runs
+    cache.wait(2)
+    renewed = cache.model("gemini-test", PREFIX, "d1")
+    assert renewed is not model
+    assert old.name not in fake_backend.cached_contents
+    assert renewed.cached_content.name in fake_backend.cached_contents
+
+
+def test_expired_handle_falls_back_to_inline(cache):
+    model = _registered(cache)
+    cache._entries["d1"] = (model, time.time() - 1, cache._entries["d1"][2])
+    assert cache.model("gemini-test", PREFIX, "d1") is None
+    cache.wait(2)
+    assert cache.model("gemini-test", PREFIX, "d1") is not None
+
+
+def test_refused_prefixes_are_not_retried(cache, monkeypatch):
+    attempts = []
+
+    def refuse(*args):
+        attempts.append(1)
+        raise ValueError("400 cached content is too small")
+
+    monkeypatch.setattr(cache, "_create", refuse)
+    for _ in range(3):
+        assert cache.model("gemini-test", PREFIX, "d1") is None
+        cache.wait(2)
+    assert len(attempts) == 1
+
+
+def test_get_model_tags_the_requested_identity(monkeypatch):
+    monkeypatch.setattr(llm_client, "_backend", FakeGenerativeModel)
+    monkeypatch.setattr(llm_client, "_models", type(llm_client._models)())
+    model = get_model("gemini-test", "persona")
+    assert model.cache_identity == ("gemini-test", "persona")
+    assert _model_identity(model)[1]["system_instruction"] == "persona"
@@ -0,0 +1,107 @@
+import asyncio
+import pytest
+import orchestrator
+from conversation import START_TURN, AgentConversation
+from fake_backend import FakeGenerativeModel
+
+
+def _history(*messages):
+    return [{"role": role, "content": text} for role, text in messages]
+
+
+def test_sync_appends_only_new_messages_and_merges_roles():
+    conversation = AgentConversation("Analyst")
+    history = _history(("user", "Build a CRM"), ("user", "For 20 users"), ("ai", "Multi-tenant? [N]"))
+    conversation.sync(history)
+    assert conversation.turns == [{"role": "user", "parts": ["Build a CRM\n\nFor 20 users"]},
+                                  {"role": "model", "parts": ["Multi-tenant? [N]"]}]
+
+    history.append({"role": "user", "content": "No"})
+    conversation.sync(history)
+    assert [turn["role"] for turn in conversation.turns] == ["user", "model", "user"]
+    assert conversation.consumed == 4
+
+
+def test_recorded_reply_is_not_synced_twice():
+    conversation = AgentConversation("Designer")
+    conversation.record_reply("Serverless? [N]")  # downstream agents open without a user message
+    assert conversation.turns[0] == {"role": "user", "parts": [START_TURN]}
+    conversation.sync(_history(("ai", "Serverless? [N]"), ("user", "Yes")))
+    assert [turn["parts"][0] for turn in conversation.turns] == [START_TURN, "Serverless? [N]", "Yes"]
+
+
+def test_rewound_history_rebuilds_the_conversation():
+    conversation = AgentConversation("Analyst")
+    conversation.sync(_history(("user", "Spec A"), ("ai", "Q1 [N]"), ("user", "Yes")))
+    conversation.sync(_history(("user", "Spec B")))
+    assert conversation.turns == [{"role": "user", "parts": ["Spec B"]}] and conversation.consumed == 1
+
+
+def test_new_system_instruction_starts_over():
+    conversation = AgentConversation("Analyst")
+    conversation.prepare("persona + spec A")
+    conversation.sync(_history(("user", "Spec A")))
+    conversation.prepare("persona + spec A")
+    assert conversation.consumed == 1
+    conversation.prepare("persona + spec B")
+    assert (conversation.turns, conversation.summary, conversation.consumed) == ([], "", 0)
+
+
+def test_contents_lead_with_the_summary_and_end_on_a_user_turn():
+    conversation = AgentConversation("Analyst")
+    assert conversation.contents() == [{"role": "user", "parts": [START_TURN]}]
+    conversation.sync(_history(("user", "Spec"), ("ai", "Q1 [N]")))
+    conversation.summary = "Asked about tenancy"
+    contents = conversation.contents()
+    # The summary replaces the folded turns as the opening user turn (merged with the first kept one)
+    assert contents[0]["parts"][0] == "Summary of the earlier conversation:\nAsked about tenancy\n\nSpec"
+    assert contents[-1] == {"role": "user", "parts": ["Please continue."]}
+    assert conversation.contents("Budget: 2 left")[-1] == {"role": "user", "parts": ["Budget: 2 left"]}
+
+
+def test_overflow_folds_the_oldest_turns_and_keeps_the_last_exchange():
+    conversation = AgentConversation("Analyst", token_budget=30)
+    messages = [("user" if i % 2 == 0 else "ai", f"message {i} " + "x" * 40) for i in range(6)]
+    conversation.sync(_history(*messages))
+    old_turns = conversation.overflow()
+    assert 0 < len(old_turns) <= len(conversation.turns) - 2
+    assert "message 0" in conversation.summary_prompt(old_turns)
+
+    last_exchange = conversation.turns[-2:]
+    conversation.fold("  Folded summary ", len(old_turns))
+    assert conversation.summary == "Folded summary"
+    assert conversation.turns[-2:] == last_exchange
+    assert conversation.consumed == 6  # folded messages are never synced again
+
+
+def test_fork_is_independent():
+    conversation = AgentConversation("Analyst")
+    conversation.sync(_history(("user", "Spec")))
+    forked = conversation.fork()
+    forked.record_reply("Q1 [N]")
+    assert len(conversation.turns) == 1 and conversation.consumed == 1
+    assert len(forked.turns) == 2 and forked.consumed == 2
+
+
+@pytest.fixture
+def fake_models(monkeypatch):
+    calls = []
+
+    def get_model(model_name=orchestrator.MODEL_NAME, system_instruction=None):
+        calls.append(system_instruction)
+        return FakeGenerativeModel(model_name, system_instruction=system_instruction)
+
+    monkeypatch.setattr(orchestrator, "get_model", get_model)
+    return calls
+
+
+def test_reasoning_folds_an_over_budget_conversation(fake_models):
+    history = _history(("user", "Build a CRM " + "x" * 400), ("ai", "Multi-tenant? [N]"), ("user", "No"))
+    conversation = AgentConversation("Analyst", token_budget=20)
+    state = {"session_id": "s1", "Analyst_spec": history[0]["content"], "Analyst_history": history,
+             "Analyst_conversation": conversation}
+    asyncio.run(orchestrator.reason_with_agent_async("Analyst", state, use_cache=False))
+    assert conversation.summary  # the oldest turn went through a summary call
+    assert fake_models[1] is None  # the summary call runs on the plain model
+    assert all("Build a CRM" not in turn["parts"][0] for turn in conversation.turns)
+    assert conversation.turns[-1]["role"] == "model" and conversation.consumed == len(history) + 1
@@ -0,0 +1,81 @@
+import asyncio
+import pytest
+import handoff
+import orchestrator
+from fake_backend import FakeGenerativeModel
+from handoff import cached_digest, digest_prompt, fits, plan_handoff, store_digest
+from pipeline import upstream_context
+
+
+def _tokens(n: int) -> str:
+    return "x" * (4 * n)  # estimate_tokens counts ~4 characters per token
+
+
+def test_outputs_within_budget_pass_through():
+    context = {"Designer_output": _tokens(300), "Analyst_output": _tokens(200)}
+    assert plan_handoff("Coder", context, budget=1000) == (context, [])
+
+
+def test_over_budget_outputs_are_digested_with_the_leftover_share():
+    context = {"Designer_output": _tokens(3000), "Analyst_output": _tokens(100), "Coder_output": _tokens(2000)}
+    handoff_inputs, to_digest = plan_handoff("Deployer", context, budget=1000)
+    assert handoff_inputs == {"Analyst_output": context["Analyst_output"]}
+    # The 900 tokens Analyst left over are split between the two large outputs, smallest first
+    assert [(key, producer, max_tokens) for key, producer, _, max_tokens in to_digest] == [
+        ("Coder_output", "Coder", 450), ("Designer_output", "Designer", 450)]
+    assert to_digest[0][2] == context["Coder_output"]
+
+
+def test_reviewer_gets_the_coder_markdown_not_its_artifact():
+    state = {"Coder_output": "```python\ndef main(): ...\n```", "Coder_artifact": '{"summary":"code"}'}
+    context = upstream_context("Reviewer", state)
+    assert context == {"Coder_output": state["Coder_output"]}
+    assert plan_handoff("Reviewer", context) == (context, [])
+
+
+def test_reviewer_digest_of_large_code_keeps_the_reviewer_focus():
+    code = _tokens(handoff.TOKEN_BUDGETS["Reviewer"] + 1)
+    _, to_digest = plan_handoff("Reviewer", {"Coder_output": code})
+    assert to_digest == [("Coder_output", "Coder", code, handoff.TOKEN_BUDGETS["Reviewer"])]
+    assert handoff.HANDOFF_FOCUS["Reviewer"] in digest_prompt("Coder", "Reviewer", code, 100)
+
+
+def test_digests_are_cached_per_consumer_and_truncated():
+    text = "Designer output " + _tokens(50)
+    assert cached_digest("Designer", "Tester", text, 10) is None
+    digest = store_digest("Designer", "Tester", text, 10, " " + _tokens(40) + " ")
+    assert digest.endswith("…(truncated)") and len(digest) < 4 * 40
+    assert cached_digest("Designer", "Tester", text, 10) == digest
+    assert cached_digest("Designer", "Coder", text, 10) is None
+
+
+def test_fits_checks_the_context_window():
+    assert fits("Coder", 100, limit=1000)
+    assert not fits("Coder", 1001, limit=1000)
+
+
+@pytest.fixture
+def fake_models(monkeypatch):
+    prompts = []
+
+    class RecordingModel(FakeGenerativeModel):
+        async def generate_content_async(self, contents, *args, **kwargs):
+            prompts.append(contents)
+            return await super().generate_content_async(contents, *args, **kwargs)
+
+    monkeypatch.setattr(orchestrator, "get_model", lambda model_name=orchestrator.MODEL_NAME, system_instruction=None:
+                        RecordingModel(model_name, system_instruction=system_instruction))
+    return prompts
+
+
+def test_handoff_digests_only_what_does_not_fit_and_reuses_digests(fake_models, monkeypatch):
+    monkeypatch.setitem(handoff.TOKEN_BUDGETS, "Tester", 500)
+    context = {"Designer_output": "Designer " + _tokens(2000), "Analyst_output": "Analyst " + _tokens(50)}
+    first = asyncio.run(orchestrator._handoff_async("Tester", context, "s1"))
+    assert list(first) == ["Designer_output", "Analyst_output"]
+    assert first["Analyst_output"] == context["Analyst_output"]
+    assert first["Designer_output"] != context["Designer_output"]
+    assert len(fake_models) == 1 and "preparing a handoff for the Tester agent" in fake_models[0]
+
+    assert asyncio.run(orchestrator._handoff_async("Tester", context, "s1")) == first
+    assert len(fake_models) == 1  # served from the digest cache
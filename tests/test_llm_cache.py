@@ -0,0 +1,58 @@
+import time
+from llm_cache import LLMCache, make_cache_key
+
+
+def test_cache_key_covers_model_config_and_prompt():
+    key = make_cache_key("gemini", {"temperature": 0}, "prompt")
+    assert key == make_cache_key("gemini", {"temperature": 0}, "prompt")
+    assert key != make_cache_key("gemini", {"temperature": 1}, "prompt")
+    assert key != make_cache_key("gemini", {"temperature": 0}, "prompt", kind="stream")
+
+
+def test_miss_then_memory_hit(tmp_path):
+    cache = LLMCache(str(tmp_path / "cache.sqlite"))
+    assert cache.get("k") is None
+    cache.put("k", "value", template="v1:reason@abc")
+    assert cache.get("k") == "value"
+    assert cache.get_memory("k") == "value"
+    stats = cache.stats()
+    assert (stats["misses"], stats["memory_hits"], stats["disk_hits"]) == (1, 2, 0)
+    assert stats["items_by_template"] == {"v1:reason@abc": 1}
+
+
+def test_disk_hit_is_promoted_to_memory(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    LLMCache(path).put("k", "value")
+
+    cache = LLMCache(path)  # a fresh process: empty memory tier
+    assert cache.get_memory("k") is None
+    assert cache.get("k") == "value"
+    assert cache.get_memory("k") == "value"
+    assert (cache.counters["disk_hits"], cache.counters["memory_hits"]) == (1, 1)
+
+
+def test_memory_tier_is_lru_bounded(tmp_path):
+    cache = LLMCache(str(tmp_path / "cache.sqlite"), max_memory_items=2)
+    for key in ("a", "b", "c"):
+        cache.put(key, key)
+    assert cache.get_memory("a") is None
+    assert cache.get("a") == "a"  # still on disk
+    assert cache.counters["evictions"] >= 1
+
+
+def test_disk_tier_evicts_least_recently_accessed(tmp_path):
+    cache = LLMCache(str(tmp_path / "cache.sqlite"), max_memory_items=0, max_disk_items=2)
+    cache.put("a", "a")
+    cache.put("b", "b")
+    time.sleep(0.01)
+    assert cache.get("a") == "a"
+    cache.put("c", "c")
+    assert cache.get("b") is None
+    assert cache.stats()["disk_items"] == 2
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = LLMCache(str(tmp_path / "cache.sqlite"), ttl_seconds=0)
+    cache.put("k", "value")
+    assert cache.get_memory("k") is None
+    assert cache.get("k") is None
@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+import pipeline
+from pipeline import AGENT_DEPENDENCIES, AGENTS, run_dag
+
+
+def test_agents_start_only_after_their_dependencies():
+    started, finished = {}, []
+
+    async def run_one(agent):
+        started[agent] = set(finished)
+        await asyncio.sleep(0.01)
+        finished.append(agent)
+        return agent.lower()
+
+    results = asyncio.run(run_dag(AGENTS, run_one))
+    assert results == {agent: agent.lower() for agent in AGENTS}
+    for agent in AGENTS:
+        assert set(AGENT_DEPENDENCIES[agent]) <= started[agent]
+    # Independent agents fan out instead of waiting on each other
+    assert "Estimator" not in started["Coder"] and "Coder" not in started["Estimator"]
+
+
+def test_dependencies_outside_the_run_count_as_done():
+    async def run_one(agent):
+        return agent
+
+    assert asyncio.run(run_dag(["Reviewer", "Deployer"], run_one)) == {"Reviewer": "Reviewer",
+                                                                       "Deployer": "Deployer"}
+    assert asyncio.run(run_dag([], run_one)) == {}
+
+
+def test_first_failure_cancels_siblings_and_dependents():
+    started, cancelled, finished = [], [], []
+
+    async def run_one(agent):
+        started.append(agent)
+        try:
+            if agent == "Coder":
+                raise ValueError("coder failed")
+            await asyncio.sleep(0.5)
+        except asyncio.CancelledError:
+            cancelled.append(agent)
+            raise
+        finished.append(agent)
+
+    async def main():
+        with pytest.raises(ValueError, match="coder failed"):
+            await run_dag(["Coder", "Reviewer", "Tester", "Deployer"], run_one)
+        # Nothing is left running (or writing state) once run_dag has raised
+        assert [t for t in asyncio.all_tasks() if t is not asyncio.current_task()] == []
+
+    asyncio.run(main())
+    assert "Reviewer" not in started and "Deployer" not in started
+    assert cancelled == ["Tester"] and finished == []
+
+
+@pytest.fixture
+def failing_extraction(monkeypatch):
+    async def generate(agent, state, use_cache=True, **context):
+        return {"text": f"# {agent}\n\n{sorted(context)}", "template": "t1"}
+
+    async def extract(agent, output, session_id="default", use_cache=True):
+        if agent == "Coder":
+            raise ValueError("malformed JSON")
+        return '{"summary":"%s"}' % agent
+
+    monkeypatch.setattr(pipeline, "generate_agent_output_async", generate)
+    monkeypatch.setattr(pipeline, "extract_artifact_async", extract)
+
+
+def test_failed_extraction_keeps_the_output_and_hands_off_markdown(failing_extraction):
+    state = {"session_id": "s1", "Analyst_output": "# Analysis", "Designer_output": "# Design"}
+    asyncio.run(pipeline.generate_outputs(state, ["Coder", "Tester"]))
+    assert state["Coder_output"].startswith("# Coder") and state["Coder_artifact"] == ""
+    assert state["Tester_artifact"] == '{"summary":"Tester"}'
+    context = pipeline.upstream_context("Deployer", {**{f"{agent}_output": agent for agent in AGENTS}, **state})
+    assert context["Coder_output"] == state["Coder_output"]
+    assert context["Tester_output"] == 'Structured artifact (JSON):\n{"summary":"Tester"}'
+
+
+def test_background_artifacts_are_collected_once(failing_extraction):
+    state = {"session_id": "s1"}
+    pipeline.start_artifact("Designer", "# Design", state)
+    pipeline.start_artifact("Coder", "# Code", state)
+    assert pipeline.collect_artifacts(state, ["Designer", "Coder"], wait=True) == {
+        "Designer": '{"summary":"Designer"}', "Coder": ""}
+    assert "Designer_artifact_job" not in state and pipeline.collect_artifacts(state) == {}
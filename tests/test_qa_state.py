@@ -0,0 +1,66 @@
+from qa_state import QAState, parse_marker, qa_state
+
+
+def _history(*questions):
+    history = []
+    for question in questions:
+        history += [{"role": "ai", "content": question}, {"role": "user", "content": "yes"}]
+    return history
+
+
+def test_parse_marker():
+    assert parse_marker("Is it multi-user? [N]") == "N"
+    assert parse_marker("Only admins? [c] ") == "C"
+    assert parse_marker("No marker?") is None
+    assert parse_marker(None) is None
+
+
+def test_budget_counts_new_questions_and_followups():
+    state = QAState(max_new=2, max_followups=1)
+    assert (state.new_left, state.followups_left, state.allowed_markers()) == (2, 0, ["N"])
+
+    state.sync(_history("Q1 [N]"))
+    assert (state.new, state.followups) == (1, 0)
+    assert state.allowed_markers() == ["N", "C"]
+
+    state.sync(_history("Q1 [N]", "Q1a [C]"))
+    assert (state.new_left, state.followups_left) == (1, 0)
+    assert state.admits("Q2 [N]") and not state.admits("Q1b [C]")
+
+    state.sync(_history("Q1 [N]", "Q1a [C]", "Q2 [N]", "Q2a [C]"))
+    assert state.exhausted
+    assert state.allowed_markers() == []
+
+
+def test_unmarked_questions_and_satisfied_replies():
+    state = QAState(max_new=3, max_followups=2)
+    state.sync(_history("First question?", "Second question?") + [{"role": "ai", "content": "I AM SATISFIED"}])
+    # The first unmarked question opens a new one, later ones count as its followups
+    assert (state.new, state.followups) == (1, 1)
+
+
+def test_sync_only_parses_new_messages_and_resets_on_rewind():
+    state = QAState(max_new=3, max_followups=2)
+    history = _history("Q1 [N]", "Q2 [N]")
+    state.sync(history)
+    state.sync(history)
+    assert (state.new, state.consumed) == (2, 4)
+    state.sync(history[:2])
+    assert (state.new, state.consumed) == (1, 2)
+
+
+def test_fork_is_independent():
+    state = QAState()
+    state.sync(_history("Q1 [N]"))
+    fork = state.fork()
+    fork.sync(_history("Q1 [N]", "Q1a [C]"))
+    assert (state.followups, fork.followups) == (0, 1)
+
+
+def test_qa_state_lives_in_the_session():
+    session = {"Analyst_history": _history("Q1 [N]")}
+    state = qa_state("Analyst", session)
+    assert session["Analyst_qa_state"] is state
+    session["Analyst_history"] += _history("Q2 [N]")
+    assert qa_state("Analyst", session).new == 2
+    assert "(Question budget left:" in state.budget_prompt()
@@ -0,0 +1,55 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+import pytest
+import llm_client
+import metrics
+from fake_backend import FakeGenerativeModel
+
+
+@pytest.fixture
+def fresh_status(monkeypatch):
+    monkeypatch.setattr(llm_client, "_status", {"state": "cold", "error": "", "seconds": None, "failed_at": 0.0})
+    monkeypatch.setattr(llm_client, "_models", type(llm_client._models)())
+    monkeypatch.setattr(llm_client, "WARM_UP_RETRY", 0)
+
+
+def _wait_for_state(*states):
+    deadline = time.monotonic() + 2
+    while llm_client._status["state"] not in states:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_failed_warm_up_recovers_once_the_config_is_fixed(fresh_status, monkeypatch):
+    def no_key(*args, **kwargs):
+        raise llm_client.MissingAPIKeyError("No Gemini API key")
+
+    monkeypatch.setattr(llm_client, "_backend", no_key)
+    llm_client.warm_up()
+    _wait_for_state("error")
+    assert llm_client.client_status()["state"] in ("error", "warming")
+
+    monkeypatch.setattr(llm_client, "_backend", FakeGenerativeModel)  # the key is in place now
+    llm_client.client_status()  # a readiness probe re-checks a failed client
+    _wait_for_state("ready")
+    assert llm_client.client_status() == {"state": "ready", "error": "", "seconds": llm_client._status["seconds"]}
+
+
+def test_ready_endpoint_reports_the_client_state(fresh_status, monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), metrics._MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/ready"
+    try:
+        llm_client._status.update(state="warming")
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(url)
+        assert error.value.code == 503
+        llm_client._status.update(state="ready")
+        with urllib.request.urlopen(url) as response:
+            assert json.load(response)["state"] == "ready"
+    finally:
+        server.shutdown()
@@ -0,0 +1,136 @@
+import pytest
+import resilience
+from resilience import CircuitBreaker, CircuitOpenError, TokenBucket, call_with_resilience, classify_error
+
+
+class ServiceUnavailable(Exception):
+    code = 503
+
+
+class ResourceExhausted(Exception):
+    pass
+
+
+class InvalidArgument(Exception):
+    code = 400
+
+
+@pytest.mark.parametrize("exc, kind", [
+    (ResourceExhausted(), "rate_limited"),
+    (type("HttpError", (Exception,), {"code": 429})(), "rate_limited"),
+    (ServiceUnavailable(), "transient"),
+    (TimeoutError(), "transient"),
+    (InvalidArgument(), "fatal"),
+    (ValueError("blocked"), "fatal"),
+])
+def test_classify_error(exc, kind):
+    assert classify_error(exc) == kind
+
+
+def test_breaker_opens_after_threshold_and_probes_after_cooldown(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: clock[0])
+    breaker = CircuitBreaker(threshold=2, cooldown=10)
+
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+    clock[0] += 10
+    breaker.allow()  # the probe
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()  # only one probe at a time
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock[0] += 10
+    breaker.allow()
+    breaker.record_success()
+    assert (breaker.state, breaker.failures) == ("closed", 0)
+
+
+def test_fatal_probe_releases_the_probe_slot(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: clock[0])
+    breaker = CircuitBreaker(threshold=1, cooldown=10)
+    breaker.record_failure()
+    clock[0] += 10
+    breaker.allow()
+    assert breaker.state == "half_open"
+
+    breaker.release_probe()  # e.g. a 400: says nothing about the upstream
+    assert (breaker.state, breaker.opened_at) == ("half_open", 100.0)
+    breaker.allow()  # the next call probes without another cooldown
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_token_bucket_makes_callers_wait_beyond_the_burst():
+    bucket = TokenBucket(rate_per_minute=60, burst=2)
+    assert bucket._reserve() == 0
+    assert bucket._reserve() == 0
+    assert bucket._reserve() == pytest.approx(1.0, abs=0.05)
+
+
+@pytest.fixture
+def fresh_resilience(monkeypatch):
+    monkeypatch.setattr(resilience, "breaker", CircuitBreaker(threshold=3, cooldown=60))
+    monkeypatch.setattr(resilience, "rate_limiter", TokenBucket(rate_per_minute=6000, burst=100))
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt, kind: 0)
+    monkeypatch.setattr(resilience, "MAX_RETRIES", 4)
+    return resilience
+
+
+def test_transient_errors_are_retried(fresh_resilience):
+    attempts = []
+
+    def call():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ServiceUnavailable()
+        return "ok"
+
+    assert call_with_resilience(call) == "ok"
+    assert len(attempts) == 3
+    assert fresh_resilience.breaker.state == "closed"
+
+
+def test_fatal_errors_are_not_retried(fresh_resilience):
+    attempts = []
+
+    def call():
+        attempts.append(1)
+        raise InvalidArgument()
+
+    with pytest.raises(InvalidArgument):
+        call_with_resilience(call)
+    assert len(attempts) == 1
+    assert fresh_resilience.breaker.failures == 0
+
+
+def test_retries_stop_when_the_breaker_opens(fresh_resilience):
+    attempts = []
+
+    def call():
+        attempts.append(1)
+        raise ServiceUnavailable()
+
+    with pytest.raises(ServiceUnavailable):
+        call_with_resilience(call)
+    assert len(attempts) == 3
+    assert fresh_resilience.breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        call_with_resilience(call)
+    assert len(attempts) == 3
+
+
+def test_backoff_delay_is_bounded():
+    for attempt in range(10):
+        assert 0 <= resilience.backoff_delay(attempt, "transient") <= resilience.BACKOFF_MAX
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+import time
+import pytest
+from singleflight import SingleFlight
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def _follow(target, results):
+    def run():
+        try:
+            results.append(("ok", target()))
+        except Exception as e:
+            results.append(("error", e))
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_concurrent_calls_are_coalesced():
+    flight, release, calls, results = SingleFlight(), threading.Event(), [], []
+
+    def fn():
+        calls.append(1)
+        release.wait(2)
+        return "answer"
+
+    leader = _follow(lambda: flight.do("k", fn), results)
+    _wait_for(lambda: "k" in flight._calls)
+    followers = [_follow(lambda: flight.do("k", fn), results) for _ in range(3)]
+    _wait_for(lambda: flight._calls["k"].followers == 3)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(2)
+
+    assert len(calls) == 1
+    assert results == [("ok", "answer")] * 4
+    assert flight._calls == {}
+
+
+def test_followers_get_the_leaders_error():
+    flight, release, results = SingleFlight(), threading.Event(), []
+
+    def fn():
+        release.wait(2)
+        raise RuntimeError("upstream down")
+
+    leader = _follow(lambda: flight.do("k", fn), results)
+    _wait_for(lambda: "k" in flight._calls)
+    follower = _follow(lambda: flight.do("k", fn), results)
+    _wait_for(lambda: flight._calls["k"].followers == 1)
+    release.set()
+    leader.join(2)
+    follower.join(2)
+
+    assert [kind for kind, _ in results] == ["error", "error"]
+    assert results[0][1] is results[1][1]
+    assert flight.do("k", lambda: "retry") == "retry"  # nothing is kept after the failure
+
+
+def test_stream_follower_replays_chunks_then_the_leaders_error():
+    flight, release, results = SingleFlight(), threading.Event(), []
+
+    def source():
+        yield "a"
+        yield "b"
+        release.wait(2)
+        raise RuntimeError("stream cut")
+
+    leader = flight.stream("k", source)
+    assert [next(leader), next(leader)] == ["a", "b"]
+    follower = _follow(lambda: list(flight.stream("k", source)), results)
+    _wait_for(lambda: flight._calls["k"].followers == 1)
+    release.set()
+    with pytest.raises(RuntimeError):
+        next(leader)
+    follower.join(2)
+
+    assert results[0][0] == "error" and str(results[0][1]) == "stream cut"
+
+
+def test_stream_follower_receives_every_chunk():
+    flight, release, results = SingleFlight(), threading.Event(), []
+
+    def source():
+        yield "a"
+        release.wait(2)
+        yield "b"
+
+    leader = flight.stream("k", source)
+    assert next(leader) == "a"
+    follower = _follow(lambda: "".join(flight.stream("k", source)), results)
+    _wait_for(lambda: flight._calls["k"].followers == 1)
+    release.set()
+    assert list(leader) == ["b"]
+    follower.join(2)
+    assert results == [("ok", "ab")]
+
+
+def test_do_async_coalesces_and_shares_errors():
+    flight, calls = SingleFlight(), []
+
+    async def call(fail):
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        if fail:
+            raise RuntimeError("boom")
+        return "answer"
+
+    async def main():
+        ok = await asyncio.gather(*(flight.do_async("ok", lambda: call(False)) for _ in range(3)))
+        failed = await asyncio.gather(*(flight.do_async("bad", lambda: call(True)) for _ in range(2)),
+                                      return_exceptions=True)
+        return ok, failed
+
+    ok, failed = asyncio.run(main())
+    assert ok == ["answer"] * 3
+    assert all(isinstance(e, RuntimeError) for e in failed)
+    assert len(calls) == 2
+    assert flight._tasks == {}
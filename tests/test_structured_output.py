@@ -0,0 +1,59 @@
+import json
+import pytest
+from orchestrator import SATISFIED, decision_schema, format_decision, parse_questions
+from qa_state import parse_marker
+
+
+def test_parse_questions_reads_the_json_field():
+    reply = json.dumps({"questions": ["Is it multi-user? ", "", "Any SSO?"]})
+    assert parse_questions(reply) == ["Is it multi-user?", "Any SSO?"]
+
+
+def test_parse_questions_falls_back_to_lines():
+    assert parse_questions("- Is it multi-user?\n\n• Any SSO?\n") == ["Is it multi-user?", "Any SSO?"]
+    assert parse_questions("") == []
+
+
+@pytest.mark.parametrize("reply, text", [
+    ({"done": False, "question": "Is it multi-user?", "marker": "N"}, "Is it multi-user? [N]"),
+    ({"done": False, "question": "Only admins?", "marker": "[c]"}, "Only admins? [C]"),
+    ({"done": False, "question": "Any SSO?", "marker": ""}, "Any SSO?"),
+    ({"done": True, "question": "ignored", "marker": "N"}, SATISFIED),
+    ({"done": False, "question": " ", "marker": "N"}, SATISFIED),
+])
+def test_format_decision(reply, text):
+    assert format_decision(json.dumps(reply)) == text
+
+
+def test_format_decision_keeps_free_text_replies():
+    assert format_decision(" Is it multi-user? [N] ") == "Is it multi-user? [N]"
+    assert parse_marker(format_decision(json.dumps({"done": False, "question": "Q", "marker": "C"}))) == "C"
+
+
+def test_decision_schema_limits_markers_to_the_budget():
+    marker = decision_schema(["C"])["properties"]["marker"]
+    assert marker["enum"] == ["C", ""]
+
+
+def test_questions_templates_leave_the_format_to_the_schema():
+    from prompt_templates import templates
+    for (kind, agent) in templates._templates:
+        if kind == "questions":
+            assert "own line" not in templates.get(kind, agent), agent
+
+
+def test_questionnaire_followups_ask_for_the_schema_format(monkeypatch):
+    import orchestrator
+    from fake_backend import FakeGenerativeModel
+    seen = []
+
+    def get_model(model_name=orchestrator.MODEL_NAME, system_instruction=None):
+        seen.append(system_instruction)
+        return FakeGenerativeModel(model_name, system_instruction=system_instruction)
+
+    monkeypatch.setattr(orchestrator, "get_model", get_model)
+    state = {"Designer_spec": orchestrator.opening_spec("Designer")}
+    orchestrator.evaluate_questionnaire("Designer", state, ["Is it multi-user?"], ["Yes"], use_cache=False)
+    assert "own line" not in seen[0]
+    assert seen[0].endswith(orchestrator.QUESTIONS_FORMAT if orchestrator.STRUCTURED_OUTPUT
+                            else orchestrator.FREE_TEXT_QUESTIONS_FORMAT)
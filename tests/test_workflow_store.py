@@ -0,0 +1,73 @@
+import uuid
+import pytest
+import workflow_store
+from workflow_store import (MemoryWorkflowStore, SQLiteWorkflowStore, WorkflowStore, append_history, hydrate,
+                            is_valid_workflow_id, persist)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path, monkeypatch):
+    backend = MemoryWorkflowStore() if request.param == "memory" else SQLiteWorkflowStore(str(tmp_path / "wf.sqlite"))
+    monkeypatch.setattr(workflow_store, "_store", backend)
+    return backend
+
+
+def test_store_is_abstract():
+    with pytest.raises(TypeError):
+        WorkflowStore()
+
+
+def test_append_and_hydrate_round_trip(store):
+    session = {}
+    workflow_id = hydrate(session)
+    assert is_valid_workflow_id(workflow_id)
+    persist(session, "Analyst_spec", "Build a todo app")
+    persist(session, "workflow_index", 1)
+    persist(session, "speculative_mode", True)  # per-browser UI state, not persisted
+    append_history(session, "Analyst", "ai", "Is it multi-user? [N]")
+    append_history(session, "Analyst", "user", "yes")
+
+    resumed = {}
+    assert hydrate(resumed, workflow_id) == workflow_id
+    assert resumed["Analyst_spec"] == "Build a todo app"
+    assert resumed["workflow_index"] == 1
+    assert resumed["Analyst_history"] == session["Analyst_history"]
+    assert "speculative_mode" not in resumed
+
+
+def test_rewritten_history_replaces_later_messages(store):
+    session = {}
+    workflow_id = hydrate(session)
+    for content in ("q1", "a1", "q2"):
+        append_history(session, "Analyst", "ai", content)
+    session["Analyst_history"] = session["Analyst_history"][:1]
+    append_history(session, "Analyst", "user", "a1 (edited)")
+    assert [m["content"] for m in store.load(workflow_id)["Analyst_history"]] == ["q1", "a1 (edited)"]
+
+
+def test_switching_workflows_drops_the_old_state(store):
+    session = {}
+    hydrate(session)
+    persist(session, "Analyst_output", "first output")
+    second = uuid.uuid4().hex
+    assert hydrate(session, second) == second
+    assert "Analyst_output" not in session
+
+
+@pytest.mark.parametrize("bad_id", ["../etc", "a/b", "..", "ABCDEF" * 6, "0" * 31, "g" * 32, 42])
+def test_invalid_ids_mint_a_new_workflow(store, bad_id):
+    session = {}
+    workflow_id = hydrate(session, bad_id)
+    assert workflow_id != bad_id
+    assert is_valid_workflow_id(workflow_id)
+    assert session["workflow_id"] == workflow_id
+
+
+def test_export_folders_stay_under_the_root(tmp_path):
+    pytest.importorskip("markdown")
+    from export_store import ExportStore
+    exports = ExportStore(root=str(tmp_path))
+    assert exports._dir("a" * 32).endswith("a" * 32)
+    for bad_id in ("", "..", "../x", "a/b"):
+        with pytest.raises(ValueError):
+            exports._dir(bad_id)
@@ -0,0 +1,192 @@
+import abc
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from log_sink import log_event
+
+# Local disk only (see SQLiteWorkflowStore): processes on one host may share it, replicas may not
+STORE_PATH = os.environ.get("WORKFLOW_STORE_PATH", os.path.join(".cache", "workflows.sqlite"))
+STORE_KIND = os.environ.get("WORKFLOW_STORE", "sqlite")  # "sqlite" or "memory"
+QUERY_PARAM = "wf"
+# IDs are minted as uuid4().hex; they also name the workflow's export folder, so nothing else is accepted
+WORKFLOW_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+# Session keys that make up a workflow; everything else in session_state is per-browser UI state
+PERSISTED_SUFFIXES = ("_spec", "_output", "_artifact", "_template", "_user_feedback", "_qa_done", "_qa_mode", "_qa_round",
+                      "_questions", "_responses")
+PERSISTED_KEYS = ("workflow_index",)
+DERIVED_SUFFIXES = ("_history", "_conversation", "_speculation", "_prewarm", "_qa_state", "_qa_started",
+                    "_qa_calls")
+
+
+def is_valid_workflow_id(workflow_id) -> bool:
+    return isinstance(workflow_id, str) and WORKFLOW_ID_PATTERN.fullmatch(workflow_id) is not None
+
+
+def is_persisted(key: str) -> bool:
+    return key in PERSISTED_KEYS or key.endswith(PERSISTED_SUFFIXES)
+
+
+class WorkflowStore(abc.ABC):
+    """
+    Durable workflow state keyed by workflow ID: scalar fields (specs, outputs,
+    workflow_index, ...) and append-only per-agent chat histories. Subclass it to back
+    workflows with a shared database so any replica can resume any workflow.
+    """
+
+    @abc.abstractmethod
+    def load(self, workflow_id: str) -> dict:
+        """All fields plus `{agent}_history` lists of a workflow ({} if unknown)."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def set_field(self, workflow_id: str, key: str, value):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def append_message(self, workflow_id: str, agent: str, seq: int, message: dict):
+        """Store history message number `seq` of `agent` (idempotent per seq)."""
+        raise NotImplementedError
+
+
+class MemoryWorkflowStore(WorkflowStore):
+    """Process-local store (single replica, nothing survives a restart)."""
+
+    def __init__(self):
+        self._workflows = {}
+        self._lock = threading.Lock()
+
+    def load(self, workflow_id: str) -> dict:
+        with self._lock:
+            state = self._workflows.get(workflow_id, {})
+            return {key: list(value) if key.endswith("_history") else value for key, value in state.items()}
+
+    def set_field(self, workflow_id: str, key: str, value):
+        with self._lock:
+            self._workflows.setdefault(workflow_id, {})[key] = value
+
+    def append_message(self, workflow_id: str, agent: str, seq: int, message: dict):
+        with self._lock:
+            history = self._workflows.setdefault(workflow_id, {}).setdefault(f"{agent}_history", [])
+            del history[seq:]
+            history.append(dict(message))
+
+
+class SQLiteWorkflowStore(WorkflowStore):
+    """
+    SQLite in WAL mode, so readers (other Streamlit workers) never block the writer. Single
+    host only: WAL needs shared memory between the processes, so the file must sit on a local
+    disk, never on NFS or another network volume shared by replicas. Multi-host deployments
+    plug in a networked `WorkflowStore` with `set_store`.
+    """
+
+    def __init__(self, path: str = STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._conn() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS workflow_fields (
+                workflow_id TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, updated REAL NOT NULL,
+                PRIMARY KEY (workflow_id, key))""")
+            conn.execute("""CREATE TABLE IF NOT EXISTS workflow_history (
+                workflow_id TEXT NOT NULL, agent TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL,
+                content TEXT NOT NULL, created REAL NOT NULL, PRIMARY KEY (workflow_id, agent, seq))""")
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; Streamlit runs each session's script in its own thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, workflow_id: str) -> dict:
+        conn = self._conn()
+        state = {key: json.loads(value) for key, value in conn.execute(
+            "SELECT key, value FROM workflow_fields WHERE workflow_id = ?", (workflow_id,))}
+        for agent, role, content in conn.execute(
+                "SELECT agent, role, content FROM workflow_history WHERE workflow_id = ? ORDER BY agent, seq",
+                (workflow_id,)):
+            state.setdefault(f"{agent}_history", []).append({"role": role, "content": content})
+        return state
+
+    def set_field(self, workflow_id: str, key: str, value):
+        with self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO workflow_fields VALUES (?, ?, ?, ?)",
+                         (workflow_id, key, json.dumps(value), time.time()))
+
+    def append_message(self, workflow_id: str, agent: str, seq: int, message: dict):
+        with self._conn() as conn:
+            # A rewritten history replaces everything from `seq` on
+            conn.execute("DELETE FROM workflow_history WHERE workflow_id = ? AND agent = ? AND seq >= ?",
+                         (workflow_id, agent, seq))
+            conn.execute("INSERT INTO workflow_history VALUES (?, ?, ?, ?, ?, ?)",
+                         (workflow_id, agent, seq, message["role"], message["content"], time.time()))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def set_store(store: WorkflowStore):
+    """Plug in another backend (e.g. a shared database) before the first request."""
+    global _store
+    with _store_lock:
+        _store = store
+
+
+def get_store() -> WorkflowStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = MemoryWorkflowStore() if STORE_KIND == "memory" else SQLiteWorkflowStore()
+        return _store
+
+
+def hydrate(session_state, workflow_id: str = None) -> str:
+    """
+    Bind the session to a workflow (a new one when `workflow_id` is empty) and, the first
+    time this session sees it, copy the stored state into session_state. Keys the session
+    already holds win, so repeated calls on later reruns do nothing. A malformed
+    `workflow_id` (e.g. a hand-edited ?wf= value) is ignored and a new workflow is minted.
+    """
+    if workflow_id and not is_valid_workflow_id(workflow_id):
+        log_event("workflow.invalid_id", length=len(str(workflow_id)))
+        workflow_id = None
+    bound = session_state.get("workflow_id")
+    if bound and (not workflow_id or workflow_id == bound):
+        return bound
+    if bound:
+        # The URL now points at another workflow: drop everything derived from the old one
+        for key in [key for key in session_state if is_persisted(key) or key.endswith(DERIVED_SUFFIXES)]:
+            del session_state[key]
+    workflow_id = workflow_id or uuid.uuid4().hex
+    for key, value in get_store().load(workflow_id).items():
+        if key not in session_state:
+            session_state[key] = value
+    session_state["workflow_id"] = workflow_id
+    return workflow_id
+
+
+def persist(session_state, key: str, value):
+    """Set a workflow field in session_state and write it through to the store."""
+    changed = session_state.get(key) != value
+    session_state[key] = value
+    if changed and session_state.get("workflow_id") and is_persisted(key):
+        get_store().set_field(session_state["workflow_id"], key, value)
+
+
+def append_history(session_state, agent: str, role: str, content: str):
+    """Append one chat message to `{agent}_history` and write it through to the store."""
+    history = session_state.setdefault(f"{agent}_history", [])
+    message = {"role": role, "content": content}
+    history.append(message)
+    if session_state.get("workflow_id"):
+        get_store().append_message(session_state["workflow_id"], agent, len(history) - 1, message)